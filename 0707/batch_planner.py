@@ -1,5 +1,6 @@
 import sys
-from datetime import datetime, timedelta
+import bisect
+from datetime import date, datetime, time, timedelta
 import os
 
 def get_batch_info(n_batches: int, now: datetime = None):
@@ -42,36 +43,186 @@ def get_prev_batch(date: datetime.date, batch_no: int, n_batches: int):
     return prev_date, prev_batch_no, batch_id
 
 
+def parse_batch_id(batch_id: str):
+    """
+    解析batch_id（如'20240708_03'），返回(date, batch_no)，按位置取数字，不经过strptime
+    """
+    date_str, batch_no_str = batch_id.split('_')
+    if len(date_str) != 8 or not date_str.isdigit():
+        raise ValueError(f"batch_id格式错误: {batch_id}")
+    return date(int(date_str[:4]), int(date_str[4:6]), int(date_str[6:])), int(batch_no_str)
+
+
 def get_next_batch_id(current_batch_id: str, n_batches: int) -> str:
     """
     输入当前batch_id（如'20240708_03'）和n_batches，返回下一个batch_id，支持跨日期。
     """
-    import datetime
-    date_str, batch_no_str = current_batch_id.split('_')
-    date = datetime.datetime.strptime(date_str, '%Y%m%d').date()
-    batch_no = int(batch_no_str)
-    next_date, next_batch_no, next_batch_id = get_next_batch(date, batch_no, n_batches)
+    batch_date, batch_no = parse_batch_id(current_batch_id)
+    next_date, next_batch_no, next_batch_id = get_next_batch(batch_date, batch_no, n_batches)
     return next_batch_id
 
 def get_prev_batch_id(current_batch_id: str, n_batches: int) -> str:
     """
     输入当前batch_id（如'20240708_03'）和n_batches，返回上一个batch_id，支持跨日期。
     """
-    import datetime
-    date_str, batch_no_str = current_batch_id.split('_')
-    date = datetime.datetime.strptime(date_str, '%Y%m%d').date()
-    batch_no = int(batch_no_str)
-    prev_date, prev_batch_no, prev_batch_id = get_prev_batch(date, batch_no, n_batches)
+    batch_date, batch_no = parse_batch_id(current_batch_id)
+    prev_date, prev_batch_no, prev_batch_id = get_prev_batch(batch_date, batch_no, n_batches)
     return prev_batch_id
 
+
+def _wall_start(wall: datetime, tz):
+    """
+    当地时间wall第一次出现的时刻(epoch秒)，tz为None时按本机时区
+    夏令时结束时重复的时间取第一次出现；夏令时开始时跳过的时间不存在，取跳变的时刻
+    """
+    ts = wall.replace(tzinfo=tz).timestamp()
+    if datetime.fromtimestamp(ts, tz).replace(tzinfo=None) == wall:
+        return ts
+    # 跳过的时间：fold=1按跳变后的偏移换算，早于跳变；fold=0按跳变前的偏移换算，晚于跳变
+    lo, hi = int(wall.replace(tzinfo=tz, fold=1).timestamp()), int(ts)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if datetime.fromtimestamp(mid, tz).replace(tzinfo=None) >= wall:
+            hi = mid
+        else:
+            lo = mid
+    return float(hi)
+
+
+class BatchCalendar:
+    """
+    预先算好start到end每个批次开始时刻的批次日历，大量时间映射到batch_id时不再重复解析和计算日期
+    批次用整数序号表示(日期的toordinal() * n_batches + batch_no - 1)，划分与get_batch_info相同；tz为None时用本机时区
+    """
+    def __init__(self, n_batches: int, start: date, end: date = None, tz=None):
+        if not 1 <= n_batches <= 24 * 60:
+            raise ValueError(f"每天的批次数须在1到1440之间: {n_batches}")
+        end = end or start
+        if end < start:
+            raise ValueError(f"结束日期早于起始日期: {start} - {end}")
+        self.n_batches = n_batches
+        self.batch_minutes = 24 * 60 // n_batches
+        self.start = start
+        self.end = end
+        self.tz = tz
+        self.first = self.ordinal(start, 1)
+        days = (end - start).days + 1
+        self.date_strs = [(start + timedelta(days=i)).strftime('%Y%m%d') for i in range(days)]
+        # ids[i]为序号 first + i 的batch_id
+        self.ids = [f"{date_str}_{k + 1:02d}" for date_str in self.date_strs for k in range(n_batches)]
+        # boundaries[i]为序号 first + i 的批次开始的时刻(epoch秒)，最后一项为end次日0点
+        self.boundaries = []
+        for i in range(days):
+            day_start = datetime.combine(start + timedelta(days=i), time())
+            for k in range(n_batches):
+                self.boundaries.append(_wall_start(day_start + timedelta(minutes=k * self.batch_minutes), tz))
+        self.boundaries.append(_wall_start(datetime.combine(end + timedelta(days=1), time()), tz))
+
+    def __len__(self):
+        return len(self.boundaries) - 1
+
+    def ordinal(self, batch_date: date, batch_no: int) -> int:
+        """日期和批次号(从1开始)对应的序号"""
+        return batch_date.toordinal() * self.n_batches + batch_no - 1
+
+    def split(self, ordinal: int):
+        """序号对应的(date, batch_no)"""
+        day, index = divmod(ordinal, self.n_batches)
+        return date.fromordinal(day), index + 1
+
+    def batch_id(self, ordinal: int) -> str:
+        """序号对应的batch_id，日历范围内的batch_id已预先生成"""
+        index = ordinal - self.first
+        if 0 <= index < len(self.ids):
+            return self.ids[index]
+        batch_date, batch_no = self.split(ordinal)
+        return f"{batch_date.strftime('%Y%m%d')}_{batch_no:02d}"
+
+    def parse(self, batch_id: str) -> int:
+        """batch_id对应的序号"""
+        batch_date, batch_no = parse_batch_id(batch_id)
+        if not 1 <= batch_no <= self.n_batches:
+            raise ValueError(f"批次号超出范围: {batch_id}")
+        return self.ordinal(batch_date, batch_no)
+
+    def lookup(self, when) -> int:
+        """
+        时间所在批次的序号
+
+        Args:
+            when: epoch秒数，或datetime(不带时区的视为日历时区的当地时间，带时区的先换算到日历时区)
+
+        datetime按当地时间直接计算，epoch秒数在预先算好的批次开始时刻中二分查找；
+        两者只在夏令时结束时重复的那一小时内可能不同(epoch秒数按实际先后划分)
+        """
+        if isinstance(when, datetime):
+            if when.tzinfo is not None:
+                when = when.astimezone(self.tz).replace(tzinfo=None)
+            day = when.toordinal() - self.start.toordinal()
+            if not 0 <= day < len(self.date_strs):
+                raise ValueError(f"时间不在日历范围内: {when}")
+            minutes = when.hour * 60 + when.minute
+            return self.first + day * self.n_batches + min(minutes // self.batch_minutes, self.n_batches - 1)
+        index = bisect.bisect_right(self.boundaries, when) - 1
+        if not 0 <= index < len(self):
+            raise ValueError(f"时间不在日历范围内: {when}")
+        return self.first + index
+
+    def _indexes(self, times):
+        """批量查找，返回日历内的下标；epoch秒数直接二分查找，不逐个经过lookup"""
+        boundaries = self.boundaries
+        low, high = boundaries[0], boundaries[-1]
+        indexes = []
+        for when in times:
+            if isinstance(when, datetime) or not low <= when < high:
+                # datetime，以及超出范围的时间交给lookup(抛出ValueError)
+                indexes.append(self.lookup(when) - self.first)
+            else:
+                indexes.append(bisect.bisect_right(boundaries, when) - 1)
+        return indexes
+
+    def lookup_many(self, times):
+        """批量查找，返回序号列表"""
+        first = self.first
+        return [first + index for index in self._indexes(times)]
+
+    def batch_ids(self, times):
+        """批量把时间转换成batch_id"""
+        ids = self.ids
+        return [ids[index] for index in self._indexes(times)]
+
+    def window(self, ordinal: int):
+        """批次的起止时刻(epoch秒)，[开始, 结束)"""
+        index = ordinal - self.first
+        if not 0 <= index < len(self):
+            raise ValueError(f"批次不在日历范围内: {self.batch_id(ordinal)}")
+        return self.boundaries[index], self.boundaries[index + 1]
+
+    def iter_range(self, first: int = None, last: int = None):
+        """
+        依次yield序号在[first, last]之间的 (序号, batch_id)，默认为整个日历
+        """
+        first = self.first if first is None else first
+        last = self.first + len(self) - 1 if last is None else last
+        for ordinal in range(first, last + 1):
+            yield ordinal, self.batch_id(ordinal)
+
+    def __iter__(self):
+        return (batch_id for _, batch_id in self.iter_range())
+
 if __name__ == "__main__":
     # 支持命令行参数传入batch数
     n_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 24
-    date, batch_no, batch_id = get_batch_info(n_batches)
-    print(f"当前: {date} 第{batch_no}个batch, batch_id: {batch_id}")
+    cur_date, batch_no, batch_id = get_batch_info(n_batches)
+    print(f"当前: {cur_date} 第{batch_no}个batch, batch_id: {batch_id}")
 
-    next_date, next_batch_no, next_batch_id = get_next_batch(date, batch_no, n_batches)
+    next_date, next_batch_no, next_batch_id = get_next_batch(cur_date, batch_no, n_batches)
     print(f"下一个: {next_date} 第{next_batch_no}个batch, batch_id: {next_batch_id}")
 
-    prev_date, prev_batch_no, prev_batch_id = get_prev_batch(date, batch_no, n_batches)
-    print(f"上一个: {prev_date} 第{prev_batch_no}个batch, batch_id: {prev_batch_id}")
\ No newline at end of file
+    prev_date, prev_batch_no, prev_batch_id = get_prev_batch(cur_date, batch_no, n_batches)
+    print(f"上一个: {prev_date} 第{prev_batch_no}个batch, batch_id: {prev_batch_id}")
+
+    # 预先计算前后一天的批次日历，整数序号加减即可得到相邻批次
+    calendar = BatchCalendar(n_batches, cur_date - timedelta(days=1), cur_date + timedelta(days=1))
+    current = calendar.lookup(datetime.now())
+    print(f"日历: {calendar.batch_id(current - 1)} -> {calendar.batch_id(current)} -> {calendar.batch_id(current + 1)}")
\ No newline at end of file
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import pytest
+from batch_planner import BatchCalendar, get_batch_info, get_next_batch_id, parse_batch_id
+
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+def test_ordinal_round_trip():
+    calendar = BatchCalendar(24, date(2024, 7, 8), date(2024, 7, 9))
+    assert calendar.batch_id(calendar.first) == '20240708_01'
+    for ordinal in range(calendar.first - 30, calendar.first + len(calendar) + 30):
+        batch_id = calendar.batch_id(ordinal)
+        assert calendar.parse(batch_id) == ordinal
+        assert calendar.split(ordinal) == parse_batch_id(batch_id)
+    with pytest.raises(ValueError):
+        calendar.parse('20240708_25')
+
+
+def test_iteration_and_rollover():
+    calendar = BatchCalendar(4, date(2024, 12, 31), date(2025, 1, 1))
+    assert len(calendar) == 8
+    ids = list(calendar)
+    assert ids == ['20241231_01', '20241231_02', '20241231_03', '20241231_04',
+                   '20250101_01', '20250101_02', '20250101_03', '20250101_04']
+    # 相邻序号与get_next_batch_id相同，跨年也连续
+    for previous, current in zip(ids, ids[1:]):
+        assert get_next_batch_id(previous, 4) == current
+    last_of_year = calendar.parse('20241231_04')
+    assert list(calendar.iter_range(last_of_year, last_of_year + 1)) == [
+        (last_of_year, '20241231_04'), (last_of_year + 1, '20250101_01')]
+    assert calendar.batch_id(calendar.first + len(calendar)) == '20250102_01'
+
+
+def test_leftover_minutes_in_last_window():
+    # 1440不能被7整除，每个批次205分钟，最后一个批次多出5分钟
+    calendar = BatchCalendar(7, date(2024, 7, 8), tz=timezone.utc)
+    start, end = calendar.window(calendar.parse('20240708_07'))
+    assert end - start == 210 * 60
+    start, end = calendar.window(calendar.parse('20240708_06'))
+    assert end - start == 205 * 60
+    # 与get_batch_info的划分相同
+    day = datetime(2024, 7, 8)
+    for minute in range(0, 24 * 60, 7):
+        when = day + timedelta(minutes=minute)
+        expected = get_batch_info(7, when)[2]
+        assert calendar.batch_id(calendar.lookup(when)) == expected
+        assert calendar.batch_ids([when.replace(tzinfo=timezone.utc).timestamp()]) == [expected]
+    assert calendar.batch_id(calendar.lookup(day + timedelta(hours=23, minutes=59))) == '20240708_07'
+    with pytest.raises(ValueError):
+        calendar.lookup(day + timedelta(days=1))
+
+
+def test_spring_forward_day():
+    # 2024-03-10 纽约 02:00 跳到 03:00，这一天只有23小时，02点的批次没有时间
+    calendar = BatchCalendar(24, date(2024, 3, 10), tz=NEW_YORK)
+    assert calendar.boundaries[-1] - calendar.boundaries[0] == 23 * 3600
+    first, end = calendar.window(calendar.parse('20240310_02'))
+    assert end - first == 3600
+    start, end = calendar.window(calendar.parse('20240310_03'))
+    assert start == end
+    after_jump = datetime(2024, 3, 10, 3, 30, tzinfo=NEW_YORK)
+    assert calendar.batch_ids([after_jump.timestamp()]) == ['20240310_04']
+    assert calendar.batch_id(calendar.lookup(after_jump)) == '20240310_04'
+
+
+def test_fall_back_day():
+    # 2024-11-03 纽约 01:00-02:00 重复一次，这一天有25小时，01点的批次持续两小时
+    calendar = BatchCalendar(24, date(2024, 11, 3), tz=NEW_YORK)
+    assert calendar.boundaries[-1] - calendar.boundaries[0] == 25 * 3600
+    start, end = calendar.window(calendar.parse('20241103_02'))
+    assert end - start == 2 * 3600
+    first = datetime(2024, 11, 3, 1, 30, tzinfo=NEW_YORK)
+    second = first.replace(fold=1)
+    assert calendar.lookup_many([first.timestamp(), second.timestamp()]) == [calendar.parse('20241103_02')] * 2
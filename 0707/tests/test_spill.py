@@ -0,0 +1,26 @@
+import json
+from zip_files import plan_spill, forecast_inflow
+
+GROUPS = [(f'g{n}.json', f'g{n}.wav') for n in range(5)]
+SIZES = {group: size for group, size in zip(GROUPS, [40, 30, 30, 50, 10])}
+
+
+def test_groups_fill_earliest_batch_with_room():
+    allocations = plan_spill(GROUPS, [('b_02', 0), ('b_03', 20), ('b_04', 0)], capacity=100, inflow=20,
+                             size_of=SIZES.get)
+    assert [a['batch_id'] for a in allocations] == ['b_02', 'b_03', 'b_04']
+    assert [a['spare'] for a in allocations] == [80, 60, 80]
+    assert [a['groups'] for a in allocations] == [[GROUPS[0], GROUPS[1], GROUPS[4]], [GROUPS[2]], [GROUPS[3]]]
+    assert [a['size'] for a in allocations] == [80, 30, 50]
+
+
+def test_overflow_goes_to_batch_with_most_room():
+    allocations = plan_spill(GROUPS[:2], [('b_02', 90), ('b_03', 70)], capacity=100, inflow=0, size_of=SIZES.get)
+    assert [a['groups'] for a in allocations] == [[GROUPS[1]], [GROUPS[0]]]
+
+
+def test_forecast_inflow_smooths_previous_manifest(tmp_path):
+    manifest = tmp_path / 'spill.json'
+    assert forecast_inflow(100, str(manifest)) == 100
+    manifest.write_text(json.dumps({'forecast_inflow': 300}), encoding='utf-8')
+    assert forecast_inflow(100, str(manifest)) == 200
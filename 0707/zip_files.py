@@ -1,82 +1,198 @@
 import os
+import sys
 import json
+import time
+import errno
 import shutil
 import zipfile
 from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
-from batch_planner import get_batch_info, get_next_batch
+from batch_planner import get_batch_info, get_prev_batch, BatchCalendar
 import datetime
 
+# 仓库根目录下的共享模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression_policy import CompressionPolicy, CompressionStats
+from zip_planner import plan_volumes, group_size
+from file_index import FileIndex
+from zip_volume import member_index, write_index, build_batch_index
+
 MAX_ZIP_SIZE = 2 * 1024 * 1024 * 1024  # 2G
 MAX_ZIP_COUNT = 10
+# 自适应压缩：采样后deflate节省不足5%的文件(如PCM WAV)直接存储
+COMPRESSION_POLICY = CompressionPolicy(adaptive=True)
 SOURCE_FOLDER = 'source_folder'
 NEXT_BATCH_FOLDER = 'next_batch_source_folder'
+# 溢出的文件组最多分摊到之后的SPILL_HORIZON个批次
+SPILL_HORIZON = 4
+# 预测每个批次新到的文件量时本次观测值的权重，其余沿用上个批次的预测
+INFLOW_SMOOTHING = 0.5
+# 分摊计划，写在每个批次的输出文件夹中
+SPILL_MANIFEST = 'spill_manifest.json'
+
+def batch_source_folder(batch_id):
+    """批次的遗留文件夹，该批次运行时优先打包其中的文件"""
+    return f"source_{batch_id}"
 
-def group_files(source_folder):
+def group_files(source_folder, index=None):
     """
     遍历source_folder，配对同名json和wav文件，返回[(json_path, wav_path), ...]
+    index: file_index.FileIndex，传入时扫描结果(含文件大小)留在索引中供split_batches使用
     """
-    files = os.listdir(source_folder)
-    json_files = {os.path.splitext(f)[0]: os.path.join(source_folder, f) for f in files if f.endswith('.json')}
-    wav_files = {os.path.splitext(f)[0]: os.path.join(source_folder, f) for f in files if f.endswith('.wav')}
+    files = (index or FileIndex()).scan(source_folder, suffixes=('.json', '.wav'))
+    json_files = {os.path.splitext(f.name)[0]: f.path for f in files if f.name.endswith('.json')}
+    wav_files = {os.path.splitext(f.name)[0]: f.path for f in files if f.name.endswith('.wav')}
     groups = []
     for name in json_files:
         if name in wav_files:
             groups.append((json_files[name], wav_files[name]))
     return groups
 
-def split_batches(file_groups, max_zip_size, max_zip_count):
+def split_batches(file_groups, max_zip_size, max_zip_count, strategy='ffd', index=None):
     """
     按zip最大体积分组，返回batches, extra_files
     batches: [[(json, wav), ...], ...]
     extra_files: [(json, wav), ...]
+    strategy: 装箱策略，见zip_planner.STRATEGIES
+    index: file_index.FileIndex，传入时文件大小从索引中读取，不再逐个getsize
     """
-    batches = []
-    current_batch = []
-    current_size = 0
-    for group in file_groups:
-        size = os.path.getsize(group[0]) + os.path.getsize(group[1])
-        if current_size + size > max_zip_size and current_batch:
-            batches.append(current_batch)
-            current_batch = []
-            current_size = 0
-        current_batch.append(group)
-        current_size += size
-    if current_batch:
-        batches.append(current_batch)
-    # 超出最大zip数的文件组
-    if len(batches) > max_zip_count:
-        extra_batches = batches[max_zip_count:]
-        batches = batches[:max_zip_count]
-        extra_files = [item for batch in extra_batches for item in batch]
-    else:
-        extra_files = []
-    return batches, extra_files
+    size_of = index.group_size if index else group_size
+    plan = plan_volumes(file_groups, max_zip_size, max_zip_count, strategy, size_of)
+    print(f"打包规划: {plan.summary()}")
+    return plan.volumes, plan.overflow
 
-def zip_files(batch_id, zip_num, file_group, output_folder):
+def zip_files(batch_id, zip_num, file_group, output_folder, policy=None):
     """
     打包成zip，返回zip文件路径
+    policy: CompressionPolicy，默认全部deflate
     """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    policy = policy or CompressionPolicy()
+    stats = CompressionStats()
     zip_name = f"{batch_id}_{zip_num:02d}.zip"
     zip_path = os.path.join(output_folder, zip_name)
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for json_path, wav_path in file_group:
-            zipf.write(json_path, arcname=os.path.basename(json_path))
-            zipf.write(wav_path, arcname=os.path.basename(wav_path))
+            policy.write(zipf, json_path, os.path.basename(json_path), stats)
+            policy.write(zipf, wav_path, os.path.basename(wav_path), stats)
+    # 旁路索引 {zip_name}.idx.json，记录每个成员的偏移
+    write_index(zip_path, member_index(zipf), os.path.getsize(zip_path))
+    print(f"{zip_name}: {stats.summary()}")
     return zip_path
 
-def producer_task(batch_id, zip_num, file_group, output_folder, queue):
-    zip_path = zip_files(batch_id, zip_num, file_group, output_folder)
+def producer_task(batch_id, zip_num, file_group, output_folder, queue, policy=None):
+    zip_path = zip_files(batch_id, zip_num, file_group, output_folder, policy)
     queue.put(zip_path)
 
+def _rename(src, dst):
+    """同一文件系统上只改目录项，不复制数据；跨文件系统时退回shutil.move"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+def move_groups(file_groups, dest_folder):
+    """
+    把文件组移到dest_folder，每个文件一次rename
+    dest_folder还不存在时先移到同级的临时文件夹，全部移完后整个文件夹一次改名，
+    之后的批次要么看到全部文件组，要么一个也看不到
+    """
+    if os.path.exists(dest_folder):
+        target = dest_folder
+    else:
+        target = dest_folder.rstrip('/\\') + '.incoming'
+        os.makedirs(target, exist_ok=True)
+    # 先移wav再移json：中途失败时留下的单个json不会被group_files配对，不会被打包成半组
+    for json_path, wav_path in file_groups:
+        _rename(wav_path, os.path.join(target, os.path.basename(wav_path)))
+        _rename(json_path, os.path.join(target, os.path.basename(json_path)))
+    if target != dest_folder:
+        os.rename(target, dest_folder)
+
 def move_extra_files(extra_files, next_batch_folder):
-    if not os.path.exists(next_batch_folder):
-        os.makedirs(next_batch_folder)
-    for json_path, wav_path in extra_files:
-        shutil.move(json_path, os.path.join(next_batch_folder, os.path.basename(json_path)))
-        shutil.move(wav_path, os.path.join(next_batch_folder, os.path.basename(wav_path)))
+    move_groups(extra_files, next_batch_folder)
+
+def forecast_inflow(observed, previous_manifest):
+    """
+    预测每个批次新到的文件量(字节)：本次观测值与上个批次分摊计划中的预测值指数平滑
+    """
+    try:
+        with open(previous_manifest, encoding='utf-8') as f:
+            previous = json.load(f)['forecast_inflow']
+    except (FileNotFoundError, KeyError, ValueError):
+        return observed
+    return int(INFLOW_SMOOTHING * observed + (1 - INFLOW_SMOOTHING) * previous)
+
+def plan_spill(extra_files, targets, capacity, inflow, size_of=group_size):
+    """
+    把溢出的文件组按顺序放进最早一个余量还够的批次，都放不下时放进余量最多的批次
+    余量 = capacity - 预测新到的文件量 - 已排队的文件量
+
+    Args:
+        extra_files: 溢出的文件组[(json, wav), ...]，排在前面的先分配
+        targets: [(batch_id, 已排队的大小), ...]，按时间顺序
+        capacity: 每个批次能打包的原始大小，即 MAX_ZIP_COUNT * MAX_ZIP_SIZE
+        inflow: 预测每个批次新到的文件量
+        size_of: 计算文件组大小的函数
+
+    Returns:
+        [{'batch_id', 'queued', 'spare', 'size', 'groups'}, ...]，与targets顺序相同
+    """
+    allocations = [{'batch_id': batch_id, 'queued': queued, 'spare': capacity - inflow - queued, 'size': 0, 'groups': []}
+                   for batch_id, queued in targets]
+    for group in extra_files:
+        size = size_of(group)
+        target = next((a for a in allocations if a['spare'] - a['size'] >= size), None)
+        if target is None:
+            target = max(allocations, key=lambda a: a['spare'] - a['size'])
+        target['groups'].append(group)
+        target['size'] += size
+    return allocations
+
+def _write_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+def spill_overflow(extra_files, batch_date, batch_no, n_batches, manifest_path, inflow, index=None,
+                   horizon=SPILL_HORIZON, capacity=None):
+    """把溢出的文件组分摊到之后horizon个批次的遗留文件夹，先把分摊计划写入manifest_path再移动文件，返回分摊结果"""
+    if not extra_files:
+        return []
+    size_of = index.group_size if index else group_size
+    capacity = capacity or MAX_ZIP_COUNT * MAX_ZIP_SIZE
+    calendar = BatchCalendar(n_batches, batch_date)
+    current = calendar.ordinal(batch_date, batch_no)
+    targets = []
+    for ordinal in range(current + 1, current + horizon + 1):
+        batch_id = calendar.batch_id(ordinal)
+        folder = batch_source_folder(batch_id)
+        queued = sum(size_of(g) for g in group_files(folder, index)) if os.path.isdir(folder) else 0
+        targets.append((batch_id, queued))
+    allocations = plan_spill(extra_files, targets, capacity, inflow, size_of)
+
+    manifest = {
+        'batch_id': calendar.batch_id(current),
+        'created_at': time.time(),
+        'capacity': capacity,
+        'forecast_inflow': inflow,
+        'status': 'planned',
+        'allocations': allocations,
+    }
+    _write_manifest(manifest_path, manifest)
+    for allocation in allocations:
+        if allocation['groups']:
+            move_groups(allocation['groups'], batch_source_folder(allocation['batch_id']))
+    manifest['status'] = 'moved'
+    _write_manifest(manifest_path, manifest)
+    detail = ', '.join(f"{a['batch_id']}: {len(a['groups'])} 组" for a in allocations if a['groups'])
+    print(f"溢出 {len(extra_files)} 组分摊到之后的批次: {detail}")
+    return allocations
 
 def get_batch_id():
     from datetime import datetime
@@ -87,26 +203,32 @@ def main():
     n_batches = 24  # 可根据需要调整
     now = datetime.datetime.now()
     date, batch_no, batch_id = get_batch_info(n_batches, now)
-    next_date, next_batch_no, next_batch_id = get_next_batch(date, batch_no, n_batches)
+    prev_date, prev_batch_no, prev_batch_id = get_prev_batch(date, batch_no, n_batches)
     output_folder = f"output_{batch_id}"
-    NEXT_BATCH_FOLDER = f"source_{next_batch_id}"
-    CUR_BATCH_FOLDER = f"source_{batch_id}"
+    CUR_BATCH_FOLDER = batch_source_folder(batch_id)
 
-    # 1. 优先处理上次遗留
+    # 1. 优先处理上次遗留，两个文件夹各扫描一次，文件大小留在索引中
+    index = FileIndex()
     file_groups = []
     if os.path.exists(CUR_BATCH_FOLDER):
-        file_groups += group_files(CUR_BATCH_FOLDER)
-    file_groups += group_files(SOURCE_FOLDER)
+        file_groups += group_files(CUR_BATCH_FOLDER, index)
+    new_groups = group_files(SOURCE_FOLDER, index)
+    file_groups += new_groups
 
     # 2. 分批打包
-    batches, extra_files = split_batches(file_groups, MAX_ZIP_SIZE, MAX_ZIP_COUNT)
+    batches, extra_files = split_batches(file_groups, MAX_ZIP_SIZE, MAX_ZIP_COUNT, index=index)
     # 3. 线程池生产者
     queue = Queue()
     with ThreadPoolExecutor(max_workers=2) as executor:
         for i, file_group in enumerate(batches):
-            executor.submit(producer_task, batch_id, i+1, file_group, output_folder, queue)
-    # 4. 多余文件处理
-    move_extra_files(extra_files, NEXT_BATCH_FOLDER)
+            executor.submit(producer_task, batch_id, i+1, file_group, output_folder, queue, COMPRESSION_POLICY)
+    # 合并各压缩包的旁路索引为批次索引，按transaction id取单个文件时使用
+    if batches:
+        build_batch_index(output_folder, batch_id)
+    # 4. 多余文件按预测的余量分摊到之后的几个批次
+    inflow = forecast_inflow(sum(index.group_size(g) for g in new_groups),
+                             os.path.join(f"output_{prev_batch_id}", SPILL_MANIFEST))
+    spill_overflow(extra_files, date, batch_no, n_batches, os.path.join(output_folder, SPILL_MANIFEST), inflow, index)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
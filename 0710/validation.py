@@ -1,7 +1,17 @@
 import os
+import sys
 import pandas as pd
 
-def find_transaction_files(report_folder, source_folder):
+# 仓库根目录下的共享模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_index import FileIndex
+
+def find_transaction_files(report_folder, source_folder, index=None):
+    """
+    Args:
+        index: file_index.FileIndex，可传入与打包环节共用的索引，源文件夹只扫描一次；
+               workers大于0的索引会用多个线程并行遍历子目录
+    """
     # 1. 读取report文件夹下的Excel文件
     excel_files = [f for f in os.listdir(report_folder) if f.endswith('.xlsx') or f.endswith('.xls')]
     if not excel_files:
@@ -16,14 +26,13 @@ def find_transaction_files(report_folder, source_folder):
     found_ids = set()
     id_to_files = {tid: {'wav': False, 'json': False} for tid in success_ids}
 
-    for root, dirs, files in os.walk(source_folder):
-        for file in files:
-            name, ext = os.path.splitext(file)
-            if name in id_to_files:
-                if ext.lower() == '.wav':
-                    id_to_files[name]['wav'] = True
-                elif ext.lower() == '.json':
-                    id_to_files[name]['json'] = True
+    for entry in (index or FileIndex()).scan(source_folder, recursive=True):
+        name, ext = os.path.splitext(entry.name)
+        if name in id_to_files:
+            if ext.lower() == '.wav':
+                id_to_files[name]['wav'] = True
+            elif ext.lower() == '.json':
+                id_to_files[name]['json'] = True
 
     # 4. 统计match的记录数
     match_count = 0
@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from consumer import FileProcessor, Consumer, STOP_SENTINEL, UPLOAD_BYTES, UPLOADS, UPLOAD_RETRIES, PUT_SECONDS
+from sftp_pool import CONNECT_SECONDS
+from remote_router import TargetUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+def not_found_errors():
+    """远程文件不存在时的异常：asyncssh抛出SFTPNoSuchFile，本地替身抛出FileNotFoundError"""
+    try:
+        import asyncssh
+    except ImportError:
+        return (FileNotFoundError,)
+    return (FileNotFoundError, asyncssh.SFTPNoSuchFile)
+
+
+async def asyncssh_connect(sftp_config):
+    """默认的连接函数：建立asyncssh连接，返回SSHClientConnection；asyncssh只在使用默认连接时导入"""
+    import asyncssh
+    return await asyncssh.connect(
+        sftp_config['hostname'],
+        port=sftp_config.get('port', 22),
+        username=sftp_config.get('username'),
+        password=sftp_config.get('password'),
+        known_hosts=None)
+
+
+class AsyncFileProcessor(FileProcessor):
+    """
+    基于asyncio的文件处理器
+
+    在少量SSH连接上复用多个SFTP通道，每个通道同一时间处理一个上传，
+    单个上传内部由asyncssh按block_size分块、最多max_requests个写请求并发在途(流水线写入)。
+    通道在第一次使用时建立，出错的通道丢弃后重新打开，连接失效时重新连接。
+
+    Args:
+        connections: SSH连接数
+        channels_per_connection: 每个连接上的SFTP通道数
+        block_size: 每个写请求的大小(字节)
+        max_requests: 单个上传同时在途的写请求数
+        connect: 建立连接的协程函数，输入sftp_config，返回带start_sftp_client()的连接对象
+    """
+    def __init__(self, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None, journal=None, post_upload_hook=None,
+                 connections=2, channels_per_connection=8, block_size=256 * 1024, max_requests=64, connect=None, router=None, retry_policy=None):
+        super().__init__(remote_paths, max_retries, sftp_config, journal=journal, post_upload_hook=post_upload_hook,
+                         block_size=block_size, max_requests=max_requests, router=router, retry_policy=retry_policy)
+        self.connections = connections
+        self.channels_per_connection = channels_per_connection
+        self.connect = connect or asyncssh_connect
+        self.not_found_errors = not_found_errors()
+        self.conns = [None] * connections
+        self.conn_locks = None
+        self.channels = None
+
+    def start(self):
+        """在事件循环内调用，创建通道队列"""
+        self.conns = [None] * self.connections
+        self.conn_locks = [asyncio.Lock() for _ in range(self.connections)]
+        self.channels = asyncio.Queue()
+        # 通道轮流分布在各个连接上
+        for n in range(self.connections * self.channels_per_connection):
+            self.channels.put_nowait((n % self.connections, None))
+
+    async def _open_channel(self, index):
+        async with self.conn_locks[index]:
+            if self.conns[index] is None:
+                start = time.perf_counter()
+                self.conns[index] = await self.connect(self.sftp_config)
+                CONNECT_SECONDS.observe(time.perf_counter() - start)
+                logger.info(f"建立SSH连接 #{index}")
+            conn = self.conns[index]
+        try:
+            return await conn.start_sftp_client()
+        except Exception:
+            # 连接已失效，下次重新连接
+            async with self.conn_locks[index]:
+                if self.conns[index] is conn:
+                    self.conns[index] = None
+            conn.close()
+            raise
+
+    @asynccontextmanager
+    async def channel(self):
+        """借用一个SFTP通道，出错时丢弃该通道"""
+        index, sftp = await self.channels.get()
+        try:
+            if sftp is None:
+                sftp = await self._open_channel(index)
+            yield sftp
+        except BaseException:
+            if sftp is not None:
+                sftp.exit()
+                sftp = None
+            raise
+        finally:
+            self.channels.put_nowait((index, sftp))
+
+    async def ensure_remote_dir_async(self, sftp, remote_path):
+        """检查远程目录是否存在，不存在则创建"""
+        try:
+            await sftp.stat(remote_path)
+        except self.not_found_errors:
+            try:
+                await sftp.mkdir(remote_path)
+            except Exception:
+                # 并发上传可能同时创建同一目录，已被其他通道创建时不算失败
+                await sftp.stat(remote_path)
+
+    async def process_compressed_file_async(self, file_path, batch_no=2):
+        """process_compressed_file的异步版本，重试和跳过逻辑相同"""
+        if self.already_done(file_path):
+            return True
+
+        filename = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        remote_path = self.route(file_path, batch_no, file_size)
+        max_attempts = self.retry_policy.max_attempts
+        self.retry_policy.record_request()
+
+        for attempt in range(max_attempts):
+            remote_file_path = f"{remote_path}/{filename}"
+            try:
+                logger.info(f"开始处理压缩文件 (尝试 {attempt + 1}/{max_attempts}): {file_path}, batch_no: {batch_no}")
+
+                async with self.channel() as sftp:
+                    try:
+                        attrs = await sftp.stat(remote_file_path)
+                        if self.remote_matches(file_path, attrs.size):
+                            logger.info(f"文件已存在于远程路径且大小和校验值一致，跳过处理: {remote_file_path}")
+                            with self.lock:
+                                self.processed_count += 1
+                            return True
+                        logger.warning(f"远程文件与本地压缩包不一致，重新上传: {remote_file_path}")
+                    except self.not_found_errors:
+                        pass
+
+                    if not os.path.exists(file_path):
+                        raise Exception(f"文件不存在: {file_path}")
+
+                    await self.ensure_remote_dir_async(sftp, remote_path)
+                    start = time.perf_counter()
+                    self.router.begin(remote_path, file_size)
+                    try:
+                        await sftp.put(file_path, remote_file_path,
+                                       block_size=self.block_size, max_requests=self.max_requests)
+                        # 与同步版本相同，写完后用远程文件大小校验，不一致时不记为已上传
+                        attrs = await sftp.stat(remote_file_path)
+                        if attrs.size != file_size:
+                            raise Exception(f"远程文件大小不一致: {attrs.size} != {file_size}")
+                    except BaseException:
+                        self.router.finish(remote_path, file_size, time.perf_counter() - start, ok=False)
+                        UPLOADS.inc(target=remote_path, result='error')
+                        raise
+                    elapsed = time.perf_counter() - start
+                    self.router.finish(remote_path, file_size, elapsed)
+                    PUT_SECONDS.observe(elapsed, target=remote_path)
+                    UPLOAD_BYTES.inc(file_size, target=remote_path)
+                    UPLOADS.inc(target=remote_path, result='ok')
+                    if self.journal:
+                        self.journal.mark_uploaded(filename, remote_file_path, file_size, self.archive_checksum(file_path))
+                    logger.info(f"文件SFTP上传成功: {file_path} -> {remote_file_path}")
+
+            except TargetUnavailable as e:
+                # 没有发出请求，不算上传失败，立即改路由；没有其他可用目标时按重试间隔等待
+                new_path = self.reroute(file_path, batch_no, remote_path, file_size)
+                if attempt + 1 >= max_attempts:
+                    logger.error(f"{e}，文件处理失败: {file_path}")
+                    return False
+                if new_path == remote_path:
+                    await asyncio.sleep(self.retry_policy.delay(attempt + 1))
+                remote_path = new_path
+            except Exception as e:
+                logger.error(f"处理文件 {file_path} 时发生错误 (尝试 {attempt + 1}/{max_attempts}): {e}")
+                if self.retry_policy.should_retry(attempt + 1):
+                    UPLOAD_RETRIES.inc(target=remote_path)
+                    remote_path = self.reroute(file_path, batch_no, remote_path, file_size)
+                    delay = self.retry_policy.delay(attempt + 1)
+                    logger.info(f"等待 {delay:.1f} 秒后重试...")
+                    await asyncio.sleep(delay)
+                else:
+                    logger.error(f"文件处理失败，不再重试: {file_path}")
+                    return False
+            else:
+                break
+
+        # 上传后处理可能是阻塞操作，放到线程中执行
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.after_upload, file_path, remote_file_path)
+
+    async def close_async(self):
+        """关闭所有通道和连接"""
+        if self.channels is not None:
+            while not self.channels.empty():
+                _, sftp = self.channels.get_nowait()
+                if sftp is not None:
+                    sftp.exit()
+        for n, conn in enumerate(self.conns):
+            if conn is not None:
+                conn.close()
+                await conn.wait_closed()
+                self.conns[n] = None
+
+
+class AsyncConsumer(Consumer):
+    """
+    基于asyncio的消费者，接口与Consumer相同(start_consuming/stop/get_processed_count)
+
+    消费线程内运行一个事件循环，并发上传数为 connections * channels_per_connection，
+    不再受线程数限制；阻塞的队列读取放在单独的线程中，不阻塞事件循环。
+    """
+    def __init__(self, processor=None, connections=2, channels_per_connection=8, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None, journal=None, post_upload_hook=None,
+                 block_size=256 * 1024, max_requests=64, connect=None, router=None):
+        processor = processor or AsyncFileProcessor(remote_paths, max_retries, sftp_config, journal, post_upload_hook,
+                                                    connections, channels_per_connection, block_size, max_requests, connect, router)
+        super().__init__(processor, max_workers=processor.connections * processor.channels_per_connection)
+
+    def _consume_loop(self, compressed_files_queue):
+        """消费循环"""
+        asyncio.run(self._consume_async(compressed_files_queue))
+        logger.info("消费者线程结束")
+
+    async def _consume_async(self, compressed_files_queue):
+        loop = asyncio.get_running_loop()
+        self.processor.start()
+        tasks = set()
+
+        def on_done(task, file_path):
+            tasks.discard(task)
+            self._on_done(task, file_path, compressed_files_queue)
+
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            while True:
+                file_path = await loop.run_in_executor(reader, self._next_item, compressed_files_queue)
+                if file_path is STOP_SENTINEL:
+                    break
+
+                task = asyncio.create_task(self.processor.process_compressed_file_async(file_path, self.batch_no))
+                self.batch_no += 1
+                tasks.add(task)
+                task.add_done_callback(lambda t, file_path=file_path: on_done(t, file_path))
+
+        logger.info("等待剩余任务完成")
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self.processor.close_async()
+
+
+# 示例使用
+if __name__ == "__main__":
+    import threading
+    from queue import Queue
+
+    test_queue = Queue()
+    # 测试重试：使用不存在的文件路径
+    test_queue.put(r"C:\temp\nonexistent.zip")
+
+    producer_completed = threading.Event()
+
+    consumer = AsyncConsumer()
+    consumer.start_consuming(test_queue, producer_completed)
+
+    producer_completed.set()
+    test_queue.join()
+
+    consumer.stop()
+    print(f"处理了 {consumer.get_processed_count()} 个文件")
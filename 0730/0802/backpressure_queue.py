@@ -0,0 +1,83 @@
+import time
+import threading
+from queue import Queue
+
+# 放入队列表示没有更多文件，消费循环收到后立即结束
+STOP_SENTINEL = object()
+
+
+class BackpressureQueue(Queue):
+    """
+    同时按文件个数和字节数限制的队列
+
+    字节数统计的是已生成(或正在生成)但还没有上传完成的压缩包：
+    生产者在生成压缩包前用reserve()预留字节数，超出max_bytes时阻塞；
+    put()时把预留的字节数记到该文件上；消费者处理完后调用item_done()释放。
+    已无预留时总是允许预留，单个超过max_bytes的压缩包不会永久阻塞。
+
+    Args:
+        maxsize: 队列中最多的文件个数，0表示不限
+        max_bytes: 未上传完成的压缩包总字节数上限，None表示不限
+    """
+    def __init__(self, maxsize=0, max_bytes=None):
+        super().__init__(maxsize)
+        self.max_bytes = max_bytes
+        self.pending_bytes = 0
+        self.item_bytes = {}
+        self.blocked_count = 0
+        self.enqueued_at = {}
+        self.bytes_cond = threading.Condition()
+
+    def reserve(self, nbytes, timeout=None):
+        """预留字节数，超出上限时阻塞等待，超时返回False"""
+        with self.bytes_cond:
+            def available():
+                return (not self.max_bytes or self.pending_bytes == 0
+                        or self.pending_bytes + nbytes <= self.max_bytes)
+            if not available():
+                self.blocked_count += 1
+            if not self.bytes_cond.wait_for(available, timeout):
+                return False
+            self.pending_bytes += nbytes
+            return True
+
+    def release(self, nbytes):
+        """释放预留的字节数"""
+        if not nbytes:
+            return
+        with self.bytes_cond:
+            self.pending_bytes -= nbytes
+            self.bytes_cond.notify_all()
+
+    def put(self, item, block=True, timeout=None, nbytes=0):
+        """放入文件，nbytes为该文件已预留的字节数，在item_done()时释放"""
+        with self.bytes_cond:
+            if nbytes:
+                self.item_bytes[item] = self.item_bytes.get(item, 0) + nbytes
+            # 结束标记不会经过wait_time()取走记录，不计时
+            if item is not STOP_SENTINEL:
+                self.enqueued_at[item] = time.monotonic()
+        super().put(item, block, timeout)
+
+    def wait_time(self, item):
+        """文件从放入队列到被取出等待的秒数，取出后调用一次"""
+        with self.bytes_cond:
+            enqueued_at = self.enqueued_at.pop(item, None)
+        return None if enqueued_at is None else time.monotonic() - enqueued_at
+
+    def item_done(self, item):
+        """消费者处理完一个文件，释放它占用的字节数"""
+        with self.bytes_cond:
+            nbytes = self.item_bytes.pop(item, 0)
+        self.release(nbytes)
+
+    def gauges(self):
+        """队列深度和字节数"""
+        with self.bytes_cond:
+            return {
+                'depth': self.qsize(),
+                'unfinished': self.unfinished_tasks,
+                'pending_bytes': self.pending_bytes,
+                'max_bytes': self.max_bytes,
+                'blocked_count': self.blocked_count,
+            }
@@ -0,0 +1,95 @@
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from queue import Queue
+from local_sftp import LocalSFTPServer
+from sftp_pool import SFTPConnectionPool
+from consumer import Consumer
+from async_consumer import AsyncConsumer
+
+logger = logging.getLogger(__name__)
+
+# 替身根目录下的远程路径，不需要预先创建上级目录
+REMOTE_PATHS = ["/remote1", "/remote2", "/remote3", "/remote4"]
+
+
+def make_files(folder, count, size):
+    """生成count个size字节的测试压缩包，文件名符合batchid_n.zip"""
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for n in range(count):
+        path = os.path.join(folder, f"bench_{n + 1}.zip")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        files.append(path)
+    return files
+
+
+def run_consumer(consumer, files):
+    """把files全部放入队列后消费，返回耗时(秒)"""
+    queue = Queue()
+    done = threading.Event()
+    start = time.perf_counter()
+    consumer.start_consuming(queue, done)
+    for path in files:
+        queue.put(path)
+    done.set()
+    queue.join()
+    elapsed = time.perf_counter() - start
+    consumer.stop()
+    return elapsed
+
+
+def bench(count=64, size=256 * 1024, latency=0.02, connect_latency=0.2, bandwidth=8 * 1024**2,
+          threads=4, connections=2, channels_per_connection=8):
+    """
+    用进程内的SFTP替身对比线程池消费者和asyncio消费者
+
+    替身按latency模拟每次请求的往返延迟，按bandwidth模拟单个通道的传输速率，
+    因此结果反映的是并发度带来的差异，而不是真实网络的绝对速度
+    """
+    work_dir = tempfile.mkdtemp(prefix='bench_consumer_')
+    try:
+        files = make_files(os.path.join(work_dir, 'local'), count, size)
+        results = []
+
+        server = LocalSFTPServer(os.path.join(work_dir, 'remote_threaded'), latency, connect_latency, bandwidth)
+        pool = SFTPConnectionPool(max_size=threads, connect_factory=server.connect)
+        consumer = Consumer(max_workers=threads, remote_paths=REMOTE_PATHS, pool=pool)
+        elapsed = run_consumer(consumer, files)
+        results.append((f"线程池 ({threads} 线程)", elapsed, consumer.get_processed_count(), server.connect_count))
+
+        server = LocalSFTPServer(os.path.join(work_dir, 'remote_async'), latency, connect_latency, bandwidth)
+        consumer = AsyncConsumer(connections=connections, channels_per_connection=channels_per_connection,
+                                 remote_paths=REMOTE_PATHS, connect=server.connect_async)
+        elapsed = run_consumer(consumer, files)
+        results.append((f"asyncio ({connections} 连接 x {channels_per_connection} 通道)", elapsed,
+                        consumer.get_processed_count(), server.connect_count))
+
+        total_mb = count * size / 1024**2
+        print(f"{count} 个文件, 共 {total_mb:.1f} MB, 往返延迟 {latency * 1000:.0f} ms, 单通道 {bandwidth / 1024**2:.1f} MB/s")
+        for name, elapsed, processed, connects in results:
+            print(f"{name}: {elapsed:.2f} 秒, {total_mb / elapsed:.1f} MB/s, 处理 {processed} 个文件, 建立连接 {connects} 次")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="线程池消费者与asyncio消费者的上传吞吐对比")
+    parser.add_argument('--count', type=int, default=64, help="文件个数")
+    parser.add_argument('--size', type=int, default=256 * 1024, help="单个文件大小(字节)")
+    parser.add_argument('--latency', type=float, default=0.02, help="每次请求的往返延迟(秒)")
+    parser.add_argument('--bandwidth', type=float, default=8, help="单个通道的传输速率(MB/s)")
+    parser.add_argument('--threads', type=int, default=4, help="线程池消费者的线程数")
+    parser.add_argument('--connections', type=int, default=2, help="asyncio消费者的SSH连接数")
+    parser.add_argument('--channels', type=int, default=8, help="asyncio消费者每个连接的通道数")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bench(args.count, args.size, args.latency, bandwidth=int(args.bandwidth * 1024**2), threads=args.threads,
+          connections=args.connections, channels_per_connection=args.channels)
@@ -0,0 +1,83 @@
+import os
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+from producer import FileCompressor
+
+logger = logging.getLogger(__name__)
+
+
+def make_batch(folder, count, size):
+    """生成count组wav+json测试文件，内容可压缩，约一半为随机数据"""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(folder)
+    for n in range(count):
+        with open(os.path.join(folder, f"rec{n:04d}.wav"), 'wb') as f:
+            f.write(rng.randbytes(size // 2) + bytes(rng.randrange(16) for _ in range(1024)) * (size // 2048))
+        with open(os.path.join(folder, f"rec{n:04d}.json"), 'w') as f:
+            f.write('{"id": %d, "rate": 16000}' % n)
+
+
+def run_compressor(compressor, batch_ids, source_folders, output_folders):
+    """压缩全部批次，返回耗时(秒)"""
+    for folder in output_folders:
+        shutil.rmtree(folder, ignore_errors=True)
+    start = time.perf_counter()
+    compressor.compress_files(batch_ids, source_folders, output_folders)
+    return time.perf_counter() - start
+
+
+def bench(batches=4, files=32, size=4 * 1024**2, volume_size=32 * 1024**2, max_workers=None):
+    """
+    对比线程模式和1到N个工作进程的进程模式
+
+    每个压缩包约volume_size字节，批次内的压缩包在进程模式下可以同时生成，
+    因此进程数不超过压缩包总数时耗时应随进程数近似线性下降
+    """
+    max_workers = max_workers or os.cpu_count()
+    work_dir = tempfile.mkdtemp(prefix='bench_producer_')
+    try:
+        batch_ids = [f"bench{n}" for n in range(batches)]
+        source_folders = [os.path.join(work_dir, 'source', b) for b in batch_ids]
+        output_folders = [os.path.join(work_dir, 'target', b) for b in batch_ids]
+        for folder in source_folders:
+            make_batch(folder, files, size)
+        total_mb = batches * files * size / 1024**2
+        max_size = volume_size / 1024**3
+
+        results = []
+        compressor = FileCompressor(max_size=max_size)
+        elapsed = run_compressor(compressor, batch_ids, source_folders, output_folders)
+        results.append(("线程模式", elapsed))
+        workers = 1
+        while True:
+            compressor = FileCompressor(max_size=max_size, executor='process', process_workers=workers)
+            elapsed = run_compressor(compressor, batch_ids, source_folders, output_folders)
+            results.append((f"进程模式 ({workers} 进程)", elapsed))
+            if workers >= max_workers:
+                break
+            workers = min(workers * 2, max_workers)
+
+        print(f"{batches} 个批次, 共 {total_mb:.1f} MB, 压缩包约 {volume_size / 1024**2:.0f} MB, CPU核数 {os.cpu_count()}")
+        baseline = results[1][1]
+        for name, elapsed in results:
+            print(f"{name}: {elapsed:.2f} 秒, {total_mb / elapsed:.1f} MB/s, 相对1进程 {baseline / elapsed:.2f}x")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="线程模式与进程模式生产者的压缩吞吐对比")
+    parser.add_argument('--batches', type=int, default=4, help="批次数")
+    parser.add_argument('--files', type=int, default=32, help="每个批次的文件组数")
+    parser.add_argument('--size', type=int, default=4 * 1024**2, help="单个wav文件大小(字节)")
+    parser.add_argument('--volume-size', type=int, default=32 * 1024**2, help="单个压缩包的原始大小上限(字节)")
+    parser.add_argument('--workers', type=int, default=None, help="最多的工作进程数，默认为CPU核数")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bench(args.batches, args.files, args.size, args.volume_size, args.workers)
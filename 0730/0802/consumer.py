@@ -3,19 +3,79 @@ import zipfile
 import time
 import logging
 import shutil
+import hashlib
 from queue import Queue, Empty
 import threading
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor
-import paramiko
+from sftp_pool import SFTPConnectionPool, CONNECTION_ERRORS
+from remote_cache import RemoteStateCache
+from remote_router import RemoteRouter, TargetUnavailable
+from backpressure_queue import STOP_SENTINEL
+from metrics import REGISTRY
+
+import shared_modules  # 把仓库根目录加入sys.path
+from retry_policy import RetryPolicy, RetryBudget
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# 上传阶段的指标，按远程路径区分
+UPLOAD_BYTES = REGISTRY.counter('upload_bytes_total', '上传成功的字节数')
+UPLOADS = REGISTRY.counter('uploads_total', '上传次数，result为ok或error')
+UPLOAD_RETRIES = REGISTRY.counter('upload_retries_total', '上传重试次数')
+PUT_SECONDS = REGISTRY.histogram('sftp_put_seconds', '单个文件写入远程的耗时')
+STAT_SECONDS = REGISTRY.histogram('sftp_stat_seconds', '上传后stat远程文件的耗时')
+QUEUE_WAIT_SECONDS = REGISTRY.histogram('queue_wait_seconds', '压缩包在队列中等待消费者取出的时间')
+
+
+class HashingReader:
+    """读取时顺带计算sha256的文件包装，上传时不必为校验值再读一遍文件"""
+    def __init__(self, fp):
+        self.fp = fp
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class RangeReader:
+    """只读取文件[offset, offset + length)区间的包装"""
+    def __init__(self, fp, offset, length):
+        self.fp = fp
+        self.fp.seek(offset)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fp.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+class UploadedVolume:
+    """流式模式下已直接写入远程的压缩包，代替本地路径放入队列"""
+    def __init__(self, filename, remote_file_path):
+        self.filename = filename
+        self.remote_file_path = remote_file_path
+        self.fp = None
+        self.size = 0
+
+    def __str__(self):
+        return self.remote_file_path
+
 
 class FileProcessor:
-    def __init__(self, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None):
+    def __init__(self, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None, pool=None, journal=None, post_upload_hook=None, block_size=256 * 1024, max_requests=64,
+                 split_threshold=1024**3, split_part_size=64 * 1024**2, split_channels=4, remote_cache=None, router=None, retry_policy=None):
         self.processed_count = 0
         self.lock = threading.Lock()
         self.remote_paths = remote_paths
@@ -26,128 +86,385 @@ class FileProcessor:
             'password': 'password',
             'port': 22
         }
+        # 所有工作线程共享的SFTP连接池
+        self.pool = pool or SFTPConnectionPool()
+        # 运行日志，记录已完成的上传，重启后跳过
+        self.journal = journal
+        # 上传成功后的处理逻辑，签名为 hook(file_path, remote_file_path)
+        self.post_upload_hook = post_upload_hook
+        # 每次从本地读取并写入的块大小，以及同时在途(未确认)的写请求数
+        self.block_size = block_size
+        self.max_requests = max_requests
+        # 超过split_threshold字节的文件按split_part_size切分，最多split_channels个通道并行上传，None表示不切分
+        self.split_threshold = split_threshold
+        self.split_part_size = split_part_size
+        self.split_channels = split_channels
+        # 远程目录状态缓存，代替每个文件的stat和目录检查
+        self.remote_cache = remote_cache or RemoteStateCache()
+        # 远程路径路由，默认沿用原来按batch_no和文件名选择的规则
+        self.router = router or RemoteRouter(remote_paths)
+        # 所有工作线程共享的重试策略(指数退避、抖动、重试预算)
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries, base_delay=2.0, budget=RetryBudget())
     
-    def get_remote_path(self, file_path, batch_no):
-        """根据batch_no和文件名中的n选择远程路径"""
-        filename = os.path.basename(file_path)
+    def get_remote_path(self, file_path, batch_no, size=0):
+        """由路由器选择远程路径"""
+        return self.router.choose(os.path.basename(file_path), batch_no, size)
+
+    def reroute(self, file_path, batch_no, remote_path, size=0):
+        """重试前检查远程路径的熔断器，已熔断时改路由到其他健康目标，没有可用目标时保持原路径"""
+        if self.router.is_available(remote_path):
+            return remote_path
         try:
-            # 提取batchid_n.zip中的n
-            n = int(filename.split('_')[1].split('.')[0])
-            # 先根据batch_no选择两个路径
-            if batch_no % 2 == 0:
-                selected_paths = [self.remote_paths[0], self.remote_paths[1]]
-            else:
-                selected_paths = [self.remote_paths[2], self.remote_paths[3]]
-            # 再根据n选择其中一个
-            return selected_paths[n % 2]
-        except:
-            # 如果无法解析，使用默认路径
-            return self.remote_paths[0]
-
-    def upload_file(self, file_path, batch_no):
-        """通过SFTP上传文件到远程路径"""
+            new_path = self.get_remote_path(file_path, batch_no, size)
+        except RuntimeError as e:
+            logger.warning(f"{e}，仍使用原路径: {remote_path}")
+            return remote_path
+        logger.warning(f"远程路径 {remote_path} 已熔断，{os.path.basename(file_path)} 改为上传到 {new_path}")
+        return new_path
+
+    def route(self, file_path, batch_no, size=0):
+        """选择远程路径，运行日志中已有上传记录的文件沿用原来的路径，重跑时不会换到其他目标"""
+        if self.journal:
+            volume = self.journal.get_volume(os.path.basename(file_path))
+            if volume and volume['remote_path']:
+                path = os.path.dirname(volume['remote_path'])
+                if self.router.is_available(path):
+                    return path
+                logger.warning(f"运行日志中的远程路径 {path} 已熔断，{os.path.basename(file_path)} 重新选择路径")
+        return self.get_remote_path(file_path, batch_no, size)
+
+    def ensure_remote_dir(self, sftp, remote_path):
+        """检查远程目录是否存在，不存在则创建，结果记入缓存"""
+        self.remote_cache.ensure_dir(sftp, remote_path)
+
+    @contextmanager
+    def open_remote_upload(self, filename, batch_no):
+        """
+        打开远程文件用于流式写入，yield UploadedVolume，通过其fp写入数据
+        先写入.part临时文件，正常退出后改名为正式文件名，异常时删除临时文件
+        """
+        remote_path = self.get_remote_path(filename, batch_no)
+        try:
+            self.router.begin(remote_path, 0)
+        except TargetUnavailable:
+            # 选择后探测名额被其他上传占用，重新选择一次
+            remote_path = self.reroute(filename, batch_no, remote_path)
+            self.router.begin(remote_path, 0)
+        volume = UploadedVolume(filename, f"{remote_path}/{filename}")
+        temp_file_path = f"{volume.remote_file_path}.part"
+        start = time.perf_counter()
+        ok = False
+        try:
+            with self.pool.session(self.sftp_config) as sftp:
+                self.ensure_remote_dir(sftp, remote_path)
+                try:
+                    with sftp.open(temp_file_path, 'wb') as fp:
+                        if hasattr(fp, 'set_pipelined'):
+                            fp.set_pipelined(True)
+                        volume.fp = fp
+                        yield volume
+                        volume.size = fp.tell()
+                except BaseException:
+                    try:
+                        sftp.remove(temp_file_path)
+                    except Exception:
+                        pass
+                    raise
+                finally:
+                    volume.fp = None
+                getattr(sftp, 'posix_rename', sftp.rename)(temp_file_path, volume.remote_file_path)
+                self.remote_cache.record_upload(volume.remote_file_path, volume.size)
+                ok = True
+        finally:
+            # 流式写入时大小事先未知，结束后按实际大小记录吞吐
+            elapsed = time.perf_counter() - start
+            self.router.finish(remote_path, volume.size, elapsed, ok, begun_size=0)
+            UPLOADS.inc(target=remote_path, result='ok' if ok else 'error')
+            if ok:
+                PUT_SECONDS.observe(elapsed, target=remote_path)
+                UPLOAD_BYTES.inc(volume.size, target=remote_path)
+        logger.info(f"文件SFTP流式上传成功: {volume.remote_file_path}")
+
+    def write_pipelined(self, fp, reader):
+        """
+        按block_size读取reader并流水线写入远程文件fp，返回写入的字节数
+
+        paramiko开启pipelined后写请求不等待确认；每写max_requests块关闭一次pipelined写一块，
+        paramiko写这一块前会读取所有在途请求的确认，在途请求不会无限增长，写入出错时也能尽早发现。
+        """
+        pipelined = hasattr(fp, 'set_pipelined')
+        written = 0
+        blocks = 0
+        while True:
+            data = reader.read(self.block_size)
+            if not data:
+                break
+            blocks += 1
+            sync = blocks % self.max_requests == 0
+            if pipelined:
+                fp.set_pipelined(not sync)
+            fp.write(data)
+            if sync:
+                fp.flush()
+            written += len(data)
+        if pipelined:
+            fp.set_pipelined(True)
+        return written
+
+    def write_split(self, sftp, file_path, remote_file_path, file_size):
+        """
+        把大文件切分为若干区间，在多个SFTP通道上按偏移量并行写入
+
+        当前线程用自己的会话上传，另外最多split_channels - 1个辅助线程从连接池借用空闲会话，
+        借不到时每秒重试，其他工作线程空闲后即可加入；所有通道从同一个区间队列取任务。
+        辅助线程只做非阻塞的短暂等待，不会与其他工作线程互相等待连接。
+        """
+        ranges = Queue()
+        for offset in range(0, file_size, self.split_part_size):
+            ranges.put((offset, min(self.split_part_size, file_size - offset)))
+        errors = []
+
+        # 先创建(清空)远程文件，各通道再以读写方式打开后按偏移量写入
+        with sftp.open(remote_file_path, 'wb'):
+            pass
+
+        def upload_ranges(part_sftp):
+            with open(file_path, 'rb') as f, part_sftp.open(remote_file_path, 'r+b') as fp:
+                while not errors:
+                    try:
+                        offset, length = ranges.get_nowait()
+                    except Empty:
+                        return
+                    fp.seek(offset)
+                    self.write_pipelined(fp, RangeReader(f, offset, length))
+
+        def helper():
+            while not errors and not ranges.empty():
+                try:
+                    session = self.pool.acquire(self.sftp_config, timeout=1)
+                except TimeoutError:
+                    continue
+                discard = False
+                try:
+                    upload_ranges(session.sftp)
+                except Exception as e:
+                    errors.append(e)
+                    discard = isinstance(e, CONNECTION_ERRORS)
+                finally:
+                    self.pool.release(session, discard)
+                return
+
+        threads = [threading.Thread(target=helper) for _ in range(self.split_channels - 1)]
+        for thread in threads:
+            thread.start()
+        try:
+            upload_ranges(sftp)
+        except Exception as e:
+            errors.append(e)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        logger.info(f"文件分 {(file_size + self.split_part_size - 1) // self.split_part_size} 段并行上传: {file_path}")
+
+    def archive_checksum(self, file_path):
+        """生产者生成压缩包时记在运行日志中的sha256，上传的就是该压缩包时沿用，不再为校验值重读文件"""
+        if not self.journal:
+            return None
+        volume = self.journal.get_volume(os.path.basename(file_path))
+        return volume['archive_sha256'] if volume else None
+
+    def upload_file(self, file_path, batch_no, sftp=None, remote_path=None):
+        """通过SFTP上传文件到远程路径，未传入sftp时从连接池借用会话，未传入remote_path时由路由器选择"""
+        if sftp is None:
+            try:
+                with self.pool.session(self.sftp_config) as sftp:
+                    return self.upload_file(file_path, batch_no, sftp, remote_path)
+            except TargetUnavailable:
+                raise
+            except Exception as e:
+                logger.error(f"文件SFTP上传失败: {file_path}, 错误: {e}")
+                return False
+        begun = None
         try:
             filename = os.path.basename(file_path)
-            remote_path = self.get_remote_path(file_path, batch_no)
+            file_size = os.path.getsize(file_path)
+            remote_path = remote_path or self.get_remote_path(file_path, batch_no, file_size)
             remote_file_path = f"{remote_path}/{filename}"
             
-            # 创建SSH客户端
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(**self.sftp_config)
+            # 在途字节数和实测吞吐反馈给路由器
+            start = time.perf_counter()
+            self.router.begin(remote_path, file_size)
+            begun = remote_path
             
-            # 创建SFTP客户端
-            sftp = ssh.open_sftp()
+            self.ensure_remote_dir(sftp, remote_path)
             
-            # 检查远程目录是否存在，不存在则创建
-            try:
-                sftp.stat(remote_path)
-            except FileNotFoundError:
-                sftp.mkdir(remote_path)
-            
-            # 上传文件
-            sftp.put(file_path, remote_file_path)
-            
-            sftp.close()
-            ssh.close()
+            with PUT_SECONDS.time(target=remote_path):
+                if self.split_threshold and file_size > self.split_threshold:
+                    # 各区间乱序写入，无法边读边算sha256，沿用生产者计算的校验值
+                    self.write_split(sftp, file_path, remote_file_path, file_size)
+                    checksum = self.archive_checksum(file_path)
+                else:
+                    # 流水线写入远程文件，读取时计算校验值
+                    with open(file_path, 'rb') as f, sftp.open(remote_file_path, 'wb') as fp:
+                        reader = HashingReader(f)
+                        self.write_pipelined(fp, reader)
+                    checksum = reader.hexdigest()
+            # 不逐块确认，写完后用远程文件大小校验
+            with STAT_SECONDS.time(target=remote_path):
+                attrs = sftp.stat(remote_file_path)
+            if attrs.st_size != file_size:
+                raise Exception(f"远程文件大小不一致: {attrs.st_size} != {file_size}")
+            self.remote_cache.record_upload(remote_file_path, attrs.st_size, attrs.st_mtime)
+            elapsed = time.perf_counter() - start
+            self.router.finish(remote_path, file_size, elapsed)
+            begun = None
+            UPLOAD_BYTES.inc(file_size, target=remote_path)
+            UPLOADS.inc(target=remote_path, result='ok')
+            if self.journal:
+                self.journal.mark_uploaded(filename, remote_file_path, file_size, checksum)
             
-            logger.info(f"文件SFTP上传成功: {file_path} -> {remote_file_path}")
+            rate = file_size / 1024**2 / elapsed if elapsed > 0 else 0
+            logger.info(f"文件SFTP上传成功: {file_path} -> {remote_file_path}, "
+                        f"{file_size / 1024**2:.1f} MB, {elapsed:.2f} 秒, {rate:.1f} MB/s")
             return True
+        except TargetUnavailable:
+            raise
         except Exception as e:
+            if begun is not None:
+                self.router.finish(begun, file_size, time.perf_counter() - start, ok=False)
+                UPLOADS.inc(target=begun, result='error')
             logger.error(f"文件SFTP上传失败: {file_path}, 错误: {e}")
             return False
 
-    def process_compressed_file(self, file_path, batch_no=2):
+    def already_done(self, file_path):
+        """流式模式下生产者已上传的文件直接计数，返回是否跳过"""
+        if not isinstance(file_path, UploadedVolume):
+            return False
+        logger.info(f"文件已由生产者流式上传: {file_path}")
+        with self.lock:
+            self.processed_count += 1
+        return True
+
+    def remote_matches(self, file_path, remote_size):
         """
-        处理压缩文件的示例函数
-        这里可以替换为实际的处理逻辑
+        远程已存在的同名文件是否就是要上传的文件
+        有运行日志时要求上传记录的大小与远程一致、上传的数据与生成的压缩包sha256一致，
+        中断留下的不完整文件会重新上传；没有运行日志时比较本地文件大小
         """
-        for attempt in range(self.max_retries):
+        if self.journal:
+            return self.journal.is_remote_complete(os.path.basename(file_path), remote_size)
+        if os.path.exists(file_path):
+            return os.path.getsize(file_path) == remote_size
+        return True
+
+    def after_upload(self, file_path, remote_file_path):
+        """上传成功后的处理和计数，不参与上传重试"""
+        if self.post_upload_hook:
             try:
-                logger.info(f"开始处理压缩文件 (尝试 {attempt + 1}/{self.max_retries}): {file_path}, batch_no: {batch_no}")
-                
-                # 检查文件是否已存在于远程路径
-                filename = os.path.basename(file_path)
-                remote_path = self.get_remote_path(file_path, batch_no)
-                remote_file_path = f"{remote_path}/{filename}"
-                
-                try:
-                    ssh = paramiko.SSHClient()
-                    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                    ssh.connect(**self.sftp_config)
-                    sftp = ssh.open_sftp()
-                    sftp.stat(remote_file_path)
-                    sftp.close()
-                    ssh.close()
-                    logger.info(f"文件已存在于远程路径，跳过处理: {remote_file_path}")
-                    with self.lock:
-                        self.processed_count += 1
-                    return True
-                except FileNotFoundError:
-                    pass
-
-                # 检查文件是否存在
-                if not os.path.exists(file_path):
-                    raise Exception(f"文件不存在: {file_path}")
-
-
-                # 上传文件到远程路径
-                if not self.upload_file(file_path, batch_no):
-                    raise Exception("文件上传失败")
+                self.post_upload_hook(file_path, remote_file_path)
+            except Exception as e:
+                logger.error(f"上传后处理失败: {file_path}, 错误: {e}")
+                return False
 
-                # 模拟处理时间
-                time.sleep(10)
+        with self.lock:
+            self.processed_count += 1
 
+        logger.info(f"成功处理文件: {file_path}")
+        return True
 
-                # 模拟处理结果
-                with self.lock:
-                    self.processed_count += 1
+    def process_compressed_file(self, file_path, batch_no=2):
+        """
+        处理压缩文件的示例函数
+        这里可以替换为实际的处理逻辑
+        """
+        if self.already_done(file_path):
+            return True
 
-                logger.info(f"成功处理文件: {file_path}")
-                return True
+        # 每个文件只路由一次，存在性检查和上传使用同一个远程路径，目标熔断时才改路由
+        filename = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        remote_path = self.route(file_path, batch_no, file_size)
+        max_attempts = self.retry_policy.max_attempts
+        self.retry_policy.record_request()
 
+        for attempt in range(max_attempts):
+            remote_file_path = f"{remote_path}/{filename}"
+            try:
+                logger.info(f"开始处理压缩文件 (尝试 {attempt + 1}/{max_attempts}): {file_path}, batch_no: {batch_no}")
+                
+                # 同一会话内完成存在性检查和上传，存在性从远程目录缓存中查询
+                with self.pool.session(self.sftp_config) as sftp:
+                    state = self.remote_cache.lookup(sftp, remote_file_path)
+                    if state is not None:
+                        if self.remote_matches(file_path, state.size):
+                            logger.info(f"文件已存在于远程路径且大小和校验值一致，跳过处理: {remote_file_path}")
+                            with self.lock:
+                                self.processed_count += 1
+                            return True
+                        logger.warning(f"远程文件与本地压缩包不一致，重新上传: {remote_file_path}")
+
+                    # 检查文件是否存在
+                    if not os.path.exists(file_path):
+                        raise Exception(f"文件不存在: {file_path}")
+
+                    # 上传文件到远程路径
+                    if not self.upload_file(file_path, batch_no, sftp, remote_path):
+                        raise Exception("文件上传失败")
+
+            except TargetUnavailable as e:
+                # 没有发出请求，不算上传失败，立即改路由；没有其他可用目标时按重试间隔等待
+                new_path = self.reroute(file_path, batch_no, remote_path, file_size)
+                if attempt + 1 >= max_attempts:
+                    logger.error(f"{e}，文件处理失败: {file_path}")
+                    return False
+                if new_path == remote_path:
+                    time.sleep(self.retry_policy.delay(attempt + 1))
+                remote_path = new_path
             except Exception as e:
-                logger.error(f"处理文件 {file_path} 时发生错误 (尝试 {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    logger.info(f"等待重试...")
-                    time.sleep(2)
+                logger.error(f"处理文件 {file_path} 时发生错误 (尝试 {attempt + 1}/{max_attempts}): {e}")
+                if self.retry_policy.should_retry(attempt + 1):
+                    UPLOAD_RETRIES.inc(target=remote_path)
+                    remote_path = self.reroute(file_path, batch_no, remote_path, file_size)
+                    delay = self.retry_policy.delay(attempt + 1)
+                    logger.info(f"等待 {delay:.1f} 秒后重试...")
+                    time.sleep(delay)
                 else:
-                    logger.error(f"文件处理失败，已达到最大重试次数: {file_path}")
+                    logger.error(f"文件处理失败，不再重试: {file_path}")
                     return False
+            else:
+                break
+
+        return self.after_upload(file_path, remote_file_path)
 
     def get_processed_count(self):
         """获取已处理的文件数量"""
         return self.processed_count
 
+    def close(self):
+        """关闭SFTP连接池"""
+        logger.info(f"远程路径使用情况: {self.router.summary()}")
+        self.pool.close()
+
 
 class Consumer:
-    def __init__(self, processor=None, max_workers=4, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None):
-        self.processor = processor or FileProcessor(remote_paths, max_retries, sftp_config)
+    def __init__(self, processor=None, max_workers=4, remote_paths=["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"], max_retries=3, sftp_config=None, pool=None, journal=None, post_upload_hook=None,
+                 block_size=256 * 1024, max_requests=64, split_threshold=1024**3, router=None):
+        # 连接池大小与工作线程数一致，每个线程最多持有一条会话；大文件分段上传时借用空闲线程的会话
+        self.processor = processor or FileProcessor(remote_paths, max_retries, sftp_config, pool or SFTPConnectionPool(max_size=max_workers), journal, post_upload_hook,
+                                                    block_size, max_requests, split_threshold, split_channels=max_workers, router=router)
         self.running = False
         self.thread = None
         self.max_workers = max_workers
         self.executor = None
         self.batch_no = 0
+        # 同时在途的任务数上限，其余文件留在队列中
+        self.in_flight = threading.BoundedSemaphore(max_workers * 2)
+        self.in_flight_count = 0
+        self.count_lock = threading.Lock()
+        self.queue = None
+        self.sentinel_sent = False
+        self.sentinel_lock = threading.Lock()
 
     def start_consuming(self, compressed_files_queue, producer_completed_event):
         """
@@ -158,70 +475,128 @@ class Consumer:
             producer_completed_event: 生产者完成事件
         """
         self.running = True
+        self.queue = compressed_files_queue
+        self.sentinel_sent = False
+        self._register_gauges()
         self.thread = threading.Thread(
             target=self._consume_loop,
-            args=(compressed_files_queue, producer_completed_event)
+            args=(compressed_files_queue,)
         )
         self.thread.start()
+        # 生产者完成后向队列放入结束标记，排在所有文件之后
+        threading.Thread(target=self._wait_producer, args=(producer_completed_event,), daemon=True).start()
         logger.info("消费者线程已启动")
 
-    def _consume_loop(self, compressed_files_queue, producer_completed_event):
+    def _register_gauges(self):
+        """队列深度、待上传字节数和在途任务数，导出指标时读取"""
+        REGISTRY.gauge('queue_depth', '队列中等待上传的压缩包个数', lambda: self.get_queue_stats()['depth'])
+        REGISTRY.gauge('in_flight_uploads', '正在处理的压缩包个数', lambda: self.in_flight_count)
+        if hasattr(self.queue, 'gauges'):
+            REGISTRY.gauge('pending_bytes', '已生成但未上传完成的压缩包原始字节数',
+                           lambda: self.queue.gauges()['pending_bytes'])
+
+    def _wait_producer(self, producer_completed_event):
+        producer_completed_event.wait()
+        logger.info("生产者已完成，队列中的文件处理完后结束")
+        self._send_sentinel()
+
+    def _send_sentinel(self):
+        with self.sentinel_lock:
+            if self.sentinel_sent or self.queue is None:
+                return
+            self.sentinel_sent = True
+        self.queue.put(STOP_SENTINEL)
+
+    def _next_item(self, compressed_files_queue):
+        """取下一个文件，在途任务达到上限时阻塞；收到结束标记或已停止时返回STOP_SENTINEL"""
+        self.in_flight.acquire()
+        file_path = compressed_files_queue.get()
+        if file_path is STOP_SENTINEL or not self.running:
+            self.in_flight.release()
+            if file_path is not STOP_SENTINEL:
+                # 已停止，文件放回队列留待下次处理
+                compressed_files_queue.put(file_path)
+            compressed_files_queue.task_done()
+            return STOP_SENTINEL
+        logger.info(f"从队列获取到文件: {file_path}")
+        if hasattr(compressed_files_queue, 'wait_time'):
+            wait = compressed_files_queue.wait_time(file_path)
+            if wait is not None:
+                QUEUE_WAIT_SECONDS.observe(wait)
+        with self.count_lock:
+            self.in_flight_count += 1
+        return file_path
+
+    def _finish_item(self, file_path, compressed_files_queue):
+        """一个文件处理结束，释放在途名额并task_done"""
+        with self.count_lock:
+            self.in_flight_count -= 1
+        self.in_flight.release()
+        # 释放该文件在有界队列中占用的字节数
+        if hasattr(compressed_files_queue, 'item_done'):
+            compressed_files_queue.item_done(file_path)
+        compressed_files_queue.task_done()
+
+    def _on_done(self, future, file_path, compressed_files_queue):
+        """任务完成回调：每个文件处理完立即task_done"""
+        try:
+            if not future.result():
+                logger.warning(f"文件处理失败: {file_path}")
+        except Exception as e:
+            logger.error(f"处理文件 {file_path} 时发生错误: {e}")
+        finally:
+            self._finish_item(file_path, compressed_files_queue)
+
+    def _consume_loop(self, compressed_files_queue):
         """消费循环"""
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             self.executor = executor
-            futures = []
 
-            while self.running:
-                try:
-                    # 尝试从队列获取文件路径，超时1秒
-                    file_path = compressed_files_queue.get(timeout=1)
-                    logger.info(f"从队列获取到文件: {file_path}")
+            while True:
+                file_path = self._next_item(compressed_files_queue)
+                if file_path is STOP_SENTINEL:
+                    break
 
+                try:
                     # 提交到线程池处理
                     future = executor.submit(self.processor.process_compressed_file, file_path, self.batch_no)
-                    futures.append((future, file_path, compressed_files_queue))
                     self.batch_no += 1
-
-                except Empty:
-                    # 队列为空，检查生产者是否已完成
-                    if producer_completed_event.is_set():
-                        logger.info("生产者已完成且队列为空，等待剩余任务完成")
-                        break
-                    else:
-                        logger.debug("队列暂时为空，等待更多文件...")
-                        continue
                 except Exception as e:
                     logger.error(f"消费过程中发生错误: {e}")
+                    self._finish_item(file_path, compressed_files_queue)
                     break
+                future.add_done_callback(
+                    lambda f, file_path=file_path: self._on_done(f, file_path, compressed_files_queue))
 
-            # 等待所有任务完成
-            for future, file_path, queue in futures:
-                try:
-                    success = future.result()
-                    if success:
-                        pass
-                    else:
-                        logger.warning(f"文件处理失败: {file_path}")
-                    queue.task_done()
-                except Exception as e:
-                    logger.error(f"处理文件 {file_path} 时发生错误: {e}")
-                    queue.task_done()
+            logger.info("等待剩余任务完成")
 
         logger.info("消费者线程结束")
 
     def stop(self):
         """停止消费者"""
         self.running = False
-        if self.executor:
-            self.executor.shutdown(wait=True)
+        self._send_sentinel()
         if self.thread and self.thread.is_alive():
             self.thread.join()
+        self.processor.close()
         logger.info("消费者已停止")
 
     def get_processed_count(self):
         """获取已处理的文件数量"""
         return self.processor.get_processed_count()
 
+    def get_queue_stats(self):
+        """获取队列深度、在途任务数和待上传字节数"""
+        stats = {'depth': self.queue.qsize() if self.queue else 0}
+        if hasattr(self.queue, 'gauges'):
+            stats.update(self.queue.gauges())
+        stats['in_flight'] = self.in_flight_count
+        return stats
+
+    def get_target_stats(self):
+        """获取每个远程路径的使用情况，见RemoteRouter.utilisation"""
+        return self.processor.router.utilisation()
+
 # 示例使用
 if __name__ == "__main__":
     # 创建测试队列
@@ -237,8 +612,8 @@ if __name__ == "__main__":
     consumer.start_consuming(test_queue, producer_completed)
 
     # 模拟生产者完成
-    time.sleep(2)
     producer_completed.set()
+    test_queue.join()
 
     # 等待消费者完成
     consumer.stop()
@@ -0,0 +1,226 @@
+import os
+import time
+import shutil
+import asyncio
+import threading
+
+
+class LocalAttributes:
+    """与paramiko.SFTPAttributes对应的本地文件属性，size同asyncssh.SFTPAttrs"""
+    def __init__(self, filename, st):
+        self.filename = filename
+        self.st_size = st.st_size
+        self.size = st.st_size
+        self.st_mtime = st.st_mtime
+        self.st_mode = st.st_mode
+
+
+class LocalTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class LocalSSHClient:
+    def __init__(self):
+        self.transport = LocalTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+
+class LocalRemoteFile:
+    """sftp.open()返回的文件替身，写入时按通道速率模拟传输耗时"""
+    def __init__(self, client, fp):
+        self.client = client
+        self.fp = fp
+
+    def write(self, data):
+        self.client._transfer_delay(len(data))
+        return self.fp.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.fp.close()
+
+
+class LocalSFTPClient:
+    """
+    以本地目录模拟远程文件系统的SFTP客户端，接口与paramiko.SFTPClient的常用部分一致
+    远程路径 /a/b 映射为 root/a/b
+    """
+    def __init__(self, server, ssh, simulate=True):
+        self.server = server
+        self.ssh = ssh
+        # 为False时由异步包装负责模拟延迟
+        self.simulate = simulate
+
+    def _local(self, path):
+        self._check()
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    def _check(self):
+        if not self.ssh.transport.is_active():
+            raise EOFError("连接已断开")
+        self.server.op_count += 1
+        if self.simulate and self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _transfer_delay(self, size):
+        if self.simulate and self.server.channel_bandwidth:
+            time.sleep(size / self.server.channel_bandwidth)
+
+    def stat(self, path):
+        return LocalAttributes(os.path.basename(path), os.stat(self._local(path)))
+
+    def mkdir(self, path):
+        os.mkdir(self._local(path))
+
+    def listdir(self, path='.'):
+        return os.listdir(self._local(path))
+
+    def listdir_attr(self, path='.'):
+        local_dir = self._local(path)
+        return [LocalAttributes(name, os.stat(os.path.join(local_dir, name))) for name in os.listdir(local_dir)]
+
+    def put(self, localpath, remotepath, callback=None, confirm=True):
+        shutil.copyfile(localpath, self._local(remotepath))
+        self._transfer_delay(os.path.getsize(localpath))
+        return self.stat(remotepath)
+
+    def putfo(self, fl, remotepath, file_size=0, callback=None, confirm=True):
+        with open(self._local(remotepath), 'wb') as f:
+            shutil.copyfileobj(fl, f, 32768)
+        self._transfer_delay(file_size)
+        return self.stat(remotepath)
+
+    def open(self, filename, mode='r', bufsize=-1):
+        if 'b' not in mode:
+            mode += 'b'
+        return LocalRemoteFile(self, open(self._local(filename), mode))
+
+    def remove(self, path):
+        os.remove(self._local(path))
+
+    def rename(self, oldpath, newpath):
+        os.replace(self._local(oldpath), self._local(newpath))
+
+    posix_rename = rename
+
+    def normalize(self, path):
+        self._check()
+        return '/' + path.strip('/.')
+
+    def close(self):
+        pass
+
+
+class LocalAsyncSFTPClient:
+    """asyncssh.SFTPClient风格的异步替身，延迟用asyncio.sleep模拟，不阻塞事件循环"""
+    def __init__(self, server, ssh):
+        self.server = server
+        self.client = LocalSFTPClient(server, ssh, simulate=False)
+
+    async def _op(self, func, *args):
+        if self.server.latency:
+            await asyncio.sleep(self.server.latency)
+        return func(*args)
+
+    async def stat(self, path):
+        return await self._op(self.client.stat, path)
+
+    async def mkdir(self, path):
+        return await self._op(self.client.mkdir, path)
+
+    async def listdir(self, path='.'):
+        return await self._op(self.client.listdir, path)
+
+    async def remove(self, path):
+        return await self._op(self.client.remove, path)
+
+    async def put(self, localpaths, remotepath=None, block_size=None, max_requests=None):
+        await self._op(self.client.put, localpaths, remotepath)
+        if self.server.channel_bandwidth:
+            await asyncio.sleep(os.path.getsize(localpaths) / self.server.channel_bandwidth)
+
+    def exit(self):
+        pass
+
+
+class LocalAsyncConnection:
+    """asyncssh.SSHClientConnection风格的异步连接替身"""
+    def __init__(self, server):
+        self.server = server
+        self.ssh = LocalSSHClient()
+
+    async def start_sftp_client(self):
+        if not self.ssh.transport.is_active():
+            raise EOFError("连接已断开")
+        return LocalAsyncSFTPClient(self.server, self.ssh)
+
+    def close(self):
+        self.ssh.close()
+
+    async def wait_closed(self):
+        pass
+
+
+class LocalSFTPServer:
+    """
+    进程内的SFTP替身，可作为SFTPConnectionPool的connect_factory离线验证连接复用与重连，
+    也可用connect_async作为异步消费者的连接函数
+
+    Args:
+        root: 模拟远程文件系统的本地目录
+        latency: 每次请求的往返延迟(秒)
+        connect_latency: 建立连接(握手)的耗时(秒)
+        channel_bandwidth: 单个SFTP通道的传输速率(字节/秒)，None表示不限
+
+    Example:
+        server = LocalSFTPServer('/tmp/fake_remote')
+        pool = SFTPConnectionPool(connect_factory=server.connect)
+    """
+    def __init__(self, root, latency=0.0, connect_latency=0.0, channel_bandwidth=None):
+        self.root = root
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.channel_bandwidth = channel_bandwidth
+        self.connect_count = 0
+        self.op_count = 0
+        self.clients = []
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def connect(self, sftp_config):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        ssh = LocalSSHClient()
+        with self.lock:
+            self.connect_count += 1
+            self.clients.append(ssh)
+        return ssh, LocalSFTPClient(self, ssh)
+
+    async def connect_async(self, sftp_config):
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        conn = LocalAsyncConnection(self)
+        with self.lock:
+            self.connect_count += 1
+            self.clients.append(conn.ssh)
+        return conn
+
+    def disconnect_all(self):
+        """模拟服务端断开所有连接"""
+        with self.lock:
+            for ssh in self.clients:
+                ssh.close()
@@ -3,11 +3,37 @@ import time
 import logging
 from producer import FileCompressor
 from consumer import Consumer
+from run_journal import RunJournal
+from remote_router import RemoteRouter
+from metrics import REGISTRY
+from watch_producer import WatchCompressor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 流式模式：压缩包直接写入SFTP远程文件，不在本地落盘
+STREAM_MODE = False
+# 压缩执行方式："thread" 或 "process"(压缩包在工作进程中生成，不能与流式模式同时使用)
+PRODUCER_EXECUTOR = "thread"
+# 调度方式："batch" 每个批次一个任务，"global" 先规划所有批次再把压缩包按大小从大到小作为独立任务执行
+PRODUCER_SCHEDULE = "batch"
+# 监视模式：持续监视源文件夹，json和wav都写完后即打包，压缩包满或打开超过WATCH_MAX_DELAY秒后上传，Ctrl+C结束
+WATCH_MODE = False
+WATCH_MAX_DELAY = 60
+# 运行日志(如"run_journal.db")，中断后重新运行会跳过已完成的压缩和上传，None表示不使用
+JOURNAL_PATH = None
+# 本地待上传压缩包的原始大小上限(GB)，上传跟不上时生产者暂停
+MAX_PENDING_SIZE = 64
+# 远程路径及路由策略，可选策略见remote_router.STRATEGIES
+REMOTE_PATHS = ["/tmp/remote1", "/tmp/remote2", "/tmp/remote3", "/tmp/remote4"]
+ROUTING_STRATEGY = "legacy"
+# 指标：METRICS_PORT不为None时提供 http://host:port/metrics (Prometheus文本格式)，
+# METRICS_JSON_PATH不为None时(如"metrics.json")每METRICS_INTERVAL秒把快照(含每秒速率)写入该文件
+METRICS_PORT = None
+METRICS_JSON_PATH = None
+METRICS_INTERVAL = 30
+
 def main():
     """主函数：集成生产者和消费者"""
     
@@ -24,11 +50,21 @@ def main():
         # r"C:\Users\PC\AppData\Local\Temp\tmpl22x51pi\target3"
     ]
     
-    # 创建生产者（文件压缩器）
-    producer = FileCompressor()
+    journal = RunJournal(JOURNAL_PATH) if JOURNAL_PATH else None
+    
+    if METRICS_PORT is not None:
+        REGISTRY.serve(METRICS_PORT)
+    if METRICS_JSON_PATH:
+        REGISTRY.start_json_dump(METRICS_JSON_PATH, METRICS_INTERVAL)
     
     # 创建消费者
-    consumer = Consumer()
+    consumer = Consumer(remote_paths=REMOTE_PATHS, journal=journal,
+                        router=RemoteRouter(REMOTE_PATHS, ROUTING_STRATEGY))
+    
+    # 创建生产者（文件压缩器），流式模式下直接使用消费者的上传通道
+    producer = FileCompressor(stream_to=consumer.processor if STREAM_MODE else None, journal=journal,
+                              max_pending_size=MAX_PENDING_SIZE, executor=PRODUCER_EXECUTOR,
+                              schedule=PRODUCER_SCHEDULE)
     
     # 创建生产者完成事件
     producer_completed_event = threading.Event()
@@ -40,7 +76,13 @@ def main():
     try:
         # 启动生产者（压缩文件）
         logger.info("开始生产者任务...")
-        producer.compress_files(batch_ids, source_folders, output_folders)
+        if WATCH_MODE:
+            try:
+                WatchCompressor(producer, max_delay=WATCH_MAX_DELAY).run(batch_ids, source_folders, output_folders)
+            except KeyboardInterrupt:
+                logger.info("停止监视，上传剩余的压缩包...")
+        else:
+            producer.compress_files(batch_ids, source_folders, output_folders)
         
         # 标记生产者已完成
         producer_completed_event.set()
@@ -56,6 +98,7 @@ def main():
         # 输出统计信息
         processed_count = consumer.get_processed_count()
         logger.info(f"处理完成！总共处理了 {processed_count} 个压缩文件")
+        logger.info(f"远程路径使用情况: {consumer.get_target_stats()}")
         
     except KeyboardInterrupt:
         logger.info("收到中断信号，正在停止...")
@@ -66,6 +109,12 @@ def main():
         producer_completed_event.set()
         consumer.stop()
         raise
+    finally:
+        REGISTRY.stop()
+        if METRICS_JSON_PATH:
+            REGISTRY.dump_json(METRICS_JSON_PATH)
+        if journal:
+            journal.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import mmap
+import zlib
+import struct
+import logging
+import zipfile
+import argparse
+from contextlib import contextmanager
+from sftp_pool import SFTPConnectionPool
+from run_journal import RunJournal
+
+import shared_modules  # 把仓库根目录加入sys.path
+from zip_volume import LOCAL_HEADER_SIZE, index_batch_ids, load_batch_index, volume_index_paths
+
+logger = logging.getLogger(__name__)
+
+# 每次读取的压缩数据大小
+CHUNK_SIZE = 1024 * 1024
+
+
+def read_range(fp, offset, length, chunk_size=CHUNK_SIZE):
+    """
+    按chunk_size读取fp中[offset, offset + length)的数据
+    paramiko的SFTPFile用readv一次发出所有读请求，不必每块等待一次往返；mmap和本地文件用seek/read
+    """
+    if hasattr(fp, 'readv'):
+        chunks = [(pos, min(chunk_size, offset + length - pos)) for pos in range(offset, offset + length, chunk_size)]
+        yield from fp.readv(chunks)
+        return
+    fp.seek(offset)
+    remaining = length
+    while remaining > 0:
+        data = fp.read(min(chunk_size, remaining))
+        if not data:
+            raise zipfile.BadZipFile(f"压缩包被截断，缺少 {remaining} 字节")
+        remaining -= len(data)
+        yield data
+
+
+def check_local_header(fp, entry):
+    """读取成员的本地文件头，确认索引与压缩包一致(没有被重新生成)"""
+    fp.seek(entry['header_offset'])
+    header = fp.read(LOCAL_HEADER_SIZE)
+    if len(header) < LOCAL_HEADER_SIZE or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"索引与压缩包不一致: {entry['volume']} 偏移 {entry['header_offset']} 处不是文件头")
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    if entry['header_offset'] + LOCAL_HEADER_SIZE + name_len + extra_len != entry['data_offset']:
+        raise zipfile.BadZipFile(f"索引与压缩包不一致: {entry['volume']} 中 {entry['arcname']} 的数据偏移不同")
+
+
+def iter_member(fp, entry, chunk_size=CHUNK_SIZE):
+    """
+    只读取一个成员的压缩数据，边读边解压，逐块yield解压后的数据
+
+    Args:
+        fp: 压缩包，支持seek/read的文件对象(mmap、本地文件或paramiko的SFTPFile)
+        entry: 成员索引，见zip_volume.member_index
+
+    读完后校验CRC和大小，不一致时抛出zipfile.BadZipFile
+    """
+    if entry['method'] == zipfile.ZIP_DEFLATED:
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    elif entry['method'] == zipfile.ZIP_STORED:
+        inflater = None
+    else:
+        raise NotImplementedError(f"不支持的压缩方法: {entry['method']}")
+    check_local_header(fp, entry)
+    crc = 0
+    size = 0
+    for data in read_range(fp, entry['data_offset'], entry['compress_size'], chunk_size):
+        if inflater is not None:
+            data = inflater.decompress(data)
+        if data:
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            yield data
+    if inflater is not None:
+        data = inflater.flush()
+        if data:
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            yield data
+    if crc != entry['crc'] or size != entry['file_size']:
+        raise zipfile.BadZipFile(f"{entry['volume']} 中 {entry['arcname']} 校验失败")
+
+
+class MemberReader:
+    """
+    按transaction id从压缩包中取出单个录音(同名json和wav)，根据旁路索引只读取该成员的字节范围
+    本地压缩包还在时用mmap读取，否则通过SFTP读取远程压缩包
+
+    Args:
+        output_folders: 生产者的输出文件夹列表(批次索引和各压缩包的旁路索引所在)
+        journal: run_journal.RunJournal，用于查找压缩包的远程路径
+        remote_paths: 没有运行日志记录时查找压缩包的远程目录
+        sftp_config: SFTP连接参数
+        pool: sftp_pool.SFTPConnectionPool
+        chunk_size: 每次读取的字节数
+    """
+    def __init__(self, output_folders, journal=None, remote_paths=(), sftp_config=None, pool=None,
+                 chunk_size=CHUNK_SIZE):
+        self.output_folders = list(output_folders)
+        self.journal = journal
+        self.remote_paths = list(remote_paths)
+        self.sftp_config = sftp_config
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.indexes = {}   # (输出文件夹, 批次ID) -> (压缩包个数, 批次索引)
+
+    def batch_ids(self, output_folder):
+        """输出文件夹中有索引的批次，只有各压缩包旁路索引的批次在读取时合并出批次索引"""
+        return index_batch_ids(output_folder)
+
+    def _index(self, output_folder, batch_id):
+        """批次索引，监视模式下批次新增了压缩包时重新读取"""
+        key = (output_folder, batch_id)
+        volumes = len(volume_index_paths(output_folder, batch_id))
+        if key not in self.indexes or self.indexes[key][0] != volumes:
+            self.indexes[key] = (volumes, load_batch_index(output_folder, batch_id))
+        return self.indexes[key][1]
+
+    def find(self, transaction_id, batch_id=None):
+        """
+        查找transaction id对应的成员
+
+        Returns:
+            [(输出文件夹, 成员索引), ...]，成员索引的volume为所在压缩包名
+        """
+        found = []
+        for output_folder in self.output_folders:
+            batch_ids = [batch_id] if batch_id else self.batch_ids(output_folder)
+            for bid in batch_ids:
+                members = self._index(output_folder, bid)['members']
+                found += [(output_folder, entry) for arcname, entry in members.items()
+                          if os.path.splitext(arcname)[0] == transaction_id]
+            if found:
+                break
+        return found
+
+    def _remote_path(self, name, sftp):
+        if self.journal:
+            volume = self.journal.get_volume(name)
+            if volume and volume['remote_path']:
+                return volume['remote_path']
+        for remote_dir in self.remote_paths:
+            remote_path = f"{remote_dir}/{name}"
+            try:
+                sftp.stat(remote_path)
+                return remote_path
+            except FileNotFoundError:
+                continue
+        raise FileNotFoundError(f"找不到压缩包: {name}")
+
+    @contextmanager
+    def open_volume(self, output_folder, name):
+        """打开压缩包用于随机读取：本地文件用mmap，否则通过SFTP打开远程文件"""
+        local_path = os.path.join(output_folder, name)
+        if os.path.exists(local_path):
+            with open(local_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+            return
+        if self.pool is None:
+            self.pool = SFTPConnectionPool()
+        with self.pool.session(self.sftp_config) as sftp:
+            remote_path = self._remote_path(name, sftp)
+            logger.info(f"从远程压缩包读取: {remote_path}")
+            with sftp.open(remote_path, 'rb') as fp:
+                yield fp
+
+    def iter_member(self, output_folder, entry):
+        """逐块yield成员解压后的数据"""
+        with self.open_volume(output_folder, entry['volume']) as fp:
+            yield from iter_member(fp, entry, self.chunk_size)
+
+    def extract(self, transaction_id, dest_folder, batch_id=None):
+        """
+        把transaction id对应的文件解压到dest_folder，先写临时文件，校验通过后改名
+
+        Returns:
+            解压出的文件路径列表
+        """
+        found = self.find(transaction_id, batch_id)
+        if not found:
+            raise FileNotFoundError(f"索引中没有 transaction id: {transaction_id}")
+        os.makedirs(dest_folder, exist_ok=True)
+        paths = []
+        for output_folder, entry in found:
+            path = os.path.join(dest_folder, entry['arcname'])
+            temp_path = path + '.part'
+            try:
+                with open(temp_path, 'wb') as f:
+                    for data in self.iter_member(output_folder, entry):
+                        f.write(data)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.replace(temp_path, path)
+            logger.info(f"已取出 {entry['arcname']} ({entry['file_size']} 字节) <- {entry['volume']}")
+            paths.append(path)
+        return paths
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="按transaction id从压缩包中取出单个录音，只读取该成员的字节范围")
+    parser.add_argument('transaction_ids', nargs='+', help="transaction id")
+    parser.add_argument('--output-folder', action='append', required=True, help="生产者的输出文件夹，可重复")
+    parser.add_argument('--batch-id', default=None, help="批次ID，默认查找输出文件夹中的所有批次")
+    parser.add_argument('--dest', default='.', help="解压到的文件夹")
+    parser.add_argument('--journal', default=None, help="运行日志路径，用于查找已上传压缩包的远程路径")
+    parser.add_argument('--remote-path', action='append', default=[], help="远程目录，可重复")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=22)
+    parser.add_argument('--username', default='user')
+    parser.add_argument('--password', default=None)
+    args = parser.parse_args()
+
+    journal = None
+    if args.journal:
+        journal = RunJournal(args.journal)
+    sftp_config = {'hostname': args.host, 'port': args.port, 'username': args.username, 'password': args.password}
+    reader = MemberReader(args.output_folder, journal, args.remote_path, sftp_config)
+    try:
+        for transaction_id in args.transaction_ids:
+            for path in reader.extract(transaction_id, args.dest, args.batch_id):
+                print(path)
+    finally:
+        reader.close()
+        if journal:
+            journal.close()
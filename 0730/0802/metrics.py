@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的默认分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+class Counter:
+    """只增不减的计数器，可按标签区分"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge:
+    """可增可减的瞬时值；传入func时每次导出时调用func取值"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.func is not None:
+            try:
+                return [(self.name, (), self.func())]
+            except Exception as e:
+                logger.debug(f"读取指标 {self.name} 失败: {e}")
+                return []
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram:
+    """分桶直方图，记录耗时等分布"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}    # 标签 -> [各桶计数, 总和, 总数]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            pos = bisect.bisect_left(self.buckets, value)
+            if pos < len(self.buckets):
+                entry[0][pos] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    result.append((f"{self.name}_bucket", key + (('le', bound),), cumulative))
+                result.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+    def summary(self):
+        """每组标签的次数、平均值和近似p50/p95(取所在桶的上界，超出最大的桶时为None)"""
+        result = {}
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                def quantile(q):
+                    cumulative = 0
+                    for bound, n in zip(self.buckets, counts):
+                        cumulative += n
+                        if cumulative >= q * count:
+                            return bound
+                    return None
+                result[_format_labels(key) or 'all'] = {
+                    'count': count,
+                    'avg': total / count if count else 0,
+                    'p50': quantile(0.5),
+                    'p95': quantile(0.95),
+                }
+        return result
+
+
+class MetricsRegistry:
+    """
+    指标注册表，导出为Prometheus文本格式或JSON
+
+    Example:
+        REGISTRY.serve(9108)                               # http://host:9108/metrics
+        REGISTRY.start_json_dump('metrics.json', 30)       # 每30秒写一次JSON
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+        self.created_at = time.monotonic()
+        self.rate_state = {}    # 读取方 -> (上次快照时间, 上次快照的计数器)
+
+    def _register(self, cls, name, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._register(Counter, name, help_text)
+
+    def gauge(self, name, help_text='', func=None):
+        gauge = self._register(Gauge, name, help_text, func)
+        if func is not None:
+            # 重新注册时以新的回调为准，例如消费者重新开始消费
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, buckets)
+
+    def render_prometheus(self):
+        """Prometheus文本格式"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self, reader='default'):
+        """
+        JSON可序列化的快照：计数器给出总量和距该读取方上次快照的每秒速率，直方图给出次数、平均值和分位数
+        """
+        now = time.monotonic()
+        with self.lock:
+            last_time, last_counters = self.rate_state.get(reader, (self.created_at, {}))
+        elapsed = max(now - last_time, 1e-9)
+        result = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        with self.lock:
+            metrics = list(self.metrics.values())
+        counters = {}
+        for metric in metrics:
+            if metric.kind == 'counter':
+                for name, key, value in metric.samples():
+                    label = name + _format_labels(key)
+                    counters[label] = value
+                    result['counters'][label] = {
+                        'total': value,
+                        'per_second': (value - last_counters.get(label, 0)) / elapsed,
+                    }
+            elif metric.kind == 'gauge':
+                for name, key, value in metric.samples():
+                    result['gauges'][name + _format_labels(key)] = value
+            else:
+                result['histograms'][metric.name] = metric.summary()
+        with self.lock:
+            self.rate_state[reader] = (now, counters)
+        return result
+
+    def serve(self, port, host='0.0.0.0'):
+        """在后台线程中提供 /metrics (Prometheus文本) 和 /metrics.json"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics.json'):
+                    # 每个客户端单独计算速率，不影响JSON导出和其他客户端
+                    snapshot = registry.snapshot(f"http:{self.client_address[0]}")
+                    body = json.dumps(snapshot, ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                elif self.path.startswith('/metrics'):
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"指标服务已启动: http://{host}:{self.server.server_address[1]}/metrics")
+        return self.server
+
+    def start_json_dump(self, path, interval=30):
+        """每interval秒把快照写入path(先写临时文件再替换)"""
+        def run():
+            while not self.dump_stop.wait(interval):
+                self.dump_json(path)
+
+        self.dump_stop.clear()
+        self.dump_thread = threading.Thread(target=run, daemon=True)
+        self.dump_thread.start()
+
+    def dump_json(self, path):
+        snapshot = self.snapshot(f"file:{path}")
+        snapshot['time'] = time.time()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def stop(self):
+        """停止HTTP服务和JSON导出"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.dump_thread:
+            self.dump_stop.set()
+            self.dump_thread.join()
+            self.dump_thread = None
+
+
+# 默认注册表，各模块的指标都注册在这里
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,218 @@
+import os
+import time
+import zlib
+import zipfile
+import logging
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+import shared_modules  # 把仓库根目录加入sys.path
+from content_hash import HASH_BLOCK, block_digests
+from compression_policy import write_file
+from zip_member import PRIVATE_API, MemberWriter, member_info
+
+logger = logging.getLogger(__name__)
+
+# deflate的滑动窗口大小，每个分块用前一块的最后32KB作为预置字典，压缩率与串行基本一致
+DICT_SIZE = 32 * 1024
+
+
+def deflate_chunk(path, offset, length, level, last, with_digests=False):
+    """
+    工作进程函数：读取文件的一个分块并做raw deflate
+    非最后一块以Z_SYNC_FLUSH结束，拼接后仍是一个合法的deflate流
+
+    Returns:
+        (压缩后的数据, 分块CRC32, 分块原始长度, 压缩耗时CPU秒数, 内容哈希分块摘要列表或None)
+    """
+    with open(path, 'rb') as f:
+        zdict = b''
+        if offset > 0:
+            dict_start = max(0, offset - DICT_SIZE)
+            f.seek(dict_start)
+            zdict = f.read(offset - dict_start)
+        data = f.read(length)
+    start = time.thread_time()
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    crc = zlib.crc32(data)
+    digests = block_digests(data) if with_digests else None
+    return compressed, crc, len(data), time.thread_time() - start, digests
+
+
+def _gf2_times(matrix, vector):
+    total = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return total
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, row) for row in matrix]
+
+
+@lru_cache(maxsize=64)
+def _crc32_shift_matrix(length):
+    """CRC32后接length个字节时对原CRC的线性变换矩阵（与zlib的crc32_combine算法相同）"""
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    result = [1 << n for n in range(32)]
+    while length:
+        even = _gf2_square(odd)
+        if length & 1:
+            result = [_gf2_times(even, row) for row in result]
+        length >>= 1
+        if not length:
+            break
+        odd = _gf2_square(even)
+        if length & 1:
+            result = [_gf2_times(odd, row) for row in result]
+        length >>= 1
+    return result
+
+
+def crc32_combine(crc1, crc2, length2):
+    """由两段数据各自的CRC32计算拼接后的CRC32，length2为第二段长度"""
+    if length2 == 0:
+        return crc1
+    return _gf2_times(_crc32_shift_matrix(length2), crc1) ^ crc2
+
+
+class PrecompressedMemberWriter:
+    """向ZipFile写入已压缩好的deflate数据，ZipFile没有公开写入预压缩数据的接口"""
+    def __init__(self, zf, path, arcname):
+        self.zf = zf
+        self.writer = MemberWriter(zf, member_info(zf, path, arcname, zipfile.ZIP_DEFLATED))
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+
+    def write(self, compressed, crc, length):
+        self.zf.fp.write(compressed)
+        self.compress_size += len(compressed)
+        self.crc = crc32_combine(self.crc, crc, length)
+        self.file_size += length
+
+    def close(self):
+        self.writer.close(self.crc, self.file_size, self.compress_size)
+
+    def abort(self):
+        self.writer.abort()
+
+
+class ParallelDeflater:
+    """
+    多进程并行压缩同一个压缩包内的成员，按原始顺序组装成合法的zip
+
+    每个成员按chunk_size切成分块分发到工作进程（类似pigz），
+    单个大WAV也能用满多个核；同时在途的分块数有上限，内存占用约为 max_in_flight * chunk_size
+
+    Args:
+        workers: 工作进程数
+        level: 压缩级别，与zipfile默认的6相同
+        chunk_size: 分块大小(字节)，须为content_hash.HASH_BLOCK的整数倍
+        max_in_flight: 同时在途的分块数，默认为工作进程数的2倍
+    """
+    def __init__(self, workers=None, level=6, chunk_size=16 * 1024**2, max_in_flight=None):
+        if chunk_size % HASH_BLOCK:
+            raise ValueError(f"分块大小须为 {HASH_BLOCK} 的整数倍: {chunk_size}")
+        self.workers = workers or os.cpu_count() or 1
+        self.level = level
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def _iter_chunks(self, members):
+        for index, (path, arcname, method, level) in enumerate(members):
+            if method != zipfile.ZIP_DEFLATED:
+                # 非deflate成员不分块，轮到它时由主进程直接写入
+                yield index, path, arcname, method, level, 0, 0, True
+                continue
+            size = os.path.getsize(path)
+            offset = 0
+            while True:
+                length = min(self.chunk_size, size - offset)
+                last = offset + length >= size
+                yield index, path, arcname, method, level, offset, length, last
+                if last:
+                    break
+                offset += length
+
+    def write_members(self, zf, members, hashers=None):
+        """
+        将members写入zf
+
+        Args:
+            zf: 以'w'模式打开的ZipFile
+            members: [(文件路径, 压缩包内名称), ...] 或 [(文件路径, 压缩包内名称, 压缩方法, 压缩级别), ...]
+            hashers: 与members一一对应的content_hash.ContentHasher，传入时由工作进程顺带计算成员内容哈希
+
+        Returns:
+            每个成员的压缩耗时CPU秒数列表，与members顺序一致
+        """
+        members = [m if len(m) == 4 else (m[0], m[1], zipfile.ZIP_DEFLATED, None) for m in members]
+        cpu_seconds = [0.0] * len(members)
+        if not PRIVATE_API:
+            # 无法写入预压缩数据，逐个成员串行写入
+            for index, (path, arcname, method, level) in enumerate(members):
+                start = time.thread_time()
+                write_file(zf, path, arcname, method, self.level if level is None else level,
+                           hashers[index] if hashers else None)
+                cpu_seconds[index] = time.thread_time() - start
+            return cpu_seconds
+        chunks = self._iter_chunks(members)
+        pending = deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                index, path, arcname, method, level, offset, length, last = chunk
+                future = None
+                if method == zipfile.ZIP_DEFLATED:
+                    future = self.executor.submit(deflate_chunk, path, offset, length,
+                                                  self.level if level is None else level, last, hashers is not None)
+                pending.append((chunk, future))
+
+        for _ in range(self.max_in_flight):
+            submit_next()
+
+        writer = None
+        try:
+            while pending:
+                (index, path, arcname, method, level, offset, length, last), future = pending.popleft()
+                submit_next()
+                if future is None:
+                    start = time.thread_time()
+                    write_file(zf, path, arcname, method, level, hashers[index] if hashers else None)
+                    cpu_seconds[index] = time.thread_time() - start
+                    logger.debug(f"添加文件到压缩包: {path}")
+                    continue
+                compressed, crc, chunk_length, elapsed, digests = future.result()
+                cpu_seconds[index] += elapsed
+                if hashers:
+                    hashers[index].add_block_digests(digests, chunk_length)
+                if offset == 0:
+                    writer = PrecompressedMemberWriter(zf, path, arcname)
+                writer.write(compressed, crc, chunk_length)
+                if last:
+                    writer.close()
+                    writer = None
+                    logger.debug(f"添加文件到压缩包: {path}")
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if writer is not None:
+                writer.abort()
+        return cpu_seconds
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -1,15 +1,34 @@
 import os
+import sys
 import zipfile
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait
 import logging
+from parallel_deflate import ParallelDeflater
+from backpressure_queue import BackpressureQueue
+from run_journal import STATE_CLOSED, STATE_UPLOADED
+from metrics import REGISTRY
+
+import shared_modules  # 把仓库根目录加入sys.path
+from compression_policy import CompressionPolicy, CompressionStats
+from content_hash import ContentHasher, HashingWriter
+from zip_planner import plan_volumes
+from file_index import FileIndex
+from zip_volume import max_group_bytes, volume_budget, member_index, write_index, build_batch_index
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 压缩阶段的指标
+BYTES_READ = REGISTRY.counter('compress_bytes_read_total', '写入压缩包的原始文件字节数')
+BYTES_WRITTEN = REGISTRY.counter('compress_bytes_written_total', '生成的压缩包字节数')
+VOLUMES = REGISTRY.counter('compress_volumes_total', '生成的压缩包个数')
+FILE_SECONDS = REGISTRY.histogram('compress_file_seconds', '单个文件写入压缩包的耗时(并行压缩时为CPU秒数)')
+VOLUME_SECONDS = REGISTRY.histogram('compress_volume_seconds', '生成单个压缩包的耗时')
+
 def format_file_size(size_bytes):
     """格式化文件大小显示"""
     if size_bytes < 1024:
@@ -21,12 +40,91 @@ def format_file_size(size_bytes):
     else:
         return f"{size_bytes / (1024**3):.2f} GB"
 
+# 可选的压缩执行方式
+#   thread: 批次内在线程中逐个生成压缩包(原来的行为)
+#   process: 压缩包在工作进程中生成，规划、背压预留、运行日志和放入队列仍在主进程中进行
+EXECUTORS = ('thread', 'process')
+
+# 可选的调度方式
+#   batch: 每个批次一个任务，批次内的压缩包依次生成(原来的行为)
+#   global: 先规划所有批次的压缩包，再把压缩包作为独立任务按原始大小从大到小(LPT)执行，
+#           大批次不会独占一个工作线程；压缩包命名仍由各批次的规划决定，与执行顺序无关
+SCHEDULES = ('batch', 'global')
+
+# 进程模式下工作进程内的压缩器，只用来写入成员
+_worker_compressor = None
+
+
+def _init_worker(policy):
+    global _worker_compressor
+    _worker_compressor = FileCompressor(policy=policy)
+
+
+def build_volume(target, files, index=True):
+    """
+    在工作进程中生成压缩包，index为True时同时写出旁路索引
+
+    Returns:
+        (压缩后大小, 压缩包sha256, 成员清单, 各成员耗时, CompressionStats, 总耗时)
+    """
+    start = time.perf_counter()
+    stats = CompressionStats()
+    with open(target, 'wb') as fp:
+        writer = HashingWriter(fp)
+        with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as current_zip:
+            members, seconds = _worker_compressor._write_members(current_zip, files, stats)
+    if index:
+        write_index(target, member_index(current_zip, {m[1]: m[4] for m in members}), writer.tell(), writer.hexdigest())
+    return os.path.getsize(target), writer.hexdigest(), members, seconds, stats, time.perf_counter() - start
+
 class FileCompressor:
-    def __init__(self, max_size=16 ):
-        self.max_size_bytes = max_size * 1024**3
-        self.compressed_files_queue = Queue()
+    def __init__(self, max_size=16, stream_to=None, deflate_workers=0, policy=None, plan_strategy='ffd', journal=None,
+                 max_queue_items=0, max_pending_size=None, skip_shipped=False, executor='thread', process_workers=None,
+                 schedule='batch', file_index=None, max_volume_size=None, write_index=True):
+        """
+        Args:
+            max_size: 单个压缩包的大小上限(GB)
+            stream_to: 流式上传目标(如consumer.FileProcessor)，设置后压缩包直接写入远程，不在本地落盘
+            deflate_workers: 同一压缩包内成员并行压缩的进程数，0为不并行
+            policy: compression_policy.CompressionPolicy，默认全部deflate
+            plan_strategy: 文件组装入压缩包的策略，见zip_planner.STRATEGIES
+            journal: run_journal.RunJournal，重启时跳过已完成的压缩包
+            max_queue_items: 队列中等待上传的压缩包个数上限，0表示不限
+            max_pending_size: 已生成未上传完成的压缩包大小上限(GB)，超出时生产者阻塞
+            skip_shipped: 是否跳过运行日志中已上传过的文件
+            executor: 压缩执行方式，见EXECUTORS
+            process_workers: process模式的工作进程数，默认为CPU核数
+            schedule: 调度方式，见SCHEDULES
+            file_index: file_index.FileIndex，分组、规划和已上传检查共用
+            max_volume_size: 单个压缩包输出大小(含文件头、中央目录和ZIP64记录)的上限(GB)，None时与max_size相同
+            write_index: 是否为每个压缩包写出旁路索引 {压缩包名}.idx.json
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(f"不支持的压缩执行方式: {executor}")
+        if schedule not in SCHEDULES:
+            raise ValueError(f"不支持的调度方式: {schedule}")
+        if executor == 'process' and (stream_to is not None or deflate_workers > 0):
+            raise ValueError("process模式不支持流式上传和成员级并行压缩")
+        self.stream_to = stream_to
+        self.deflate_workers = deflate_workers
+        self.deflater = None
+        self.policy = policy or CompressionPolicy()
+        self.plan_strategy = plan_strategy
+        self.journal = journal
+        self.skip_shipped = skip_shipped
+        self.executor = executor
+        self.process_workers = process_workers
+        self.process_pool = None
+        self.schedule = schedule
+        self.file_index = file_index or FileIndex()
+        # 总是按成员最坏情况下占用的输出字节数规划，不可压缩的数据加上文件头也不会超出上限
+        self.max_volume_bytes = int((max_volume_size or max_size) * 1024**3)
+        self.write_index = write_index
+        self.compressed_files_queue = BackpressureQueue(
+            max_queue_items, int(max_pending_size * 1024**3) if max_pending_size else None)
         self.task_counter = 0
         self.total_tasks = 0
+        self.volume_counter = 0
         self.lock = threading.Lock()
     
     def compress_files(self, batch_ids, source_folders, output_folders, max_workers=4):
@@ -37,7 +135,7 @@ class FileCompressor:
             batch_ids: 批次ID列表
             source_folders: 源文件夹列表
             output_folders: 输出文件夹列表
-            max_workers: 线程池最大工作线程数
+            max_workers: 线程池最大工作线程数(batch调度为同时处理的批次数，global调度为同时生成的压缩包数)
         """
         if not (len(batch_ids) == len(source_folders) == len(output_folders)):
             raise ValueError("batch_ids, source_folders, output_folders 的长度必须相等")
@@ -45,112 +143,360 @@ class FileCompressor:
         self.total_tasks = len(batch_ids)
         logger.info(f"开始处理 {self.total_tasks} 个批次")
 
-        # 使用线程池处理每个批次
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for i in range(len(batch_ids)):
-                future = executor.submit(
-                    self._compress_batch,
-                    batch_ids[i],
-                    source_folders[i],
-                    output_folders[i]
-                )
-                futures.append(future)
-            
-            # 等待所有任务完成
-            for future in futures:
-                future.result()
+        # 所有批次共享同一个并行压缩进程池
+        if self.deflate_workers > 0:
+            self.deflater = ParallelDeflater(workers=self.deflate_workers)
+        # 所有批次共享同一个压缩进程池
+        if self.executor == 'process':
+            self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers or os.cpu_count(),
+                                                    initializer=_init_worker, initargs=(self.policy,))
+
+        try:
+            if self.schedule == 'global':
+                self._compress_global(batch_ids, source_folders, output_folders, max_workers)
+            else:
+                # 使用线程池处理每个批次
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = []
+                    for i in range(len(batch_ids)):
+                        future = executor.submit(
+                            self._compress_batch,
+                            batch_ids[i],
+                            source_folders[i],
+                            output_folders[i]
+                        )
+                        futures.append(future)
+                    
+                    # 等待所有任务完成
+                    for future in futures:
+                        future.result()
+        finally:
+            if self.deflater:
+                self.deflater.close()
+                self.deflater = None
+            if self.process_pool:
+                self.process_pool.shutdown()
+                self.process_pool = None
         
         logger.info("所有压缩任务完成")
     
-    def _compress_batch(self, batch_id, source_folder, output_folder):
-        """压缩单个批次的文件"""
+    def _open_volume(self, batch_id, file_counter, output_folder):
+        """
+        创建压缩包，返回 (zip对象, 退出栈, 目标, 输出包装)，目标为本地路径或流式上传结果
+        输出经过HashingWriter，写入时计算整个压缩包的sha256
+        """
+        zip_filename = f"{batch_id}_{file_counter:02d}.zip"
+        stack = ExitStack()
+        if self.stream_to is None:
+            target = os.path.join(output_folder, zip_filename)
+            fp = stack.enter_context(open(target, 'wb'))
+        else:
+            with self.lock:
+                self.volume_counter += 1
+                volume_no = self.volume_counter
+            target = stack.enter_context(self.stream_to.open_remote_upload(zip_filename, volume_no))
+            fp = target.fp
+        writer = HashingWriter(fp)
+        current_zip = zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED)
+        logger.info(f"创建压缩文件: {target}")
+        return current_zip, stack, target, writer
+
+    def _reserve(self, nbytes):
+        """为即将生成的压缩包预留队列字节数，消费者跟不上时阻塞；流式模式不占本地磁盘，不预留"""
+        if self.stream_to is not None:
+            return 0
+        gauges = self.compressed_files_queue.gauges()
+        if gauges['max_bytes'] and gauges['pending_bytes'] and gauges['pending_bytes'] + nbytes > gauges['max_bytes']:
+            logger.info(f"待上传的压缩包已达上限，等待消费者: {gauges}")
+        self.compressed_files_queue.reserve(nbytes)
+        return nbytes
+
+    def _close_volume(self, current_zip, stack, target, writer, members, seconds, raw_size, stats, reserved, start,
+                      index_for=None):
+        """关闭压缩包，写出旁路索引(index_for为索引对应的本地压缩包路径)，记录内容清单并放入队列"""
+        current_zip.close()
+        stack.close()
+        compressed_size = os.path.getsize(target) if self.stream_to is None else target.size
+        if index_for:
+            write_index(index_for, member_index(current_zip, {m[1]: m[4] for m in members}),
+                        compressed_size, writer.hexdigest())
+        self._publish_volume(target, compressed_size, writer.hexdigest(), members, seconds, stats,
+                             time.perf_counter() - start, raw_size, reserved)
+
+    def _submit_volume(self, batch_id, file_counter, output_folder, volume_files, raw_size, reserved):
+        """
+        process模式：把压缩包交给工作进程生成，完成后在主进程中记录并放入队列
+
+        Returns:
+            Future，放入队列后完成，生成或记录失败时带异常
+        """
+        target = os.path.join(output_folder, f"{batch_id}_{file_counter:02d}.zip")
+        published = Future()
+
+        def on_built(future):
+            try:
+                self._publish_volume(target, *future.result(), raw_size, reserved)
+                published.set_result(target)
+            except Exception as e:
+                self.compressed_files_queue.release(reserved)
+                published.set_exception(e)
+
+        logger.info(f"创建压缩文件: {target}")
         try:
-            # 确保输出文件夹存在
+            future = self.process_pool.submit(build_volume, target, volume_files, self.write_index)
+        except BaseException:
+            self.compressed_files_queue.release(reserved)
+            raise
+        future.add_done_callback(on_built)
+        return published
+
+    def _publish_volume(self, target, compressed_size, archive_sha256, members, seconds, stats, elapsed, raw_size, reserved):
+        """记录压缩包的指标、运行日志和内容清单，放入队列"""
+        if compressed_size > self.max_volume_bytes:
+            logger.warning(f"压缩包超出大小上限(单个文件组过大): {target}, {compressed_size} > {self.max_volume_bytes}")
+        BYTES_READ.inc(sum(m[2] for m in members))
+        BYTES_WRITTEN.inc(compressed_size)
+        VOLUMES.inc()
+        VOLUME_SECONDS.observe(elapsed)
+        for file_seconds in seconds:
+            FILE_SECONDS.observe(file_seconds)
+        if self.journal:
+            name = os.path.basename(target) if self.stream_to is None else target.filename
+            if self.stream_to is None:
+                self.journal.mark_closed(name, target, compressed_size, archive_sha256)
+            else:
+                self.journal.mark_uploaded(name, target.remote_file_path, compressed_size, archive_sha256)
+            self.journal.record_members(name, members)
+            duplicates = self.journal.find_shipped_content([m[4] for m in members], exclude_volume=name)
+            if duplicates:
+                logger.info(f"{name} 中有 {len(duplicates)} 个成员的内容已出现在之前的压缩包中: "
+                            f"{sorted(set(duplicates.values()))}")
+        self.compressed_files_queue.put(target, nbytes=reserved)
+        logger.info(f"完成压缩文件: {target} (原始文件大小: {format_file_size(raw_size)}, 压缩后大小: {format_file_size(compressed_size)})")
+        logger.info(f"压缩策略统计 {target}: {stats.summary()}")
+
+    def _write_members(self, current_zip, files, stats):
+        """
+        按压缩策略将文件写入压缩包，启用并行压缩时deflate成员交给工作进程
+        写入的同时计算每个成员的内容哈希
+
+        Returns:
+            ([(文件路径, 压缩包内名称, 大小, 修改时间, 内容哈希), ...], [各成员耗时, ...])
+        """
+        hashers = [ContentHasher() for _ in files]
+        file_stats = [os.stat(file_path) for file_path in files]
+        if not self.deflater:
+            seconds = []
+            for file_path, hasher in zip(files, hashers):
+                start = time.perf_counter()
+                self.policy.write(current_zip, file_path, os.path.basename(file_path), stats, hasher)
+                seconds.append(time.perf_counter() - start)
+                logger.debug(f"添加文件到压缩包: {file_path}")
+        else:
+            members = []
+            decisions = []
+            for file_path, st in zip(files, file_stats):
+                method, level, est = self.policy.choose(file_path, st.st_size, estimate=True)
+                members.append((file_path, os.path.basename(file_path), method, level))
+                decisions.append((st.st_size, method, est))
+            seconds = self.deflater.write_members(current_zip, members, hashers)
+            for (size, method, est), elapsed in zip(decisions, seconds):
+                stats.record(size, method, elapsed, est)
+        return [(file_path, os.path.basename(file_path), st.st_size, st.st_mtime, hasher.hexdigest())
+                for file_path, st, hasher in zip(files, file_stats, hashers)], seconds
+
+    def _plan_batch(self, batch_id, file_groups):
+        """
+        规划批次的压缩包，有运行日志时沿用已记录的规划，只为新出现的文件追加压缩包
+
+        Returns:
+            [(压缩包序号, 压缩包名, 成员文件列表, 原始大小), ...]
+        """
+        volumes = self.journal.get_plan(batch_id) if self.journal else []
+        if volumes:
+            logger.info(f"批次 {batch_id} 沿用运行日志中的规划: {len(volumes)} 个压缩包")
+        planned = {f for _, _, members, _ in volumes for f in members}
+        groups = [[f for f in group if f not in planned] for group in file_groups.values()]
+        groups = [group for group in groups if group]
+        if groups and self.journal:
+            groups = self._check_shipped(batch_id, groups)
+        if not groups:
+            return volumes
+
+        # 按16G上限规划压缩包
+        size_of, capacity = self._volume_capacity()
+        plan = plan_volumes(groups, capacity, strategy=self.plan_strategy, size_of=size_of)
+        logger.info(f"批次 {batch_id} 打包规划: {plan.summary()}")
+        for volume_groups, size in zip(plan.volumes, plan.sizes):
+            volume_no = len(volumes) + 1
+            volumes.append((volume_no, f"{batch_id}_{volume_no:02d}.zip", [f for group in volume_groups for f in group], size))
+        if self.journal:
+            self.journal.record_plan(batch_id, volumes)
+        return volumes
+
+    def _volume_capacity(self):
+        """规划压缩包使用的 (文件组大小函数, 单个压缩包的容量)，按成员最坏情况下占用的输出字节数计算"""
+        return (lambda group: max_group_bytes(group, self.file_index.size)), volume_budget(self.max_volume_bytes)
+
+    def _check_shipped(self, batch_id, groups):
+        """查找已在之前上传的压缩包中出现过的文件，skip_shipped为True时去掉整组都已上传的文件组"""
+        files = []
+        for group in groups:
+            for f in group:
+                entry = self.file_index.stat(f)
+                files.append((f, entry.size, entry.mtime))
+        shipped = self.journal.find_shipped(files)
+        if not shipped:
+            return groups
+        logger.info(f"批次 {batch_id} 中有 {len(shipped)} 个文件已在之前的压缩包中上传: {sorted(set(shipped.values()))}")
+        if not self.skip_shipped:
+            return groups
+        return [group for group in groups if not all(f in shipped for f in group)]
+
+    def _resume_volume(self, name):
+        """运行日志中已完成的压缩包不再重建，已关闭但未上传的重新放入队列，返回是否跳过"""
+        if not self.journal:
+            return False
+        volume = self.journal.get_volume(name)
+        if volume['state'] == STATE_UPLOADED:
+            logger.info(f"压缩包已上传，跳过: {name}")
+            return True
+        local_path = volume['local_path']
+        if (volume['state'] == STATE_CLOSED and local_path and os.path.exists(local_path)
+                and os.path.getsize(local_path) == volume['size']):
+            logger.info(f"压缩包已完成，直接放入队列: {local_path}")
+            self.compressed_files_queue.put(local_path, nbytes=self._reserve(volume['size']))
+            return True
+        return False
+
+    def _scan_batch(self, batch_id, source_folder, output_folder):
+        """列出批次的源文件并按文件名(去掉扩展名)分组，没有文件时返回空字典"""
+        # 确保输出文件夹存在
+        if self.stream_to is None:
             os.makedirs(output_folder, exist_ok=True)
+        
+        # 扫描一次源文件夹，之后的大小和修改时间都从索引中读取
+        file_groups = self.file_index.groups(source_folder, ('.wav', '.json'), refresh=True)
+        if not file_groups:
+            logger.warning(f"批次 {batch_id} 的源文件夹中没有找到文件")
+        return file_groups
+
+    def _run_volume(self, batch_id, file_counter, output_folder, volume_files, raw_size):
+        """
+        预留字节数后生成一个压缩包并放入队列
+        process模式下交给工作进程，返回放入队列时完成的Future；否则在当前线程中生成，返回None
+        """
+        reserved = self._reserve(raw_size)
+        if self.process_pool:
+            # 预留的字节数在放入队列或失败时释放
+            return self._submit_volume(batch_id, file_counter, output_folder, volume_files, raw_size, reserved)
+        stack = None
+        try:
+            start = time.perf_counter()
+            current_zip, stack, target, writer = self._open_volume(batch_id, file_counter, output_folder)
+            stats = CompressionStats()
             
-            # 获取源文件夹中的所有文件
-            files = []
-            for filename in os.listdir(source_folder):
-                if filename.endswith(('.wav', '.json')):
-                    files.append(os.path.join(source_folder, filename))
-            
-            if not files:
-                logger.warning(f"批次 {batch_id} 的源文件夹中没有找到文件")
-                return
-            
-            # 按文件名分组（去掉扩展名）
-            file_groups = {}
-            for file_path in files:
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                if base_name not in file_groups:
-                    file_groups[base_name] = []
-                file_groups[base_name].append(file_path)
-            
-            # 按16G一组进行压缩
-            file_counter = 1
-            current_group_size = 0
-            
-            # 创建第一个压缩文件
-            zip_filename = f"{batch_id}_{file_counter:02d}.zip"
-            current_zip_path = os.path.join(output_folder, zip_filename)
-            current_zip = zipfile.ZipFile(current_zip_path, 'w', zipfile.ZIP_DEFLATED)
-            logger.info(f"创建第一个压缩文件: {current_zip_path}")
-            
-            for group_name, group_files in file_groups.items():
-                # 计算当前组文件的总大小
-                group_size = sum(os.path.getsize(f) for f in group_files)
-                
-                # 检查当前组大小 + 新组大小是否会超过16KB
-                if current_group_size + group_size > self.max_size_bytes:
-                    # 关闭之前的压缩文件
-                    if current_zip:
-                        current_zip.close()
-                        # 将压缩文件路径放入队列
-                        self.compressed_files_queue.put(current_zip_path)
-                        compressed_size = os.path.getsize(current_zip_path)
-                        logger.info(f"完成压缩文件: {current_zip_path} (原始文件大小: {format_file_size(current_group_size)}, 压缩后大小: {format_file_size(compressed_size)})")
-                        
+            # 添加文件到压缩包
+            members, seconds = self._write_members(current_zip, volume_files, stats)
 
-                    
-                    # 创建新的压缩文件
-                    file_counter += 1
-                    zip_filename = f"{batch_id}_{file_counter:02d}.zip"
-                    current_zip_path = os.path.join(output_folder, zip_filename)
-                    current_zip = zipfile.ZipFile(current_zip_path, 'w', zipfile.ZIP_DEFLATED)
-                    logger.info(f"创建新的压缩文件: {current_zip_path}")
-                    current_group_size = 0
-                
-                # 添加文件到压缩包
-                for file_path in group_files:
-                    arc_name = os.path.basename(file_path)
-                    current_zip.write(file_path, arc_name)
-                    logger.debug(f"添加文件到压缩包: {file_path}")
-
-                # 模拟
-                # time.sleep(10)
-                
-                # 更新当前组大小
-                current_group_size += group_size
+            # 关闭压缩文件并放入队列
+            index_for = os.path.join(output_folder, f"{batch_id}_{file_counter:02d}.zip") if self.write_index else None
+            self._close_volume(current_zip, stack, target, writer, members, seconds, raw_size, stats, reserved, start,
+                               index_for)
+        except BaseException:
+            # 流式模式下放弃未完成的远程文件
+            if stack is not None:
+                stack.__exit__(*sys.exc_info())
+            self.compressed_files_queue.release(reserved)
+            raise
+        return None
 
+    def _finish_batch(self, batch_id, output_folder):
+        """合并批次索引，更新任务计数器"""
+        if self.write_index:
+            build_batch_index(output_folder, batch_id)
+        with self.lock:
+            self.task_counter += 1
+            logger.info(f"批次 {batch_id} 完成，进度: {self.task_counter}/{self.total_tasks}")
 
+    def _compress_batch(self, batch_id, source_folder, output_folder):
+        """压缩单个批次的文件"""
+        try:
+            file_groups = self._scan_batch(batch_id, source_folder, output_folder)
+            if not file_groups:
+                return
             
-            # 关闭最后一个压缩文件
-            if current_zip:
-                current_zip.close()
-                self.compressed_files_queue.put(current_zip_path)
-                compressed_size = os.path.getsize(current_zip_path)
-                logger.info(f"完成压缩文件: {current_zip_path} (原始文件大小: {format_file_size(current_group_size)}, 压缩后大小: {format_file_size(compressed_size)})")
+            published = []
+            for file_counter, name, volume_files, raw_size in self._plan_batch(batch_id, file_groups):
+                if self._resume_volume(name):
+                    continue
+                future = self._run_volume(batch_id, file_counter, output_folder, volume_files, raw_size)
+                if future is not None:
+                    published.append(future)
 
-            
-            # 更新任务计数器
-            with self.lock:
-                self.task_counter += 1
-                logger.info(f"批次 {batch_id} 完成，进度: {self.task_counter}/{self.total_tasks}")
+            # 等待工作进程生成的压缩包都已放入队列
+            for future in published:
+                future.result()
+
+            self._finish_batch(batch_id, output_folder)
                 
         except Exception as e:
             logger.error(f"压缩批次 {batch_id} 时发生错误: {e}")
             raise
+
+    def _compress_global(self, batch_ids, source_folders, output_folders, max_workers):
+        """
+        global调度：先规划所有批次，再按原始大小从大到小执行所有压缩包
+        大小相同时按批次在输入中的顺序和压缩包序号执行，结果与执行顺序无关
+        """
+        units = []
+        remaining = {}
+        for order, (batch_id, source_folder, output_folder) in enumerate(zip(batch_ids, source_folders, output_folders)):
+            file_groups = self._scan_batch(batch_id, source_folder, output_folder)
+            if not file_groups:
+                continue
+            volumes = [v for v in self._plan_batch(batch_id, file_groups) if not self._resume_volume(v[1])]
+            remaining[batch_id] = len(volumes)
+            if not volumes:
+                self._finish_batch(batch_id, output_folder)
+            for file_counter, name, volume_files, raw_size in volumes:
+                units.append((-raw_size, order, file_counter, batch_id, output_folder, volume_files))
+        units.sort(key=lambda unit: unit[:3])
+        logger.info(f"全局调度: {len(remaining)} 个批次共 {len(units)} 个压缩包, 按原始大小从大到小执行")
+
+        errors = []
+
+        def on_done(future, batch_id, output_folder):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"压缩批次 {batch_id} 时发生错误: {e}")
+                errors.append(e)
+                return
+            with self.lock:
+                remaining[batch_id] -= 1
+                finished = remaining[batch_id] == 0
+            if finished:
+                self._finish_batch(batch_id, output_folder)
+
+        futures = []
+        if self.process_pool:
+            # 工作进程按提交顺序取任务，在主线程中依次预留并提交
+            for neg_size, _, file_counter, batch_id, output_folder, volume_files in units:
+                future = self._run_volume(batch_id, file_counter, output_folder, volume_files, -neg_size)
+                future.add_done_callback(lambda f, batch_id=batch_id, output_folder=output_folder:
+                                        on_done(f, batch_id, output_folder))
+                futures.append(future)
+            wait(futures)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for neg_size, _, file_counter, batch_id, output_folder, volume_files in units:
+                    future = executor.submit(self._run_volume, batch_id, file_counter, output_folder, volume_files, -neg_size)
+                    future.add_done_callback(lambda f, batch_id=batch_id, output_folder=output_folder:
+                                            on_done(f, batch_id, output_folder))
+                    futures.append(future)
+        if errors:
+            raise errors[0]
     
     def is_all_tasks_completed(self):
         """检查是否所有任务都已完成"""
@@ -160,6 +506,10 @@ class FileCompressor:
         """获取压缩文件队列"""
         return self.compressed_files_queue
 
+    def get_queue_stats(self):
+        """获取队列深度和待上传字节数"""
+        return self.compressed_files_queue.gauges()
+
 # 示例使用
 if __name__ == "__main__":
     # 示例数据
@@ -0,0 +1,101 @@
+import time
+import logging
+import posixpath
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteFileState:
+    """缓存中的远程文件状态"""
+    def __init__(self, size, mtime):
+        self.size = size
+        self.mtime = mtime
+
+
+class RemoteStateCache:
+    """
+    远程目录状态缓存
+
+    每个远程目录只用listdir_attr列一次(过期后重新列出)，之后的存在性、大小、修改时间
+    查询都从内存返回；已创建或确认存在的目录不再stat/mkdir。
+    本进程上传完成的文件由record_upload写入缓存；其他进程写入的文件在ttl过期前看不到，
+    这种情况下只会重复上传覆盖，不会跳过应上传的文件。
+
+    Args:
+        ttl: 目录列表的有效秒数，None表示整个运行期间只列一次
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.listings = {}       # 目录 -> {文件名: RemoteFileState}，目录不存在时为None
+        self.loaded_at = {}      # 目录 -> 列出时间
+        self.dir_locks = {}
+        self.list_count = 0
+
+    def _dir_lock(self, remote_dir):
+        with self.lock:
+            return self.dir_locks.setdefault(remote_dir, threading.Lock())
+
+    def _fresh(self, remote_dir):
+        loaded_at = self.loaded_at.get(remote_dir)
+        return loaded_at is not None and (self.ttl is None or time.monotonic() - loaded_at < self.ttl)
+
+    def _load(self, sftp, remote_dir):
+        """目录列表过期时重新列出，同一目录只有一个线程去列"""
+        with self.lock:
+            if self._fresh(remote_dir):
+                return
+        with self._dir_lock(remote_dir):
+            with self.lock:
+                if self._fresh(remote_dir):
+                    return
+            try:
+                listing = {a.filename: RemoteFileState(a.st_size, a.st_mtime) for a in sftp.listdir_attr(remote_dir)}
+            except FileNotFoundError:
+                listing = None
+            with self.lock:
+                self.listings[remote_dir] = listing
+                self.loaded_at[remote_dir] = time.monotonic()
+                self.list_count += 1
+            logger.debug(f"列出远程目录: {remote_dir}, {len(listing) if listing is not None else '不存在'}")
+
+    def lookup(self, sftp, remote_file_path):
+        """返回远程文件的RemoteFileState，不存在时返回None"""
+        remote_dir, filename = posixpath.split(remote_file_path)
+        self._load(sftp, remote_dir)
+        with self.lock:
+            listing = self.listings.get(remote_dir)
+            return listing.get(filename) if listing is not None else None
+
+    def ensure_dir(self, sftp, remote_path):
+        """确认远程目录存在，不存在则创建；已确认过的目录不再产生请求"""
+        self._load(sftp, remote_path)
+        with self._dir_lock(remote_path):
+            with self.lock:
+                if self.listings.get(remote_path) is not None:
+                    return
+            try:
+                sftp.mkdir(remote_path)
+            except IOError:
+                # 其他进程可能同时创建了该目录
+                sftp.stat(remote_path)
+            logger.info(f"创建远程目录: {remote_path}")
+            with self.lock:
+                self.listings[remote_path] = {}
+
+    def record_upload(self, remote_file_path, size, mtime=None):
+        """记录本进程完成的上传"""
+        remote_dir, filename = posixpath.split(remote_file_path)
+        with self.lock:
+            listing = self.listings.get(remote_dir)
+            if listing is not None:
+                listing[filename] = RemoteFileState(size, time.time() if mtime is None else mtime)
+
+    def invalidate(self, remote_dir=None):
+        """使某个目录(默认全部)的列表过期"""
+        with self.lock:
+            if remote_dir is None:
+                self.loaded_at.clear()
+            else:
+                self.loaded_at.pop(remote_dir, None)
@@ -0,0 +1,235 @@
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+
+import shared_modules  # 把仓库根目录加入sys.path
+from retry_policy import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# 可选的路由策略
+#   legacy: 原来的规则，按batch_no的奇偶选两个路径，再按文件名中n的奇偶选其中一个
+#   consistent_hash: 按文件名在一致性哈希环上选择，同名文件总是落在同一目标，权重决定虚拟节点数
+#   weighted_round_robin: 平滑加权轮询，权重随实测吞吐调整
+#   least_outstanding_bytes: 选择预计最早完成的目标，即(在途字节数 + 本文件大小) / 实测吞吐最小
+STRATEGIES = ('legacy', 'consistent_hash', 'weighted_round_robin', 'least_outstanding_bytes')
+
+# 实测延迟和吞吐的指数滑动平均系数
+EWMA_ALPHA = 0.3
+
+
+class TargetUnavailable(RuntimeError):
+    """begin()时目标的熔断器拒绝请求：已熔断，或半开状态的探测名额已被其他上传占用"""
+
+
+class TargetStats:
+    """单个远程目标的在途量和实测数据"""
+    def __init__(self, target, weight):
+        self.target = target
+        self.weight = weight
+        self.current_weight = 0
+        self.outstanding_bytes = 0
+        self.outstanding_count = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.busy_seconds = 0.0
+        self.busy_since = None
+        self.latency = None
+        self.throughput = None
+
+    def record(self, size, elapsed, ok):
+        if not ok:
+            self.failed += 1
+            return
+        self.completed += 1
+        self.bytes_done += size
+        self.latency = elapsed if self.latency is None else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency
+        if elapsed > 0 and size > 0:
+            rate = size / elapsed
+            self.throughput = rate if self.throughput is None else EWMA_ALPHA * rate + (1 - EWMA_ALPHA) * self.throughput
+
+
+class RemoteRouter:
+    """
+    为压缩包选择远程路径，按begin()/finish()统计的在途字节数和实测吞吐调整后续选择
+    权重为0的目标不再分配新文件；每个目标有一个熔断器，打开期间文件改路由到其他健康目标
+
+    Args:
+        targets: 远程路径列表
+        strategy: 路由策略，见STRATEGIES
+        weights: {远程路径: 权重}，默认都为1
+        virtual_nodes: 一致性哈希环上每单位权重的虚拟节点数
+        failure_threshold: 打开熔断器的连续失败次数
+        reset_timeout: 熔断器打开后多少秒放行一个探测请求
+    """
+    def __init__(self, targets, strategy='legacy', weights=None, virtual_nodes=64, failure_threshold=5, reset_timeout=30.0):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"不支持的路由策略: {strategy}")
+        self.targets = list(targets)
+        self.strategy = strategy
+        self.virtual_nodes = virtual_nodes
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.stats = {t: TargetStats(t, (weights or {}).get(t, 1)) for t in self.targets}
+        self.breakers = {t: CircuitBreaker(t, failure_threshold, reset_timeout) for t in self.targets}
+        self.ring = []
+        self._build_ring()
+
+    def _build_ring(self):
+        ring = []
+        for target in self.targets:
+            for n in range(int(self.stats[target].weight * self.virtual_nodes)):
+                ring.append((self._hash(f"{target}#{n}"), target))
+        ring.sort()
+        self.ring = ring
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def set_weight(self, target, weight):
+        """调整目标的权重，0表示不再分配新文件"""
+        with self.lock:
+            self.stats[target].weight = weight
+            self._build_ring()
+        logger.info(f"远程路径 {target} 的权重调整为 {weight}")
+
+    def is_available(self, target):
+        """目标的熔断器是否允许发送请求"""
+        return self.breakers[target].is_available()
+
+    def choose(self, filename, batch_no=0, size=0):
+        """为文件选择远程路径，跳过熔断中的目标，全部不可用时抛出RuntimeError；不占用探测名额"""
+        with self.lock:
+            available = [t for t in self.targets
+                         if (self.strategy == 'legacy' or self.stats[t].weight > 0) and self.breakers[t].is_available()]
+            if not available:
+                raise RuntimeError("没有可用的远程路径")
+            if self.strategy == 'legacy':
+                target = self._legacy(filename, batch_no)
+                if target not in available:
+                    target = self._consistent_hash(filename, available)
+            elif self.strategy == 'consistent_hash':
+                target = self._consistent_hash(filename, available)
+            elif self.strategy == 'weighted_round_robin':
+                target = self._weighted_round_robin(available)
+            else:
+                target = self._least_outstanding_bytes(available, size)
+            return target
+
+    def _legacy(self, filename, batch_no):
+        try:
+            # 提取batchid_n.zip中的n
+            n = int(filename.split('_')[1].split('.')[0])
+            # 先根据batch_no选择两个路径
+            if batch_no % 2 == 0:
+                selected_paths = [self.targets[0], self.targets[1]]
+            else:
+                selected_paths = [self.targets[2], self.targets[3]]
+            # 再根据n选择其中一个
+            return selected_paths[n % 2]
+        except:
+            # 如果无法解析，使用默认路径
+            return self.targets[0]
+
+    def _consistent_hash(self, filename, available):
+        """沿哈希环顺时针找到第一个可用的目标"""
+        key = self._hash(filename)
+        pos = bisect.bisect(self.ring, (key, ''))
+        for n in range(len(self.ring)):
+            target = self.ring[(pos + n) % len(self.ring)][1]
+            if target in available:
+                return target
+        return available[key % len(available)]
+
+    def _effective_weight(self, stats, available):
+        """配置的权重乘以实测吞吐相对平均值的比例，还没有实测数据时按平均值计算"""
+        measured = [self.stats[t].throughput for t in available if self.stats[t].throughput]
+        if not measured or not stats.throughput:
+            return stats.weight
+        return stats.weight * stats.throughput / (sum(measured) / len(measured))
+
+    def _weighted_round_robin(self, available):
+        # 平滑加权轮询(与nginx相同)：每轮各目标加上有效权重，选最大者并减去总权重
+        weights = {t: self._effective_weight(self.stats[t], available) for t in available}
+        total = sum(weights.values())
+        for t in available:
+            self.stats[t].current_weight += weights[t]
+        best = max(available, key=lambda t: self.stats[t].current_weight)
+        self.stats[best].current_weight -= total
+        return best
+
+    def _least_outstanding_bytes(self, available, size):
+        measured = [self.stats[t].throughput for t in available if self.stats[t].throughput]
+        default = sum(measured) / len(measured) if measured else 1.0
+
+        def finish_time(t):
+            stats = self.stats[t]
+            rate = (stats.throughput or default) * stats.weight
+            return ((stats.outstanding_bytes + size) / rate, stats.outstanding_count)
+        return min(available, key=finish_time)
+
+    def begin(self, target, size):
+        """
+        开始向target上传size字节，必须与finish()成对调用
+        半开状态的目标由此占用探测名额，熔断器不允许时抛出TargetUnavailable，不需要调用finish()
+        """
+        if not self.breakers[target].allow():
+            raise TargetUnavailable(f"远程路径 {target} 不可用")
+        with self.lock:
+            stats = self.stats[target]
+            if stats.outstanding_count == 0:
+                stats.busy_since = time.monotonic()
+            stats.outstanding_bytes += size
+            stats.outstanding_count += 1
+
+    def finish(self, target, size, elapsed, ok=True, begun_size=None):
+        """上传结束，记录耗时和结果；begun_size为begin()时的字节数，默认与size相同"""
+        with self.lock:
+            stats = self.stats[target]
+            stats.outstanding_bytes -= size if begun_size is None else begun_size
+            stats.outstanding_count -= 1
+            if stats.outstanding_count == 0 and stats.busy_since is not None:
+                stats.busy_seconds += time.monotonic() - stats.busy_since
+                stats.busy_since = None
+            stats.record(size, elapsed, ok)
+        if ok:
+            self.breakers[target].record_success()
+        else:
+            self.breakers[target].record_failure()
+
+    def utilisation(self):
+        """每个目标的使用情况：占用时间比例、字节占比、在途量、实测延迟和吞吐"""
+        with self.lock:
+            now = time.monotonic()
+            wall = max(now - self.started_at, 1e-9)
+            total_bytes = sum(s.bytes_done for s in self.stats.values())
+            report = {}
+            for target, s in self.stats.items():
+                busy = s.busy_seconds + (now - s.busy_since if s.busy_since is not None else 0)
+                report[target] = {
+                    'weight': s.weight,
+                    'busy_ratio': busy / wall,
+                    'byte_share': s.bytes_done / total_bytes if total_bytes else 0,
+                    'completed': s.completed,
+                    'failed': s.failed,
+                    'bytes_done': s.bytes_done,
+                    'outstanding_bytes': s.outstanding_bytes,
+                    'outstanding_count': s.outstanding_count,
+                    'latency': s.latency,
+                    'throughput': s.throughput,
+                    'breaker': self.breakers[target].state,
+                }
+            return report
+
+    def summary(self):
+        lines = []
+        for target, u in self.utilisation().items():
+            throughput = f"{u['throughput'] / 1024**2:.1f} MB/s" if u['throughput'] else "-"
+            lines.append(f"{target}: 占用 {u['busy_ratio']:.0%}, 字节占比 {u['byte_share']:.0%}, "
+                         f"完成 {u['completed']} 个, 失败 {u['failed']} 个, 吞吐 {throughput}, 熔断器 {u['breaker']}")
+        return "; ".join(lines)
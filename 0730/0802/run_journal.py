@@ -0,0 +1,189 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 压缩包状态：已规划 -> 已关闭(本地文件完整) -> 已上传
+STATE_PLANNED = 'planned'
+STATE_CLOSED = 'closed'
+STATE_UPLOADED = 'uploaded'
+
+
+class RunJournal:
+    """
+    生产者/消费者的持久化运行日志(SQLite)，用于中断后续跑
+
+    记录每个批次的压缩包规划(哪些文件进入哪个压缩包)、已关闭的压缩包及其大小、
+    已完成的上传及其大小和校验值。重启后FileCompressor沿用原规划，只重建未完成的压缩包，
+    Consumer根据上传记录判断远程同名文件是否完整。
+
+    同时作为内容清单：archive_sha256为生成压缩包时计算的整个文件的sha256，checksum为上传时
+    读取的数据的sha256，两者一致且远程大小一致才认为远程文件完整；members表记录每个成员的
+    路径、大小、修改时间和内容哈希，用于发现之前的压缩包中已上传过的成员。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS volumes (
+                name TEXT PRIMARY KEY,
+                batch_id TEXT NOT NULL,
+                volume_no INTEGER NOT NULL,
+                members TEXT NOT NULL,
+                raw_size INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                local_path TEXT,
+                size INTEGER,
+                remote_path TEXT,
+                checksum TEXT,
+                updated_at REAL
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(volumes)")]
+        if 'archive_sha256' not in columns:
+            self.conn.execute("ALTER TABLE volumes ADD COLUMN archive_sha256 TEXT")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS members (
+                volume TEXT NOT NULL,
+                path TEXT NOT NULL,
+                arcname TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (volume, arcname)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS members_path ON members (path, size, mtime)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS members_sha256 ON members (sha256)")
+        self.conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cursor.fetchall()
+
+    def get_plan(self, batch_id):
+        """
+        获取批次已记录的规划
+
+        Returns:
+            [(压缩包序号, 压缩包名, 成员文件列表, 原始大小), ...]，按压缩包序号排序
+        """
+        rows = self._execute(
+            "SELECT volume_no, name, members, raw_size FROM volumes WHERE batch_id = ? ORDER BY volume_no", (batch_id,))
+        return [(volume_no, name, json.loads(members), raw_size) for volume_no, name, members, raw_size in rows]
+
+    def record_plan(self, batch_id, volumes):
+        """
+        记录批次的规划，已存在的压缩包不覆盖
+
+        Args:
+            volumes: [(压缩包序号, 压缩包名, 成员文件列表, 原始大小), ...]
+        """
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO volumes (name, batch_id, volume_no, members, raw_size, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(name, batch_id, volume_no, json.dumps(members), raw_size, STATE_PLANNED, time.time())
+                 for volume_no, name, members, raw_size in volumes])
+            self.conn.commit()
+
+    def get_volume(self, name):
+        """返回压缩包记录的dict，不存在时返回None"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT name, batch_id, volume_no, state, local_path, size, remote_path, checksum, archive_sha256 "
+                "FROM volumes WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def mark_closed(self, name, local_path, size, archive_sha256=None):
+        """压缩包已完整写入本地"""
+        self._execute(
+            "UPDATE volumes SET state = ?, local_path = ?, size = ?, archive_sha256 = ?, updated_at = ? "
+            "WHERE name = ? AND state = ?",
+            (STATE_CLOSED, local_path, size, archive_sha256, time.time(), name, STATE_PLANNED))
+
+    def mark_uploaded(self, name, remote_path, size, checksum=None):
+        """压缩包已上传完成，没有规划记录的压缩包(如单独运行消费者)也会新建记录"""
+        self._execute(
+            "INSERT INTO volumes (name, batch_id, volume_no, members, raw_size, state, remote_path, size, checksum, updated_at) "
+            "VALUES (?, '', 0, '[]', 0, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET state = excluded.state, remote_path = excluded.remote_path, "
+            "size = excluded.size, checksum = excluded.checksum, updated_at = excluded.updated_at",
+            (name, STATE_UPLOADED, remote_path, size, checksum, time.time()))
+
+    def is_uploaded(self, name):
+        volume = self.get_volume(name)
+        return volume is not None and volume['state'] == STATE_UPLOADED
+
+    def is_remote_complete(self, name, remote_size):
+        """远程文件是否为完整的上传：已有上传记录，大小一致，且上传的数据与生成的压缩包sha256一致"""
+        volume = self.get_volume(name)
+        return (volume is not None and volume['state'] == STATE_UPLOADED and volume['size'] == remote_size
+                and (not volume['archive_sha256'] or volume['checksum'] == volume['archive_sha256']))
+
+    def record_members(self, volume, members):
+        """
+        记录压缩包的成员
+
+        Args:
+            members: [(文件路径, 压缩包内名称, 大小, 修改时间, 内容哈希), ...]
+        """
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO members (volume, path, arcname, size, mtime, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                [(volume, path, arcname, size, mtime, sha256) for path, arcname, size, mtime, sha256 in members])
+            self.conn.commit()
+
+    def find_shipped(self, files):
+        """
+        按路径、大小、修改时间查找已在已上传的压缩包中的文件，不读取文件内容
+
+        Args:
+            files: [(文件路径, 大小, 修改时间), ...]
+
+        Returns:
+            {文件路径: 压缩包名}
+        """
+        shipped = {}
+        with self.lock:
+            for path, size, mtime in files:
+                row = self.conn.execute(
+                    "SELECT m.volume FROM members m JOIN volumes v ON v.name = m.volume "
+                    "WHERE m.path = ? AND m.size = ? AND m.mtime = ? AND v.state = ? LIMIT 1",
+                    (path, size, mtime, STATE_UPLOADED)).fetchone()
+                if row:
+                    shipped[path] = row[0]
+        return shipped
+
+    def find_shipped_content(self, hashes, exclude_volume=None):
+        """
+        按内容哈希查找已在其他压缩包中出现过的成员(压缩包已上传或已生成)
+
+        Returns:
+            {内容哈希: 压缩包名}
+        """
+        found = {}
+        with self.lock:
+            for sha256 in hashes:
+                row = self.conn.execute(
+                    "SELECT m.volume FROM members m JOIN volumes v ON v.name = m.volume "
+                    "WHERE m.sha256 = ? AND m.volume != ? AND v.state != ? LIMIT 1",
+                    (sha256, exclude_volume or '', STATE_PLANNED)).fetchone()
+                if row:
+                    found[sha256] = row[0]
+        return found
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
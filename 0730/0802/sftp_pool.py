@@ -0,0 +1,207 @@
+import time
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+try:
+    import paramiko
+except ImportError:
+    # 只用connect_factory接入的连接(如local_sftp)时可以不安装paramiko
+    paramiko = None
+
+logger = logging.getLogger(__name__)
+
+
+def paramiko_connect(sftp_config):
+    """默认的连接工厂：建立SSH连接并打开SFTP，返回 (ssh, sftp)"""
+    if paramiko is None:
+        raise ImportError("默认的连接工厂需要安装paramiko")
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(**sftp_config)
+    return ssh, ssh.open_sftp()
+
+
+def pool_key(sftp_config):
+    """连接池的key：同一主机、端口、用户共享一组连接"""
+    return (sftp_config.get('hostname'), sftp_config.get('port', 22), sftp_config.get('username'))
+
+
+# 出现这些异常时认为连接已损坏，不再放回池中
+CONNECTION_ERRORS = (EOFError, ConnectionError, socket.timeout) + ((paramiko.SSHException,) if paramiko else ())
+
+CONNECT_SECONDS = REGISTRY.histogram('sftp_connect_seconds', '建立SSH连接并打开SFTP的耗时')
+
+
+class PooledSession:
+    """池中的一条SFTP会话"""
+    def __init__(self, key, ssh, sftp):
+        self.key = key
+        self.ssh = ssh
+        self.sftp = sftp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    def is_active(self):
+        """不产生网络往返的存活检查"""
+        transport = self.ssh.get_transport() if self.ssh else None
+        return transport is not None and transport.is_active()
+
+    def ping(self):
+        """产生一次网络往返的健康检查"""
+        try:
+            self.sftp.normalize('.')
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        for closeable in (self.sftp, self.ssh):
+            try:
+                closeable.close()
+            except Exception:
+                pass
+
+
+class SFTPConnectionPool:
+    """
+    按主机配置分组的有界、线程安全的SFTP连接池
+
+    Args:
+        max_size: 每个主机配置最多同时存在的连接数
+        idle_timeout: 空闲超过该秒数的连接会被关闭
+        health_check_interval: 空闲超过该秒数的连接在借出前做一次往返检查
+        connect_factory: 建立连接的函数，输入sftp_config，返回 (ssh, sftp)
+    """
+    def __init__(self, max_size=4, idle_timeout=300, health_check_interval=30, connect_factory=None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_factory = connect_factory or paramiko_connect
+        self.condition = threading.Condition()
+        self.idle = {}      # key -> [PooledSession, ...]
+        self.in_use = {}    # key -> 借出中的连接数
+        self.created_count = 0
+        self.reused_count = 0
+        self.closed = False
+
+    def acquire(self, sftp_config, timeout=None):
+        """借出一条会话，池满时阻塞等待，超时抛出TimeoutError"""
+        key = pool_key(sftp_config)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError("连接池已关闭")
+                self._evict_idle_locked()
+                idle = self.idle.get(key)
+                if idle:
+                    session = idle.pop()
+                    self.in_use[key] = self.in_use.get(key, 0) + 1
+                    break
+                if self.in_use.get(key, 0) < self.max_size:
+                    session = None
+                    self.in_use[key] = self.in_use.get(key, 0) + 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"等待SFTP连接超时: {key}")
+                self.condition.wait(remaining)
+
+        # 网络操作放在锁外进行
+        try:
+            if session is not None:
+                if self._is_healthy(session):
+                    with self.condition:
+                        self.reused_count += 1
+                    return session
+                logger.info(f"SFTP连接已失效，重新连接: {key}")
+                session.close()
+            return self._connect(key, sftp_config)
+        except Exception:
+            self._release_slot(key)
+            raise
+
+    def release(self, session, discard=False):
+        """归还会话，discard=True或连接已断开时直接关闭"""
+        if discard or self.closed or not session.is_active():
+            session.close()
+            self._release_slot(session.key)
+            return
+        session.last_used = time.monotonic()
+        with self.condition:
+            self.in_use[session.key] -= 1
+            self.idle.setdefault(session.key, []).append(session)
+            self.condition.notify()
+
+    @contextmanager
+    def session(self, sftp_config, timeout=None):
+        """借出会话的上下文管理器，yield SFTP客户端；连接类异常时丢弃该连接"""
+        session = self.acquire(sftp_config, timeout)
+        try:
+            yield session.sftp
+        except CONNECTION_ERRORS:
+            self.release(session, discard=True)
+            raise
+        except BaseException:
+            self.release(session)
+            raise
+        else:
+            self.release(session)
+
+    def evict_idle(self):
+        """关闭所有空闲超时的连接"""
+        with self.condition:
+            self._evict_idle_locked()
+
+    def close(self):
+        """关闭连接池及其中所有空闲连接"""
+        with self.condition:
+            self.closed = True
+            sessions = [s for idle in self.idle.values() for s in idle]
+            self.idle.clear()
+            self.condition.notify_all()
+        for session in sessions:
+            session.close()
+        logger.info(f"SFTP连接池已关闭 (新建连接: {self.created_count}, 复用连接: {self.reused_count})")
+
+    def stats(self):
+        with self.condition:
+            return {
+                'created': self.created_count,
+                'reused': self.reused_count,
+                'idle': sum(len(v) for v in self.idle.values()),
+                'in_use': sum(self.in_use.values()),
+            }
+
+    def _connect(self, key, sftp_config):
+        with CONNECT_SECONDS.time():
+            ssh, sftp = self.connect_factory(sftp_config)
+        with self.condition:
+            self.created_count += 1
+        logger.debug(f"新建SFTP连接: {key}")
+        return PooledSession(key, ssh, sftp)
+
+    def _is_healthy(self, session):
+        if not session.is_active():
+            return False
+        if time.monotonic() - session.last_used > self.health_check_interval:
+            return session.ping()
+        return True
+
+    def _release_slot(self, key):
+        with self.condition:
+            self.in_use[key] -= 1
+            self.condition.notify()
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        for key, idle in self.idle.items():
+            expired = [s for s in idle if now - s.last_used > self.idle_timeout]
+            if expired:
+                idle[:] = [s for s in idle if s not in expired]
+                for session in expired:
+                    session.close()
+                logger.debug(f"关闭 {len(expired)} 条空闲SFTP连接: {key}")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 仓库根目录下的共享模块(compression_policy、zip_volume、retry_policy等)，本目录的模块导入它们之前先导入本模块
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# 被测模块是上一级目录中的脚本，按脚本方式直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import shared_modules  # 把仓库根目录加入sys.path
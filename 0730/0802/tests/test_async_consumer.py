@@ -0,0 +1,48 @@
+import os
+import asyncio
+import local_sftp
+from async_consumer import AsyncFileProcessor
+from local_sftp import LocalSFTPServer
+from retry_policy import RetryPolicy
+from run_journal import RunJournal
+
+
+def upload(tmp_path, journal):
+    server = LocalSFTPServer(str(tmp_path / 'remote'))
+    processor = AsyncFileProcessor(remote_paths=['/r1', '/r2', '/r3', '/r4'], journal=journal, connections=1,
+                                   channels_per_connection=1, connect=server.connect_async,
+                                   retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01))
+    path = tmp_path / 'b1_01.zip'
+    path.write_bytes(os.urandom(5000))
+
+    async def run():
+        processor.start()
+        try:
+            return await processor.process_compressed_file_async(str(path), batch_no=2)
+        finally:
+            await processor.close_async()
+    return asyncio.run(run())
+
+
+def test_upload_marks_journal(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.db'))
+    assert upload(tmp_path, journal)
+    volume = journal.get_volume('b1_01.zip')
+    assert volume['remote_path'] == '/r2/b1_01.zip' and volume['size'] == 5000
+    journal.close()
+
+
+def test_truncated_upload_not_marked(tmp_path, monkeypatch):
+    put = local_sftp.LocalAsyncSFTPClient.put
+
+    async def truncated_put(self, localpath, remotepath=None, **kwargs):
+        await put(self, localpath, remotepath, **kwargs)
+        with open(self.client._local(remotepath), 'r+b') as f:
+            f.truncate(1000)
+    monkeypatch.setattr(local_sftp.LocalAsyncSFTPClient, 'put', truncated_put)
+    journal = RunJournal(str(tmp_path / 'journal.db'))
+    # 每次上传后远程文件都不完整，重试后仍失败，不记为已上传
+    assert not upload(tmp_path, journal)
+    volume = journal.get_volume('b1_01.zip')
+    assert volume is None or not volume['remote_path']
+    journal.close()
@@ -0,0 +1,46 @@
+import os
+import time
+import threading
+from backpressure_queue import BackpressureQueue, STOP_SENTINEL
+from producer import FileCompressor
+
+
+def test_sentinel_not_timed():
+    queue = BackpressureQueue()
+    queue.put('a.zip', nbytes=10)
+    queue.put(STOP_SENTINEL)
+    assert list(queue.enqueued_at) == ['a.zip']
+    assert queue.get() == 'a.zip' and queue.wait_time('a.zip') is not None
+    assert queue.get() is STOP_SENTINEL and queue.wait_time(STOP_SENTINEL) is None
+    assert queue.enqueued_at == {}
+
+
+def test_producer_blocks_at_pending_bytes_limit(tmp_path):
+    source = str(tmp_path / 'src')
+    output = str(tmp_path / 'out')
+    os.makedirs(source)
+    for n in range(3):
+        with open(os.path.join(source, f'r{n}.wav'), 'wb') as f:
+            f.write(os.urandom(6000))
+        with open(os.path.join(source, f'r{n}.json'), 'w') as f:
+            f.write('{}')
+    # 每个压缩包一对文件，待上传的字节数只够一个压缩包
+    compressor = FileCompressor(max_size=10000 / 1024**3, max_pending_size=10000 / 1024**3)
+    thread = threading.Thread(target=compressor.compress_files, args=(['b1'], [source], [output]), kwargs={'max_workers': 1})
+    thread.start()
+    queue = compressor.get_queue()
+    first = queue.get(timeout=5)
+    time.sleep(0.3)
+    # 第一个压缩包还没上传完成，生产者阻塞在预留字节数上
+    assert thread.is_alive()
+    assert queue.qsize() == 0
+    assert queue.gauges()['blocked_count'] == 1
+    assert sorted(os.listdir(output)) == ['b1_01.zip', 'b1_01.zip.idx.json']
+    for expected in ('b1_02.zip', 'b1_03.zip'):
+        queue.item_done(first)
+        first = queue.get(timeout=5)
+        assert os.path.basename(first) == expected
+    queue.item_done(first)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert queue.gauges()['pending_bytes'] == 0
@@ -0,0 +1,50 @@
+import os
+import zlib
+import zipfile
+from compression_policy import CompressionPolicy
+from producer import FileCompressor
+from zip_volume import read_index, max_group_bytes, volume_budget
+
+MAX_SIZE = 100000
+
+
+def make_source(folder):
+    os.makedirs(folder)
+    # 不可压缩的wav按STORED和deflate各写一些，非ASCII文件名检查按UTF-8计算的偏移
+    for stem in ('r0', 'r1', '录音2'):
+        with open(os.path.join(folder, f'{stem}.wav'), 'wb') as f:
+            f.write(os.urandom(40000))
+        with open(os.path.join(folder, f'{stem}.json'), 'w') as f:
+            f.write('{"text": "%s"}' % ('a' * 2000))
+
+
+def test_index_offsets_match_archive(tmp_path):
+    source = str(tmp_path / 'src')
+    output = str(tmp_path / 'out')
+    make_source(source)
+    policy = CompressionPolicy(rules={'.wav': (zipfile.ZIP_STORED, None)}, zero_copy=False)
+    compressor = FileCompressor(max_size=MAX_SIZE / 1024**3, policy=policy)
+    # 默认按输出字节数的最坏情况规划
+    assert compressor.max_volume_bytes == MAX_SIZE
+    compressor.compress_files(['b1'], [source], [output])
+    volumes = sorted(name for name in os.listdir(output) if name.endswith('.zip'))
+    assert volumes == ['b1_01.zip', 'b1_02.zip']
+
+    for name in volumes:
+        path = os.path.join(output, name)
+        assert os.path.getsize(path) <= MAX_SIZE
+        index = read_index(path + '.idx.json')
+        assert index['size'] == os.path.getsize(path)
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+            members = [os.path.join(source, m) for m in zf.namelist()]
+            assert max_group_bytes(members) <= volume_budget(MAX_SIZE)
+            assert [e['arcname'] for e in index['members']] == zf.namelist()
+            for entry in index['members']:
+                f.seek(entry['header_offset'])
+                assert f.read(4) == b'PK\x03\x04'
+                f.seek(entry['data_offset'])
+                raw = f.read(entry['compress_size'])
+                data = zlib.decompress(raw, -15) if entry['method'] == zipfile.ZIP_DEFLATED else raw
+                assert data == zf.read(entry['arcname'])
+                assert zlib.crc32(data) == entry['crc']
+                assert len(data) == entry['file_size']
@@ -0,0 +1,87 @@
+import os
+import shutil
+import zipfile
+from member_reader import MemberReader, iter_member
+from local_sftp import LocalSFTPServer
+from producer import FileCompressor
+from run_journal import RunJournal
+from sftp_pool import SFTPConnectionPool
+
+SFTP_CONFIG = {'hostname': 'localhost', 'port': 22, 'username': 'user'}
+
+
+class CountingFile:
+    """记录读取的字节数"""
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes_read = 0
+
+    def seek(self, offset):
+        self.fp.seek(offset)
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def build(tmp_path):
+    source = str(tmp_path / 'src')
+    output = str(tmp_path / 'out')
+    os.makedirs(source)
+    for n in range(6):
+        with open(os.path.join(source, f't{n}.wav'), 'wb') as f:
+            f.write(os.urandom(30000) + bytes(30000))
+        with open(os.path.join(source, f't{n}.json'), 'w') as f:
+            f.write('{"id": %d}' % n)
+    compressor = FileCompressor(max_size=150000 / 1024**3)
+    compressor.compress_files(['b1'], [source], [output])
+    return output
+
+
+def volume_of(output, arcname):
+    for name in sorted(os.listdir(output)):
+        if name.endswith('.zip'):
+            with zipfile.ZipFile(os.path.join(output, name)) as zf:
+                if arcname in zf.namelist():
+                    return name, zf.read(arcname)
+
+
+def test_extract_matches_zipfile(tmp_path):
+    output = build(tmp_path)
+    reader = MemberReader([output], chunk_size=4096)
+    found = reader.find('t4', 'b1')
+    assert sorted(entry['arcname'] for _, entry in found) == ['t4.json', 't4.wav']
+    for path in reader.extract('t4', str(tmp_path / 'dest')):
+        name, expected = volume_of(output, os.path.basename(path))
+        with open(path, 'rb') as f:
+            assert f.read() == expected
+
+    # 只读取文件头和该成员的压缩数据
+    entry = next(entry for _, entry in found if entry['arcname'] == 't4.wav')
+    with open(os.path.join(output, entry['volume']), 'rb') as f:
+        counting = CountingFile(f)
+        assert b''.join(iter_member(counting, entry, 4096)) == volume_of(output, 't4.wav')[1]
+    assert counting.bytes_read == 30 + entry['compress_size']
+    assert counting.bytes_read < os.path.getsize(os.path.join(output, entry['volume'])) / 2
+
+
+def test_extract_from_remote_volume(tmp_path):
+    output = build(tmp_path)
+    expected = volume_of(output, 't1.wav')
+    # 本地压缩包已删除，按运行日志记录的远程路径读取
+    server = LocalSFTPServer(str(tmp_path / 'remote'))
+    os.makedirs(os.path.join(server.root, 'r1'))
+    journal = RunJournal(str(tmp_path / 'journal.db'))
+    for name in os.listdir(output):
+        if name.endswith('.zip'):
+            shutil.move(os.path.join(output, name), os.path.join(server.root, 'r1', name))
+            journal.mark_uploaded(name, f'/r1/{name}', os.path.getsize(os.path.join(server.root, 'r1', name)))
+    pool = SFTPConnectionPool(max_size=1, connect_factory=server.connect)
+    reader = MemberReader([output], journal, sftp_config=SFTP_CONFIG, pool=pool, chunk_size=4096)
+    paths = reader.extract('t1', str(tmp_path / 'dest'))
+    with open(os.path.join(str(tmp_path / 'dest'), 't1.wav'), 'rb') as f:
+        assert f.read() == expected[1]
+    assert len(paths) == 2
+    reader.close()
+    journal.close()
@@ -0,0 +1,37 @@
+import os
+import zlib
+import zipfile
+from content_hash import HASH_BLOCK, ContentHasher, hash_file
+from parallel_deflate import ParallelDeflater, crc32_combine
+
+
+def test_crc32_combine():
+    a = os.urandom(1000)
+    b = os.urandom(777)
+    assert crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+    assert crc32_combine(zlib.crc32(a), zlib.crc32(b''), 0) == zlib.crc32(a)
+    assert crc32_combine(0, zlib.crc32(b), len(b)) == zlib.crc32(b)
+
+
+def test_chunked_members_match_serial_zip(tmp_path):
+    sizes = {'empty.wav': 0, 'small.json': 5, 'large.wav': 3 * HASH_BLOCK + 17}
+    paths = []
+    for name, size in sizes.items():
+        path = tmp_path / name
+        path.write_bytes(os.urandom(size // 2) + b'a' * (size - size // 2))
+        paths.append(str(path))
+    hashers = [ContentHasher() for _ in paths]
+    archive = tmp_path / 'out.zip'
+    deflater = ParallelDeflater(workers=2, chunk_size=HASH_BLOCK)
+    try:
+        with zipfile.ZipFile(archive, 'w') as zf:
+            deflater.write_members(zf, [(p, os.path.basename(p)) for p in paths], hashers)
+    finally:
+        deflater.close()
+
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+        for path in paths:
+            with open(path, 'rb') as f:
+                assert zf.read(os.path.basename(path)) == f.read()
+    assert [h.hexdigest() for h in hashers] == [hash_file(p) for p in paths]
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import pytest
+from consumer import FileProcessor
+from local_sftp import LocalSFTPServer
+from remote_router import RemoteRouter, TargetUnavailable
+from retry_policy import CLOSED, OPEN, RetryPolicy
+from run_journal import RunJournal
+from sftp_pool import SFTPConnectionPool
+
+
+def make_router():
+    return RemoteRouter(['/a', '/b'], strategy='least_outstanding_bytes', failure_threshold=1, reset_timeout=0.05)
+
+
+def fail(router, target):
+    router.begin(target, 10)
+    router.finish(target, 10, 0.1, ok=False)
+
+
+def test_open_breaker_reroutes():
+    router = make_router()
+    fail(router, '/a')
+    assert not router.is_available('/a')
+    assert router.choose('b_1.zip', size=10) == '/b'
+
+
+def test_half_open_probe_closes_breaker():
+    router = make_router()
+    fail(router, '/a')
+    time.sleep(0.06)
+    # 选择目标不占用探测名额，选中后没有上传也不会让目标一直不可用
+    router.choose('b_1.zip', size=10)
+    assert router.is_available('/a')
+    router.begin('/a', 10)
+    assert not router.is_available('/a')
+    router.finish('/a', 10, 0.1)
+    assert router.breakers['/a'].state == CLOSED
+    assert router.is_available('/a')
+
+
+def test_failed_probe_reopens_breaker():
+    router = make_router()
+    fail(router, '/a')
+    time.sleep(0.06)
+    fail(router, '/a')
+    assert router.breakers['/a'].state == OPEN
+    assert not router.is_available('/a')
+
+
+def test_concurrent_begin_claims_one_probe():
+    router = make_router()
+    fail(router, '/a')
+    time.sleep(0.06)
+    barrier = threading.Barrier(2)
+    results = []
+
+    def probe():
+        barrier.wait()
+        try:
+            router.begin('/a', 10)
+            results.append(True)
+        except TargetUnavailable:
+            results.append(False)
+
+    threads = [threading.Thread(target=probe) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == [False, True]
+    # 被拒绝的begin()不计入在途量
+    assert router.stats['/a'].outstanding_count == 1
+
+
+def make_processor(tmp_path, router, journal=None):
+    server = LocalSFTPServer(str(tmp_path / 'remote'))
+    pool = SFTPConnectionPool(max_size=2, connect_factory=server.connect)
+    processor = FileProcessor(remote_paths=router.targets, pool=pool, router=router, journal=journal,
+                              retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01))
+    path = tmp_path / 'b1_01.zip'
+    path.write_bytes(os.urandom(1000))
+    return processor, server, str(path)
+
+
+def test_refused_probe_reroutes_upload(tmp_path):
+    router = make_router()
+    processor, server, path = make_processor(tmp_path, router)
+    fail(router, '/a')
+    time.sleep(0.06)
+    # 选择'/a'后探测名额被其他上传占用，上传改到'/b'，不计为'/a'的失败
+    processor.route = lambda *args: '/a'
+    router.begin('/a', 10)
+    assert processor.process_compressed_file(path)
+    assert os.path.exists(os.path.join(server.root, 'b', 'b1_01.zip'))
+    assert router.stats['/a'].outstanding_count == 1
+    assert router.breakers['/a'].failures == 1
+
+
+def test_route_skips_open_journal_path(tmp_path):
+    router = make_router()
+    journal = RunJournal(str(tmp_path / 'journal.db'))
+    processor, server, path = make_processor(tmp_path, router, journal)
+    journal.mark_uploaded('b1_01.zip', '/a/b1_01.zip', 1000)
+    assert processor.route(path, 1) == '/a'
+    fail(router, '/a')
+    assert processor.route(path, 1) == '/b'
+    journal.close()
+
+
+NAMES = [f'b{n % 7}_{n:02d}.zip' for n in range(3000)]
+
+
+def shares(router, names=NAMES, size=0):
+    counts = {t: 0 for t in router.targets}
+    for name in names:
+        counts[router.choose(name, size=size)] += 1
+    return counts
+
+
+def test_consistent_hash_distribution():
+    router = RemoteRouter(['/a', '/b', '/c'], strategy='consistent_hash', weights={'/c': 2})
+    counts = shares(router)
+    assert 0.15 < counts['/a'] / len(NAMES) < 0.35
+    assert 0.15 < counts['/b'] / len(NAMES) < 0.35
+    assert 0.35 < counts['/c'] / len(NAMES) < 0.65
+    # 同名文件总是选中同一目标
+    assert shares(router) == counts
+
+
+@pytest.mark.parametrize('remove', ['weight', 'breaker'])
+def test_consistent_hash_removed_target(remove):
+    router = RemoteRouter(['/a', '/b', '/c'], strategy='consistent_hash', failure_threshold=1)
+    before = {name: router.choose(name) for name in NAMES}
+    if remove == 'weight':
+        router.set_weight('/c', 0)
+    else:
+        fail(router, '/c')
+    after = {name: router.choose(name) for name in NAMES}
+    # 只有原来在'/c'上的文件改变目标，并分散到其余目标
+    assert '/c' not in after.values()
+    assert all(after[name] == target for name, target in before.items() if target != '/c')
+    moved = [after[name] for name, target in before.items() if target == '/c']
+    assert moved.count('/a') > len(moved) / 5 and moved.count('/b') > len(moved) / 5
+
+
+def test_weighted_round_robin_distribution():
+    router = RemoteRouter(['/a', '/b', '/c'], strategy='weighted_round_robin', weights={'/a': 3, '/b': 1, '/c': 0})
+    picks = [router.choose('x.zip') for _ in range(400)]
+    assert picks.count('/a') == 300 and picks.count('/b') == 100 and '/c' not in picks
+    # 平滑轮询：每4次中'/b'出现一次，不会连续挤在一起
+    assert all(picks[n:n + 4].count('/b') == 1 for n in range(0, 400, 4))
+    router.set_weight('/c', 1)
+    counts = shares(router, NAMES[:500])
+    assert counts == {'/a': 300, '/b': 100, '/c': 100}
+
+
+def test_weighted_round_robin_skips_open_breaker():
+    router = RemoteRouter(['/a', '/b'], strategy='weighted_round_robin', failure_threshold=1)
+    fail(router, '/a')
+    assert {router.choose('x.zip') for _ in range(10)} == {'/b'}
+
+
+def test_weighted_round_robin_follows_throughput():
+    router = RemoteRouter(['/a', '/b'], strategy='weighted_round_robin')
+    # '/a'的实测吞吐是'/b'的3倍，有效权重为1.5:0.5
+    for target, elapsed in (('/a', 1.0), ('/b', 3.0)):
+        router.begin(target, 3000)
+        router.finish(target, 3000, elapsed)
+    picks = [router.choose('x.zip') for _ in range(400)]
+    assert picks.count('/a') == 300
+
+
+def test_least_outstanding_bytes_balances_in_flight():
+    router = RemoteRouter(['/a', '/b', '/c'], strategy='least_outstanding_bytes', weights={'/a': 2, '/c': 0})
+    # 上传都未完成时，按权重分配在途字节数
+    for name in NAMES[:300]:
+        router.begin(router.choose(name, size=1000), 1000)
+    assert router.stats['/a'].outstanding_bytes == 200000
+    assert router.stats['/b'].outstanding_bytes == 100000
+    assert router.stats['/c'].outstanding_count == 0
+    # 一个大文件在途时，新文件都去另一个目标
+    router = RemoteRouter(['/a', '/b'], strategy='least_outstanding_bytes')
+    router.begin('/a', 10**9)
+    assert shares(router, NAMES[:50], size=1000) == {'/a': 0, '/b': 50}
+
+
+def test_least_outstanding_bytes_without_available_target():
+    router = RemoteRouter(['/a', '/b'], strategy='least_outstanding_bytes', weights={'/b': 0}, failure_threshold=1)
+    fail(router, '/a')
+    with pytest.raises(RuntimeError):
+        router.choose('x.zip', size=1000)
@@ -0,0 +1,11 @@
+from retry_policy import RetryPolicy, RetryBudget
+
+
+def test_retries_do_not_refill_budget():
+    budget = RetryBudget(ratio=0.5, min_tokens=0)
+    policy = RetryPolicy(max_attempts=5, base_delay=0, budget=budget)
+    # 第一次请求存入0.5个令牌，不够一次重试，失败后不再重试
+    assert policy.call(lambda: False) == (False, 1)
+    # 第二次请求再存入0.5个令牌，可以重试一次；重试本身不存入令牌
+    assert policy.call(lambda: False) == (False, 2)
+    assert budget.tokens == 0
@@ -0,0 +1,46 @@
+import os
+import zipfile
+from producer import FileCompressor
+from run_journal import RunJournal, STATE_CLOSED
+
+
+def make_source(folder, count):
+    os.makedirs(folder)
+    for n in range(count):
+        with open(os.path.join(folder, f'r{n}.wav'), 'wb') as f:
+            f.write(os.urandom(6000))
+        with open(os.path.join(folder, f'r{n}.json'), 'w') as f:
+            f.write('{}')
+
+
+def compress(journal, source, output):
+    compressor = FileCompressor(max_size=10000 / 1024**3, journal=journal)
+    compressor.compress_files(['b1'], [source], [output])
+    queue = compressor.get_queue()
+    return sorted(os.path.basename(queue.get()) for _ in range(queue.qsize()))
+
+
+def test_resume_skips_finished_volumes(tmp_path):
+    source = str(tmp_path / 'src')
+    output = str(tmp_path / 'out')
+    make_source(source, 3)
+    journal = RunJournal(str(tmp_path / 'journal.db'))
+    first = compress(journal, source, output)
+    assert first == ['b1_01.zip', 'b1_02.zip', 'b1_03.zip']
+    assert all(journal.get_volume(name)['state'] == STATE_CLOSED for name in first)
+
+    journal.mark_uploaded('b1_01.zip', '/remote/b1_01.zip', os.path.getsize(os.path.join(output, 'b1_01.zip')))
+    mtimes = {name: os.path.getmtime(os.path.join(output, name)) for name in first}
+    # 已上传的不再放入队列，已关闭的直接重新放入队列，都不重新生成
+    assert compress(journal, source, output) == ['b1_02.zip', 'b1_03.zip']
+    assert mtimes == {name: os.path.getmtime(os.path.join(output, name)) for name in first}
+
+    # 新到的文件追加为新的压缩包，已记录的规划不变
+    with open(os.path.join(source, 'new.wav'), 'wb') as f:
+        f.write(os.urandom(6000))
+    with open(os.path.join(source, 'new.json'), 'w') as f:
+        f.write('{}')
+    assert compress(journal, source, output) == ['b1_02.zip', 'b1_03.zip', 'b1_04.zip']
+    with zipfile.ZipFile(os.path.join(output, 'b1_04.zip')) as zf:
+        assert sorted(zf.namelist()) == ['new.json', 'new.wav']
+    journal.close()
@@ -0,0 +1,56 @@
+import pytest
+from local_sftp import LocalSFTPServer
+from sftp_pool import SFTPConnectionPool
+
+SFTP_CONFIG = {'hostname': 'localhost', 'port': 22, 'username': 'user'}
+
+
+@pytest.fixture
+def server(tmp_path):
+    return LocalSFTPServer(str(tmp_path / 'remote'))
+
+
+def test_sessions_are_reused(server):
+    pool = SFTPConnectionPool(max_size=2, connect_factory=server.connect)
+    for _ in range(3):
+        with pool.session(SFTP_CONFIG) as sftp:
+            sftp.listdir('/')
+    assert server.connect_count == 1
+    assert pool.stats() == {'created': 1, 'reused': 2, 'idle': 1, 'in_use': 0}
+
+
+def test_reconnects_after_idle_session_dropped(server):
+    pool = SFTPConnectionPool(max_size=2, connect_factory=server.connect)
+    with pool.session(SFTP_CONFIG) as sftp:
+        sftp.mkdir('/a')
+    server.disconnect_all()
+    with pool.session(SFTP_CONFIG) as sftp:
+        assert sftp.listdir('/') == ['a']
+    assert server.connect_count == 2
+
+
+def test_session_dropped_during_use_is_discarded(server):
+    pool = SFTPConnectionPool(max_size=1, connect_factory=server.connect)
+    with pytest.raises(EOFError):
+        with pool.session(SFTP_CONFIG) as sftp:
+            server.disconnect_all()
+            sftp.listdir('/')
+    assert pool.stats()['idle'] == 0
+    # 丢弃的连接释放了名额，max_size=1时也能立即借到新连接
+    with pool.session(SFTP_CONFIG, timeout=1) as sftp:
+        sftp.listdir('/')
+    assert server.connect_count == 2
+
+
+def test_close_closes_idle_and_returned_sessions(server):
+    pool = SFTPConnectionPool(max_size=2, connect_factory=server.connect)
+    idle = pool.acquire(SFTP_CONFIG)
+    busy = pool.acquire(SFTP_CONFIG)
+    pool.release(idle)
+    pool.close()
+    assert not idle.is_active()
+    assert busy.is_active()
+    pool.release(busy)
+    assert not busy.is_active()
+    with pytest.raises(RuntimeError):
+        pool.acquire(SFTP_CONFIG)
@@ -0,0 +1,139 @@
+import os
+import time
+import queue
+import zipfile
+import threading
+import pytest
+import watch_producer
+from producer import FileCompressor
+from watch_producer import WatchCompressor
+from zip_volume import END_RECORDS_SIZE, max_member_bytes
+
+WAV_SIZE = 5000
+
+
+class FakeWatcher:
+    """由测试推送就绪事件的监视器"""
+    def __init__(self):
+        self.events = queue.Queue()
+        self.polling = threading.Event()
+
+    def poll(self, timeout):
+        self.polling.set()
+        try:
+            return [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    fake = FakeWatcher()
+    monkeypatch.setattr(watch_producer, 'make_watcher', lambda folders, settle: fake)
+    return fake
+
+
+def pair_bytes(stem):
+    return max_member_bytes(WAV_SIZE, f'{stem}.wav') + max_member_bytes(2, f'{stem}.json')
+
+
+def write_pair(watcher, folder, stem):
+    for suffix, data in (('.wav', os.urandom(WAV_SIZE)), ('.json', b'{}')):
+        path = os.path.join(folder, stem + suffix)
+        with open(path, 'wb') as f:
+            f.write(data)
+        watcher.events.put(path)
+
+
+def start(compressor, batch_ids, sources, outputs, watcher, max_delay=60.0):
+    for folder in sources:
+        os.makedirs(folder)
+    producer = WatchCompressor(compressor, max_delay=max_delay)
+    thread = threading.Thread(target=producer.run, args=(batch_ids, sources, outputs))
+    thread.start()
+    assert watcher.polling.wait(5)
+    return producer, thread
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def members(path):
+    with zipfile.ZipFile(path) as zf:
+        return sorted(zf.namelist())
+
+
+def test_seals_when_full(tmp_path, watcher):
+    source, output = str(tmp_path / 'src'), str(tmp_path / 'out')
+    # 正好放下两对文件
+    max_bytes = pair_bytes('p0') + pair_bytes('p1') + END_RECORDS_SIZE
+    compressor = FileCompressor(max_size=max_bytes / 1024**3)
+    producer, thread = start(compressor, ['b1'], [source], [output], watcher)
+    try:
+        for n in range(3):
+            write_pair(watcher, source, f'p{n}')
+        first = compressor.get_queue().get(timeout=5)
+        assert os.path.basename(first) == 'b1_01.zip'
+        assert members(first) == ['p0.json', 'p0.wav', 'p1.json', 'p1.wav']
+        assert os.path.getsize(first) <= max_bytes
+        # 第三对文件放入新的压缩包，不关闭
+        wait_until(lambda: producer.volumes)
+        assert compressor.get_queue().empty()
+    finally:
+        producer.stop()
+        thread.join()
+    last = compressor.get_queue().get(timeout=1)
+    assert os.path.basename(last) == 'b1_02.zip'
+    assert members(last) == ['p2.json', 'p2.wav']
+
+
+def test_seals_after_max_delay(tmp_path, watcher):
+    source, output = str(tmp_path / 'src'), str(tmp_path / 'out')
+    compressor = FileCompressor(max_size=1)
+    producer, thread = start(compressor, ['b1'], [source], [output], watcher, max_delay=0.2)
+    try:
+        began = time.monotonic()
+        write_pair(watcher, source, 'p0')
+        # 没有放满，max_delay到期后关闭
+        path = compressor.get_queue().get(timeout=5)
+        assert time.monotonic() - began >= 0.2
+        assert members(path) == ['p0.json', 'p0.wav']
+        assert producer.sealed_count == 1
+    finally:
+        producer.stop()
+        thread.join()
+
+
+def test_backpressure_seals_volume_holding_reservation(tmp_path, watcher):
+    sources = [str(tmp_path / 'a'), str(tmp_path / 'b')]
+    outputs = [str(tmp_path / 'out_a'), str(tmp_path / 'out_b')]
+    # 只能预留一对文件的字节数
+    compressor = FileCompressor(max_size=1, max_pending_size=(WAV_SIZE + 2) * 1.5 / 1024**3)
+    producer, thread = start(compressor, ['a1', 'b1'], sources, outputs, watcher)
+    queue = compressor.get_queue()
+    try:
+        write_pair(watcher, sources[0], 'p0')
+        write_pair(watcher, sources[1], 'p1')
+        # a1_01还没满也没到期，但占着预留的字节数，为了给b的文件腾出字节数先关闭
+        first = queue.get(timeout=5)
+        assert os.path.basename(first) == 'a1_01.zip'
+        time.sleep(0.2)
+        assert producer.volumes == {}
+        assert queue.gauges()['blocked_count'] >= 1
+        # 消费者处理完后b的文件才写入
+        queue.item_done(first)
+        folder = os.path.normpath(sources[1])
+        wait_until(lambda: folder in producer.volumes and producer.volumes[folder].files)
+    finally:
+        producer.stop()
+        thread.join()
+    second = queue.get(timeout=1)
+    assert os.path.basename(second) == 'b1_01.zip'
+    assert members(second) == ['p1.json', 'p1.wav']
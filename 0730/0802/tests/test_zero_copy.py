@@ -0,0 +1,83 @@
+import io
+import os
+import errno
+import struct
+import hashlib
+import zlib
+import zipfile
+import pytest
+import compression_policy
+from compression_policy import write_stored
+from content_hash import HashingWriter
+from zip_member import PRIVATE_API, DATA_DESCRIPTOR_SIGNATURE, FLAG_DATA_DESCRIPTOR
+
+pytestmark = pytest.mark.skipif(not PRIVATE_API, reason="当前Python版本不使用零拷贝写入")
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'a.wav'
+    path.write_bytes(os.urandom(300000))
+    return str(path)
+
+
+def check_archive(path, source, data_descriptor):
+    with open(source, 'rb') as f:
+        data = f.read()
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        zinfo = zf.getinfo('a.wav')
+        assert zinfo.compress_type == zipfile.ZIP_STORED
+        assert zinfo.CRC == zlib.crc32(data)
+        assert bool(zinfo.flag_bits & FLAG_DATA_DESCRIPTOR) == data_descriptor
+        assert zf.read('a.wav') == data
+    if data_descriptor:
+        # 数据之后紧跟数据描述符：签名、CRC、压缩后大小、原始大小
+        with open(path, 'rb') as f:
+            f.seek(zinfo.header_offset + 30 + len('a.wav') + len(data))
+            assert struct.unpack('<LLLL', f.read(16)) == (DATA_DESCRIPTOR_SIGNATURE, zinfo.CRC, len(data), len(data))
+
+
+def test_seekable_round_trip(tmp_path, source):
+    path = str(tmp_path / 'out.zip')
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('first.json', '{}')
+        assert write_stored(zf, source, 'a.wav')
+    check_archive(path, source, data_descriptor=False)
+
+
+def test_non_seekable_round_trip(tmp_path, source):
+    path = str(tmp_path / 'out.zip')
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        writer = HashingWriter(f)
+        with zipfile.ZipFile(writer, 'w') as zf:
+            zf.writestr('first.json', '{}')
+            assert write_stored(zf, source, 'a.wav', hasher)
+    check_archive(path, source, data_descriptor=True)
+    # 内核复制的数据也计入压缩包哈希和成员内容哈希
+    with open(path, 'rb') as f:
+        assert writer.hexdigest() == hashlib.sha256(f.read()).hexdigest()
+    with open(source, 'rb') as f:
+        assert hasher.hexdigest() == hashlib.sha256(f.read()).hexdigest()
+
+
+def unsupported(*args):
+    raise OSError(errno.ENOSYS, "Function not implemented")
+
+
+@pytest.mark.parametrize('copies', [[], [unsupported]])
+def test_fallback_without_kernel_copy(tmp_path, source, monkeypatch, copies):
+    monkeypatch.setattr(compression_policy, '_KERNEL_COPIES', copies)
+    path = str(tmp_path / 'out.zip')
+    with open(path, 'wb') as f:
+        with zipfile.ZipFile(HashingWriter(f), 'w') as zf:
+            assert write_stored(zf, source, 'a.wav')
+    check_archive(path, source, data_descriptor=True)
+
+
+def test_not_local_file(source):
+    # 写入内存(如流式上传)时不零拷贝，由调用方按普通方式写入
+    with zipfile.ZipFile(io.BytesIO(), 'w') as zf:
+        assert not write_stored(zf, source, 'a.wav')
+        assert zf.namelist() == []
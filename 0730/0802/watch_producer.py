@@ -0,0 +1,381 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from producer import FileCompressor
+
+import shared_modules  # 把仓库根目录加入sys.path
+from compression_policy import CompressionStats
+from file_index import FileIndex
+from zip_volume import max_member_bytes, volume_budget
+
+logger = logging.getLogger(__name__)
+
+# 一对文件(json, wav)两个都写完后才能打包
+PAIR_SUFFIXES = ('.json', '.wav')
+
+# inotify事件
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """
+    用inotify监视目录(仅Linux)，写完关闭(IN_CLOSE_WRITE)或移入(IN_MOVED_TO)的文件视为已就绪
+
+    事件队列溢出时退化为扫描一次目录，修改时间早于settle秒的文件视为已就绪
+    """
+    def __init__(self, folders, settle=2.0):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.settle = settle
+        self.folders = {}
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"监视目录失败: {folder}")
+            self.folders[wd] = folder
+
+    def poll(self, timeout):
+        """等待最多timeout秒，返回已就绪的文件路径列表"""
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify事件队列溢出，重新扫描监视的目录")
+                return self._rescan()
+            if name and wd in self.folders:
+                paths.append(os.path.join(self.folders[wd], os.fsdecode(name)))
+        return paths
+
+    def _rescan(self):
+        now = time.time()
+        index = FileIndex()
+        return [entry.path for folder in self.folders.values() for entry in index.scan(folder)
+                if now - entry.mtime >= self.settle]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    没有inotify时(如Windows)定期扫描目录，大小和修改时间settle秒内没有变化的文件视为已就绪
+    """
+    def __init__(self, folders, interval=1.0, settle=2.0):
+        self.folders = list(folders)
+        self.interval = interval
+        self.settle = settle
+        self.index = FileIndex()
+        self.seen = {}      # 路径 -> ((大小, 修改时间), 首次看到该状态的时间)
+        self.reported = {}  # 路径 -> 已报告时的 (大小, 修改时间)
+
+    def poll(self, timeout):
+        time.sleep(min(self.interval, max(timeout, 0)))
+        now = time.monotonic()
+        paths = []
+        for folder in self.folders:
+            for entry in self.index.scan(folder, refresh=True):
+                state = (entry.size, entry.mtime)
+                if self.reported.get(entry.path) == state:
+                    continue
+                previous = self.seen.get(entry.path)
+                if previous is None or previous[0] != state:
+                    self.seen[entry.path] = (state, now)
+                elif now - previous[1] >= self.settle:
+                    self.reported[entry.path] = state
+                    paths.append(entry.path)
+        return paths
+
+    def close(self):
+        pass
+
+
+def make_watcher(folders, settle=2.0):
+    """优先使用inotify，不可用时使用轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folders, settle)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"无法使用inotify，改为轮询: {e}")
+    return PollingWatcher(folders, settle=settle)
+
+
+class OpenVolume:
+    """正在追加文件的压缩包"""
+    def __init__(self, batch_id, volume_no, name, output_folder, current_zip, stack, target, writer):
+        self.batch_id = batch_id
+        self.volume_no = volume_no
+        self.name = name
+        self.output_folder = output_folder
+        self.current_zip = current_zip
+        self.stack = stack
+        self.target = target
+        self.writer = writer
+        self.files = []
+        self.members = []
+        self.seconds = []
+        self.stats = CompressionStats()
+        self.raw_size = 0
+        self.planned = 0    # 按容量计算的已用大小，见WatchCompressor._capacity
+        self.reserved = 0
+        self.opened_at = time.monotonic()
+        self.start = time.perf_counter()
+
+
+class WatchCompressor:
+    """
+    常驻的生产者：监视源文件夹，同名json和wav都写完后追加到该文件夹当前的压缩包中，
+    压缩包达到大小上限或自打开起超过max_delay秒时关闭并放入队列；写入和队列复用FileCompressor
+
+    Args:
+        compressor: producer.FileCompressor，max_size即压缩包的大小上限
+        max_delay: 压缩包从放入第一对文件到关闭的最长秒数
+        settle: 轮询模式下文件多少秒没有变化视为写完
+    """
+    def __init__(self, compressor=None, max_delay=60.0, settle=2.0):
+        self.compressor = compressor or FileCompressor()
+        self.max_delay = max_delay
+        self.settle = settle
+        self.running = False
+        self.stopped = threading.Event()
+        self.targets = {}   # 源文件夹 -> (批次ID, 输出文件夹)
+        self.volumes = {}   # 源文件夹 -> OpenVolume
+        self.counters = {}  # 批次ID -> 最后使用的压缩包序号
+        self.ready = {}     # (源文件夹, 文件名) -> {扩展名: 路径}
+        self.packed = {}    # 已打包或已上传过的文件 -> (大小, 修改时间)，同一文件再次出现事件时不重复打包
+        self.sealed_count = 0
+
+    def get_queue(self):
+        return self.compressor.get_queue()
+
+    def run(self, batch_ids, source_folders, output_folders):
+        """
+        监视源文件夹直到stop()，返回前关闭所有未满的压缩包
+
+        Args:
+            batch_ids: 每个源文件夹的批次ID，可以是无参函数(如按日期生成)，在打开新压缩包时调用
+        """
+        if not (len(batch_ids) == len(source_folders) == len(output_folders)):
+            raise ValueError("batch_ids, source_folders, output_folders 的长度必须相等")
+        self.targets = {os.path.normpath(s): (b, o) for b, s, o in zip(batch_ids, source_folders, output_folders)}
+        for output_folder in output_folders:
+            if self.compressor.stream_to is None:
+                os.makedirs(output_folder, exist_ok=True)
+        self.running = True
+        self.stopped.clear()
+        watcher = make_watcher(list(self.targets), self.settle)
+        logger.info(f"开始监视 {len(self.targets)} 个源文件夹: {list(self.targets)}")
+        try:
+            self._add_existing()
+            while self.running:
+                for path in watcher.poll(self._next_timeout()):
+                    self._on_file_ready(path)
+                self._seal_expired()
+        finally:
+            watcher.close()
+            for folder in list(self.volumes):
+                self._seal(folder)
+            self.stopped.set()
+            logger.info(f"停止监视，共生成 {self.sealed_count} 个压缩包")
+
+    def stop(self, wait=True):
+        """停止监视，未满的压缩包会被关闭并放入队列"""
+        self.running = False
+        if wait:
+            self.stopped.wait()
+
+    def _add_existing(self):
+        """打包启动前已存在的完整文件对，跳过运行日志中已上传过的文件"""
+        index = self.compressor.file_index
+        for folder in self.targets:
+            entries = index.scan(folder, suffixes=PAIR_SUFFIXES, refresh=True)
+            shipped = {}
+            if self.compressor.journal and entries:
+                shipped = self.compressor.journal.find_shipped([(e.path, e.size, e.mtime) for e in entries])
+            if shipped:
+                logger.info(f"{folder} 中有 {len(shipped)} 个文件已在之前的压缩包中上传，不再打包")
+            for entry in entries:
+                if entry.path in shipped:
+                    self.packed[entry.path] = (entry.size, entry.mtime)
+                else:
+                    self._on_file_ready(entry.path)
+
+    def _on_file_ready(self, path):
+        folder, filename = os.path.split(os.path.normpath(path))
+        base, ext = os.path.splitext(filename)
+        if folder not in self.targets or ext not in PAIR_SUFFIXES:
+            return
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        state = (st.st_size, st.st_mtime)
+        if self.packed.get(path) == state:
+            return
+        halves = self.ready.setdefault((folder, base), {})
+        halves[ext] = (path, state)
+        if len(halves) == len(PAIR_SUFFIXES):
+            del self.ready[(folder, base)]
+            self._add_pair(folder, [halves[s] for s in PAIR_SUFFIXES])
+
+    def _capacity(self, pair):
+        """(这对文件占用的容量, 单个压缩包的容量)，与FileCompressor相同按输出字节数的最坏情况计算"""
+        need = sum(max_member_bytes(state[0], os.path.basename(path)) for path, state in pair)
+        return need, volume_budget(self.compressor.max_volume_bytes)
+
+    def _add_pair(self, folder, pair):
+        """把一对文件追加到该文件夹当前的压缩包，放不下时先关闭当前压缩包"""
+        files = [path for path, _ in pair]
+        size = sum(state[0] for _, state in pair)
+        need, capacity = self._capacity(pair)
+        volume = self.volumes.get(folder)
+        if volume is not None and volume.files and volume.planned + need > capacity:
+            self._seal(folder)
+        reserved = self._reserve(size)
+        volume = self.volumes.get(folder) or self._open(folder)
+        try:
+            volume.members += self._write(volume, files)
+        except FileNotFoundError:
+            self.compressor.compressed_files_queue.release(reserved)
+            logger.warning(f"文件在打包前被移走，跳过: {files}")
+            return
+        volume.reserved += reserved
+        volume.files += files
+        volume.raw_size += size
+        volume.planned += need
+        self.packed.update(pair)
+        logger.debug(f"添加文件到压缩包 {volume.name}: {files}")
+        if volume.planned >= capacity:
+            self._seal(folder)
+
+    def _reserve(self, size):
+        """
+        预留队列字节数，消费者跟不上时等待；未关闭的压缩包占着预留的字节，
+        等待期间依次关闭最早打开的压缩包，并照常关闭到期的压缩包，停止时不再等待
+        """
+        if self.compressor.stream_to is not None:
+            return 0
+        queue = self.compressor.compressed_files_queue
+        while not queue.reserve(size, timeout=self._next_timeout()):
+            if not self.running:
+                logger.warning(f"已停止监视，不再等待消费者: {queue.gauges()}")
+                return 0
+            self._seal_expired()
+            holding = [(v.opened_at, folder) for folder, v in self.volumes.items() if v.reserved]
+            if holding:
+                folder = min(holding)[1]
+                logger.info(f"待上传的压缩包已达上限，先关闭压缩包 {self.volumes[folder].name} 以释放字节数")
+                self._seal(folder)
+        return size
+
+    def _write(self, volume, files):
+        members, seconds = self.compressor._write_members(volume.current_zip, files, volume.stats)
+        volume.seconds += seconds
+        return members
+
+    def _next_volume_no(self, batch_id, output_folder):
+        """批次的下一个压缩包序号，接着运行日志和输出文件夹中已有的压缩包编号"""
+        if batch_id not in self.counters:
+            used = [0]
+            if self.compressor.journal:
+                used += [volume_no for volume_no, _, _, _ in self.compressor.journal.get_plan(batch_id)]
+            if self.compressor.stream_to is None:
+                prefix = f"{batch_id}_"
+                for name in os.listdir(output_folder):
+                    number = name[len(prefix):-len('.zip')]
+                    if name.startswith(prefix) and name.endswith('.zip') and number.isdigit():
+                        used.append(int(number))
+            self.counters[batch_id] = max(used)
+        self.counters[batch_id] += 1
+        return self.counters[batch_id]
+
+    def _open(self, folder):
+        batch_id, output_folder = self.targets[folder]
+        if callable(batch_id):
+            batch_id = batch_id()
+        volume_no = self._next_volume_no(batch_id, output_folder)
+        current_zip, stack, target, writer = self.compressor._open_volume(batch_id, volume_no, output_folder)
+        volume = OpenVolume(batch_id, volume_no, f"{batch_id}_{volume_no:02d}.zip", output_folder,
+                            current_zip, stack, target, writer)
+        self.volumes[folder] = volume
+        return volume
+
+    def _seal(self, folder):
+        """关闭压缩包，记录到运行日志并放入队列"""
+        volume = self.volumes.pop(folder)
+        if self.compressor.journal:
+            self.compressor.journal.record_plan(volume.batch_id, [(volume.volume_no, volume.name, volume.files, volume.raw_size)])
+        try:
+            self.compressor._close_volume(volume.current_zip, volume.stack, volume.target, volume.writer, volume.members,
+                                          volume.seconds, volume.raw_size, volume.stats, volume.reserved, volume.start,
+                                          self._index_for(volume))
+        except BaseException:
+            volume.stack.__exit__(*sys.exc_info())
+            self.compressor.compressed_files_queue.release(volume.reserved)
+            raise
+        self.sealed_count += 1
+
+    def _index_for(self, volume):
+        """压缩包旁路索引对应的本地路径，不写索引时为None"""
+        if not self.compressor.write_index:
+            return None
+        return os.path.join(volume.output_folder, volume.name)
+
+    def _next_timeout(self):
+        """到最早一个压缩包截止时间的秒数，没有打开的压缩包时为1秒(用于检查是否已停止)"""
+        if not self.volumes:
+            return 1.0
+        earliest = min(v.opened_at for v in self.volumes.values())
+        return min(1.0, max(0.0, earliest + self.max_delay - time.monotonic()))
+
+    def _seal_expired(self):
+        now = time.monotonic()
+        for folder, volume in list(self.volumes.items()):
+            if now - volume.opened_at >= self.max_delay:
+                logger.info(f"压缩包 {volume.name} 已打开 {self.max_delay} 秒，关闭并上传")
+                self._seal(folder)
+
+
+# 示例使用
+if __name__ == "__main__":
+    import datetime
+    from queue import Empty
+
+    watcher = WatchCompressor(FileCompressor(max_size=1), max_delay=30)
+    thread = threading.Thread(target=watcher.run, args=(
+        [lambda: datetime.datetime.now().strftime('%Y%m%d')], ["source_folder"], ["target_folder"]))
+    thread.start()
+    try:
+        while True:
+            try:
+                print("压缩包已生成:", watcher.get_queue().get(timeout=1))
+            except Empty:
+                pass
+    except KeyboardInterrupt:
+        watcher.stop()
+        thread.join()
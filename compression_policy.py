@@ -0,0 +1,242 @@
+import io
+import os
+import mmap
+import stat
+import time
+import zlib
+import errno
+import zipfile
+from content_hash import HASH_BLOCK, HashingWriter
+from zip_member import PRIVATE_API, MemberWriter, member_info
+
+# 默认对所有文件使用deflate，与原来的行为一致
+DEFAULT_SAMPLE_SIZE = 256 * 1024
+
+# 零拷贝复制不被支持(跨文件系统、内核或平台不支持)时的错误码，改用下一种复制方式
+_UNSUPPORTED_COPY = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF}
+
+
+def sample_deflate(path, sample_size=DEFAULT_SAMPLE_SIZE, level=6):
+    """
+    压缩文件开头的一段样本
+
+    Returns:
+        (样本长度, 压缩后长度, 压缩耗时CPU秒数)
+    """
+    with open(path, 'rb') as f:
+        data = f.read(sample_size)
+    start = time.thread_time()
+    compressed = zlib.compress(data, level)
+    return len(data), len(compressed), time.thread_time() - start
+
+
+def _copy_file_range(src_fd, dst_fd, src_offset, dst_offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, src_offset, dst_offset)
+
+
+def _sendfile(src_fd, dst_fd, src_offset, dst_offset, count):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, src_offset, count)
+
+
+# 依次尝试的内核内复制方式
+_KERNEL_COPIES = [copy for name, copy in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                  if hasattr(os, name)]
+
+
+def copy_range(src_fd, dst_fd, dst_offset, count, mm):
+    """
+    把源文件的前count字节复制到dst_fd的dst_offset处
+    优先copy_file_range/sendfile在内核中复制，都不支持时从源文件的mmap直接write
+    """
+    copied = 0
+    for copy in _KERNEL_COPIES:
+        try:
+            while copied < count:
+                n = copy(src_fd, dst_fd, copied, dst_offset + copied, count - copied)
+                if n == 0:
+                    raise OSError(errno.EIO, "源文件在写入压缩包时被截断")
+                copied += n
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_COPY:
+                raise
+    os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+    with memoryview(mm) as view:
+        while copied < count:
+            copied += os.write(dst_fd, view[copied:count])
+
+
+def _splice_target(zf):
+    """
+    零拷贝写入的目标：(底层本地文件, 外层的HashingWriter或None)
+    压缩包不是写入本地普通文件(如流式上传的远程文件)时返回None
+    """
+    out = zf.fp
+    hashing = None
+    if isinstance(out, HashingWriter):
+        hashing, out = out, out.fp
+    if not isinstance(out, (io.BufferedWriter, io.BufferedRandom, io.FileIO)):
+        return None
+    try:
+        if not stat.S_ISREG(os.fstat(out.fileno()).st_mode):
+            return None
+    except (OSError, ValueError):
+        return None
+    return out, hashing
+
+
+def write_stored(zf, path, arcname, hasher=None):
+    """
+    零拷贝写入STORED成员，输出与zf.write相同；CRC和哈希在mmap上计算，数据由内核复制
+    压缩包不是本地文件、源文件为空或当前Python版本不支持时返回False，由调用方按普通方式写入
+    """
+    target = _splice_target(zf) if PRIVATE_API else None
+    if target is None:
+        return False
+    out, hashing = target
+    zinfo = member_info(zf, path, arcname, zipfile.ZIP_STORED)
+    if zinfo.is_dir() or zinfo.file_size == 0:
+        return False
+
+    with open(path, 'rb') as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        writer = MemberWriter(zf, zinfo)
+        try:
+            # 一次遍历mmap，每块在缓存中时依次计算CRC、内容哈希和压缩包哈希
+            size = len(mm)
+            crc = 0
+            with memoryview(mm) as view:
+                for offset in range(0, size, HASH_BLOCK):
+                    block = view[offset:offset + HASH_BLOCK]
+                    crc = zlib.crc32(block, crc)
+                    if hasher is not None:
+                        hasher.update(block)
+                    if hashing is not None:
+                        hashing.account(block)
+                    block.release()
+
+            zf.fp.flush()
+            data_offset = out.tell()
+            copy_range(src.fileno(), out.fileno(), data_offset, size, mm)
+            out.seek(data_offset + size)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close(crc, size, size)
+    return True
+
+
+def write_file(zf, path, arcname, method, level, hasher=None, zero_copy=True):
+    """
+    与zf.write相同，传入hasher(如content_hash.ContentHasher)时在写入的同时计算成员内容哈希，
+    成员数据只读一遍；zero_copy为True时STORED成员尽量用write_stored零拷贝写入
+    """
+    if zero_copy and method == zipfile.ZIP_STORED and write_stored(zf, path, arcname, hasher):
+        return
+    if hasher is None:
+        zf.write(path, arcname, compress_type=method, compresslevel=level)
+        return
+    zinfo = member_info(zf, path, arcname, method)
+    zinfo._compresslevel = level if level is not None else zf.compresslevel
+    with open(path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+        for data in iter(lambda: src.read(HASH_BLOCK), b''):
+            hasher.update(data)
+            dest.write(data)
+
+
+class CompressionStats:
+    """单个压缩包的压缩策略统计"""
+    def __init__(self):
+        self.members = 0
+        self.raw_bytes = 0
+        self.stored_members = 0
+        self.stored_bytes = 0
+        self.deflate_seconds = 0.0
+        self.cpu_saved_seconds = 0.0
+        self.bytes_lost = 0
+
+    def record(self, size, method, elapsed, estimate=None):
+        """
+        记录一个成员
+
+        Args:
+            size: 原始大小
+            method: 实际使用的压缩方法
+            elapsed: 写入该成员的CPU秒数
+            estimate: 按样本外推的 (deflate耗时CPU秒数, deflate后大小)，存储的成员用来估算节省的CPU和多占用的字节
+        """
+        self.members += 1
+        self.raw_bytes += size
+        if method == zipfile.ZIP_STORED:
+            self.stored_members += 1
+            self.stored_bytes += size
+            if estimate:
+                est_seconds, est_size = estimate
+                self.cpu_saved_seconds += max(0.0, est_seconds - elapsed)
+                self.bytes_lost += max(0, size - est_size)
+        else:
+            self.deflate_seconds += elapsed
+
+    def summary(self):
+        return (f"成员 {self.members} 个, 存储不压缩 {self.stored_members} 个 ({self.stored_bytes} 字节), "
+                f"deflate耗时 {self.deflate_seconds:.2f}s, 估计节省CPU {self.cpu_saved_seconds:.2f}s, "
+                f"估计多占用 {self.bytes_lost} 字节")
+
+
+class CompressionPolicy:
+    """
+    按扩展名选择压缩方法和级别，可选自适应模式
+
+    Args:
+        rules: {扩展名: (压缩方法, 压缩级别)}，如 {'.wav': (zipfile.ZIP_STORED, None)}
+        method: 未匹配规则时的压缩方法
+        level: 未匹配规则时的压缩级别，None为zlib默认
+        adaptive: 为True时对使用deflate的文件先压缩开头样本，节省比例低于min_saving则改为STORED
+        sample_size: 自适应采样的字节数
+        min_saving: 自适应模式下使用deflate所需的最低节省比例
+        zero_copy: 为True时写入本地压缩包的STORED成员由内核直接复制，见write_stored
+    """
+    def __init__(self, rules=None, method=zipfile.ZIP_DEFLATED, level=None, adaptive=False,
+                 sample_size=DEFAULT_SAMPLE_SIZE, min_saving=0.05, zero_copy=True):
+        self.rules = {ext.lower(): rule for ext, rule in (rules or {}).items()}
+        self.method = method
+        self.level = level
+        self.adaptive = adaptive
+        self.sample_size = sample_size
+        self.min_saving = min_saving
+        self.zero_copy = zero_copy
+
+    def choose(self, path, size=None, estimate=False):
+        """
+        为文件选择压缩方法
+
+        Args:
+            estimate: 为True时即使不需要采样也为STORED的文件估算deflate的开销，用于统计
+
+        Returns:
+            (压缩方法, 压缩级别, 估算值或None)，估算值为按样本外推的 (deflate耗时CPU秒数, deflate后大小)
+        """
+        ext = os.path.splitext(path)[1].lower()
+        method, level = self.rules.get(ext, (self.method, self.level))
+        if not (estimate and method == zipfile.ZIP_STORED) and not (self.adaptive and method == zipfile.ZIP_DEFLATED):
+            return method, level, None
+
+        size = os.path.getsize(path) if size is None else size
+        sample_len, sample_compressed, sample_seconds = sample_deflate(path, self.sample_size, 6 if level is None else level)
+        if sample_len == 0:
+            return method, level, None
+        scale = size / sample_len
+        est = (sample_seconds * scale, int(sample_compressed * scale))
+        if self.adaptive and method == zipfile.ZIP_DEFLATED and 1 - sample_compressed / sample_len < self.min_saving:
+            return zipfile.ZIP_STORED, None, est
+        return method, level, est
+
+    def write(self, zf, path, arcname, stats=None, hasher=None):
+        """按策略将文件写入压缩包，传入stats时记录统计，传入hasher时同时计算成员内容哈希"""
+        size = os.path.getsize(path)
+        method, level, est = self.choose(path, size, estimate=stats is not None)
+        start = time.thread_time()
+        write_file(zf, path, arcname, method, level, hasher, self.zero_copy)
+        if stats is not None:
+            stats.record(size, method, time.thread_time() - start, est)
+        return method
@@ -0,0 +1,92 @@
+import hashlib
+
+# 成员内容哈希的分块大小：内容哈希 = sha256(各块sha256摘要依次拼接)
+# 分块可以在不同进程中分别计算，按顺序合并后与单进程顺序计算的结果相同
+HASH_BLOCK = 1024 * 1024
+
+
+def block_digests(data):
+    """计算一段从分块边界开始的数据中每个分块的sha256摘要"""
+    return [hashlib.sha256(data[i:i + HASH_BLOCK]).digest() for i in range(0, len(data), HASH_BLOCK)]
+
+
+class ContentHasher:
+    """按HASH_BLOCK分块的内容哈希，可以顺序update，也可以直接合并其他进程算好的分块摘要"""
+    def __init__(self):
+        self.digests = hashlib.sha256()
+        self.block = hashlib.sha256()
+        self.block_len = 0
+        self.size = 0
+
+    def update(self, data):
+        if self.block_len < 0:
+            raise ValueError("内容哈希的分块没有对齐")
+        view = memoryview(data)
+        self.size += len(view)
+        while view:
+            take = min(HASH_BLOCK - self.block_len, len(view))
+            self.block.update(view[:take])
+            self.block_len += take
+            view = view[take:]
+            if self.block_len == HASH_BLOCK:
+                self.digests.update(self.block.digest())
+                self.block = hashlib.sha256()
+                self.block_len = 0
+
+    def add_block_digests(self, digests, length):
+        """合并block_digests()的结果，当前必须位于分块边界"""
+        if self.block_len:
+            raise ValueError("内容哈希的分块没有对齐")
+        for digest in digests:
+            self.digests.update(digest)
+        self.size += length
+        # 不足一个分块的末尾只能出现在最后
+        if length % HASH_BLOCK:
+            self.block_len = -1
+
+    def hexdigest(self):
+        digests = self.digests.copy()
+        if self.block_len > 0:
+            digests.update(self.block.digest())
+        return digests.hexdigest()
+
+
+def hash_file(path):
+    """计算本地文件的内容哈希"""
+    hasher = ContentHasher()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(HASH_BLOCK), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+class HashingWriter:
+    """
+    写入时计算sha256的输出文件包装
+
+    不提供seek，ZipFile会改用数据描述符顺序写出，不回头改写文件头，
+    因此压缩包关闭时即可得到整个文件的sha256，不必再读一遍
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self.hash = hashlib.sha256()
+        self.position = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.position += len(data)
+        return self.fp.write(data)
+
+    def account(self, data):
+        """data已由调用方直接写入底层文件(如零拷贝复制)，只计入哈希和位置"""
+        self.hash.update(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        self.fp.flush()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
@@ -0,0 +1,144 @@
+import os
+import stat
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 索引中的一个文件
+FileEntry = namedtuple('FileEntry', ['path', 'name', 'size', 'mtime'])
+
+
+def _scan_dir(folder):
+    """
+    用os.scandir列出一个目录，返回 (文件列表, 子目录列表)
+    scandir的文件类型来自目录项本身，Windows上stat也来自目录项，不需要逐个文件发起stat
+    """
+    files = []
+    subdirs = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append(FileEntry(entry.path, entry.name, st.st_size, st.st_mtime))
+            except FileNotFoundError:
+                # 扫描期间被删除或移走的文件
+                continue
+    return files, subdirs
+
+
+class FileIndex:
+    """
+    扫描一次、多个环节共用的文件索引
+
+    scan()用os.scandir列出目录并缓存每个文件的大小和修改时间，之后分组、规划压缩包、
+    检查已上传文件等环节都从索引中取值，不再对每个文件重复listdir和getsize；
+    不在索引中的路径由stat()查询一次后缓存。递归扫描时可以用多个线程并行遍历子目录，
+    适合单次请求延迟高的NFS等网络文件系统。
+
+    Args:
+        workers: 递归扫描的并行线程数，0表示在当前线程中逐个目录扫描
+    """
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.entries = {}   # 路径 -> FileEntry
+        self.scans = {}     # (目录, 是否递归) -> [FileEntry, ...]
+        self.lock = threading.Lock()
+
+    def scan(self, root, recursive=False, suffixes=None, refresh=False):
+        """
+        列出root下的文件，结果按目录缓存，refresh=True时重新扫描
+
+        Args:
+            root: 目录
+            recursive: 是否包含子目录
+            suffixes: 只返回以这些后缀结尾的文件，如('.wav', '.json')，与str.endswith相同区分大小写
+            refresh: 忽略缓存重新扫描
+
+        Returns:
+            [FileEntry, ...]，同一目录内保持scandir的顺序
+        """
+        key = (os.path.normpath(root), recursive)
+        with self.lock:
+            entries = None if refresh else self.scans.get(key)
+        if entries is None:
+            entries = self._walk(root) if recursive else _scan_dir(root)[0]
+            with self.lock:
+                self.scans[key] = entries
+                for entry in entries:
+                    self.entries[entry.path] = entry
+            logger.debug(f"扫描目录 {root}: {len(entries)} 个文件")
+        if suffixes:
+            entries = [e for e in entries if e.name.endswith(tuple(suffixes))]
+        return entries
+
+    def _walk(self, root):
+        if not self.workers:
+            entries = []
+            pending = [root]
+            while pending:
+                files, subdirs = _scan_dir(pending.pop(0))
+                entries.extend(files)
+                pending.extend(subdirs)
+            return entries
+
+        # 每个子目录一个任务，扫描完一个目录后再提交它的子目录
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {root: executor.submit(_scan_dir, root)}
+            order = [root]
+            while futures:
+                folder = next(iter(futures))
+                files, subdirs = futures.pop(folder).result()
+                results[folder] = files
+                for subdir in subdirs:
+                    futures[subdir] = executor.submit(_scan_dir, subdir)
+                    order.append(subdir)
+        # 按目录的广度优先顺序合并，与单线程扫描的结果一致
+        return [entry for folder in order for entry in results[folder]]
+
+    def groups(self, root, suffixes=('.wav', '.json'), recursive=False, refresh=False):
+        """按文件名(去掉扩展名)分组，返回 {文件名: [路径, ...]}"""
+        file_groups = {}
+        for entry in self.scan(root, recursive, suffixes, refresh):
+            file_groups.setdefault(os.path.splitext(entry.name)[0], []).append(entry.path)
+        return file_groups
+
+    def stat(self, path):
+        """文件的FileEntry，不在索引中时stat一次并缓存"""
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is None:
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                raise IsADirectoryError(path)
+            entry = FileEntry(path, os.path.basename(path), st.st_size, st.st_mtime)
+            with self.lock:
+                self.entries[path] = entry
+        return entry
+
+    def size(self, path):
+        return self.stat(path).size
+
+    def group_size(self, group):
+        """一组文件的总大小，可作为zip_planner.plan_volumes的size_of"""
+        if isinstance(group, str):
+            return self.size(group)
+        return sum(self.size(f) for f in group)
+
+    def invalidate(self, root=None):
+        """丢弃root目录(默认全部)的缓存，文件被移动或改写后调用"""
+        with self.lock:
+            if root is None:
+                self.entries.clear()
+                self.scans.clear()
+                return
+            root = os.path.normpath(root)
+            for key in [k for k in self.scans if k[0] == root or k[0].startswith(root + os.sep)]:
+                for entry in self.scans.pop(key):
+                    self.entries.pop(entry.path, None)
@@ -0,0 +1,162 @@
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RetryBudget:
+    """
+    重试预算：每次正常请求存入ratio个令牌，每次重试取出一个令牌，令牌不足时不再重试
+    目标整体故障时所有工作线程的重试总量被限制在请求量的ratio倍左右，不会成倍放大负载
+
+    Args:
+        ratio: 每次请求可换得的重试次数
+        min_tokens: 初始(也是最低保证的)令牌数，请求量很少时也允许少量重试
+        max_tokens: 令牌上限
+    """
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(min_tokens)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    重试策略：指数退避 + 随机抖动 + 重试预算，多个工作线程共享一个实例
+
+    第n次重试前等待 uniform(0, min(max_delay, base_delay * multiplier ** (n - 1)))秒(full jitter)，
+    各线程不会同时重试同一个目标
+
+    Args:
+        max_attempts: 最多尝试次数(含第一次)
+        base_delay: 第一次重试的退避上限(秒)
+        max_delay: 退避上限(秒)
+        multiplier: 每次重试退避上限的倍数
+        budget: RetryBudget，None表示不限制重试总量
+    """
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, multiplier=2.0, budget=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.budget = budget
+
+    def delay(self, retry):
+        """第retry次重试(从1开始)前的等待秒数"""
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** (retry - 1))
+        return random.uniform(0, cap)
+
+    def record_request(self):
+        """记录一次原始请求(重试不算)，为重试预算存入令牌"""
+        if self.budget:
+            self.budget.deposit()
+
+    def should_retry(self, attempt):
+        """第attempt次尝试(从1开始)失败后是否还能重试"""
+        if attempt >= self.max_attempts:
+            return False
+        if self.budget and not self.budget.withdraw():
+            logger.warning("重试预算已用完，不再重试")
+            return False
+        return True
+
+    def call(self, func, *args, **kwargs):
+        """
+        调用func直到返回真值或不能再重试
+
+        Returns:
+            (最后一次的返回值, 尝试次数)
+        """
+        # 只按原始请求存入令牌，重试不存入，否则重试会为自己补充预算
+        self.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            result = func(*args, **kwargs)
+            if result or not self.should_retry(attempt):
+                return result, attempt
+            time.sleep(self.delay(attempt))
+
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    单个目标的熔断器
+
+    连续失败failure_threshold次后打开，reset_timeout秒内不再向该目标发送请求；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+
+    Args:
+        name: 目标名称，用于日志
+        failure_threshold: 打开熔断器的连续失败次数
+        reset_timeout: 打开后多少秒进入半开状态
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.open_count = 0
+        self.lock = threading.Lock()
+
+    def _update_state(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probing = False
+
+    def is_available(self):
+        """是否可以向该目标发送请求，不占用半开状态的探测名额"""
+        with self.lock:
+            self._update_state()
+            return self.state == CLOSED or (self.state == HALF_OPEN and not self.probing)
+
+    def allow(self):
+        """申请发送一个请求，半开状态下只放行一个探测请求"""
+        with self.lock:
+            self._update_state()
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"熔断器关闭: {self.name}")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.open_count += 1
+                logger.warning(f"熔断器打开: {self.name}, 连续失败 {self.failures} 次, {self.reset_timeout} 秒后重试")
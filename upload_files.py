@@ -3,7 +3,15 @@ import shutil
 from concurrent.futures import ThreadPoolExecutor
 import random
 import time
+import threading
 from datetime import datetime
+from retry_policy import RetryPolicy, RetryBudget, CircuitBreaker
+
+# 所有上传线程共享的重试预算，目标故障时重试总量不超过请求量的20%左右
+RETRY_BUDGET = RetryBudget()
+# 每个target一个熔断器，连续失败后暂停向该target上传，文件改传到其他target
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
 
 
 # 分配文件到不同target，每个target收到的文件不同
@@ -18,8 +26,10 @@ def distribute_files(files, num_targets):
 
 
 
-# 带重试的上传
+# 带重试的上传，指数退避加随机抖动，受共享的重试预算限制
 def upload_with_retry(src, remote_path, max_retries=3):
+    policy = RetryPolicy(max_attempts=max_retries, base_delay=0.2, max_delay=5.0, budget=RETRY_BUDGET)
+    policy.record_request()
     for attempt in range(1, max_retries + 1):
         success = upload_file_to_remote(src, remote_path)
         if success:
@@ -27,15 +37,39 @@ def upload_with_retry(src, remote_path, max_retries=3):
             return True
         else:
             print(f'FAIL: 上传 {os.path.basename(src)} 到 {remote_path} 失败 (第{attempt}次)')
-            time.sleep(0.2)
+            if not policy.should_retry(attempt):
+                break
+            time.sleep(policy.delay(attempt))
     print(f'GIVE UP: 上传 {os.path.basename(src)} 到 {remote_path} 最终失败')
     return False
 
+
+def get_breaker(remote_dir):
+    with BREAKERS_LOCK:
+        if remote_dir not in BREAKERS:
+            BREAKERS[remote_dir] = CircuitBreaker(remote_dir)
+        return BREAKERS[remote_dir]
+
+
+# 分配的target熔断时选择其他可用的target
+def pick_target(remote_dir):
+    if get_breaker(remote_dir).allow():
+        return remote_dir
+    for target in TARGET_DIRS:
+        if target != remote_dir and get_breaker(target).allow():
+            print(f'REROUTE: {remote_dir} 已熔断，改为上传到 {target}')
+            return target
+    return remote_dir
+
 def upload_files_to_remote(file_list, remote_dir):
     for file in file_list:
         src = os.path.join(SOURCE_DIR, file)
-        remote_path = os.path.join(remote_dir, file)
-        upload_with_retry(src, remote_path)
+        target = pick_target(remote_dir)
+        remote_path = os.path.join(target, file)
+        if upload_with_retry(src, remote_path):
+            get_breaker(target).record_success()
+        else:
+            get_breaker(target).record_failure()
 
 def main():
     files = os.listdir(SOURCE_DIR)
@@ -1,40 +1,38 @@
 import os
 import zipfile
 from concurrent.futures import ThreadPoolExecutor
+from compression_policy import CompressionPolicy, CompressionStats
+from zip_planner import plan_volumes
+from zip_volume import max_group_bytes, volume_budget, member_index, write_index
 
-MAX_ZIP_SIZE = 4 * 1024 * 1024 * 1024  # 4GB
+MAX_ZIP_SIZE = 4 * 1024 * 1024 * 1024  # 4GB，按压缩包实际大小(含文件头和中央目录)计算
 
 def get_file_size(file_path):
     return os.path.getsize(file_path)
 
-def group_files_by_size(file_list, max_size):
-    groups = []
-    current_group = []
-    current_size = 0
-    for file in file_list:
-        size = get_file_size(file)
-        if current_size + size > max_size and current_group:
-            groups.append(current_group)
-            current_group = []
-            current_size = 0
-        current_group.append(file)
-        current_size += size
-    if current_group:
-        groups.append(current_group)
-    return groups
+def group_files_by_size(file_list, max_size, strategy='ffd'):
+    # 按每个文件最坏情况下占用的字节数装箱，不可压缩的文件也不会让压缩包超过max_size
+    plan = plan_volumes(file_list, volume_budget(max_size), strategy=strategy,
+                        size_of=lambda f: max_group_bytes(f, get_file_size))
+    print(f"打包规划: {plan.summary()}")
+    return plan.volumes
 
-def zip_files(file_group, zip_name):
+def zip_files(file_group, zip_name, policy=None):
+    policy = policy or CompressionPolicy()
+    stats = CompressionStats()
     with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for file in file_group:
-            zipf.write(file, arcname=os.path.basename(file))
-    print(f"{zip_name} created.")
+            policy.write(zipf, file, os.path.basename(file), stats)
+    # 旁路索引 {zip_name}.idx.json，记录每个成员的偏移，可以不读中央目录直接取出单个文件
+    write_index(zip_name, member_index(zipf), os.path.getsize(zip_name))
+    print(f"{zip_name} created. {stats.summary()}")
 
-def main(file_list, output_dir, max_workers=4):
+def main(file_list, output_dir, max_workers=4, policy=None):
     groups = group_files_by_size(file_list, MAX_ZIP_SIZE)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         for idx, group in enumerate(groups):
             zip_name = os.path.join(output_dir, f'archive_part{idx+1}.zip')
-            executor.submit(zip_files, group, zip_name)
+            executor.submit(zip_files, group, zip_name, policy)
 
 if __name__ == "__main__":
     # 这里替换成你自己的文件列表和输出目录
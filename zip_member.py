@@ -0,0 +1,87 @@
+import sys
+import struct
+import zipfile
+
+# 数据描述符，与zipfile._ZipWriteFile.close写出的相同
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+FLAG_DATA_DESCRIPTOR = 0x08
+
+# MemberWriter使用ZipFile的私有属性(_lock、_writing、_seekable、start_dir、_writecheck、_didModify)，
+# 只在核对过zipfile实现的Python版本上启用，其他版本由调用方改用zf.write/zf.open
+PRIVATE_API = (3, 8) <= sys.version_info[:2] <= (3, 13)
+
+
+def member_info(zf, path, arcname, compress_type):
+    """与zf.write相同地由文件生成ZipInfo"""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=zf._strict_timestamps)
+    zinfo.compress_type = compress_type
+    return zinfo
+
+
+class MemberWriter:
+    """
+    绕过ZipFile.open直接写入一个成员，数据已压缩好或由内核复制时使用
+
+    按ZipFile.open(mode='w')的流程写出本地文件头并占用zf，调用方随后把成员数据写到zf.fp，
+    close()时写数据描述符(或回填文件头)并登记成员；出错时调用abort()释放zf
+    """
+    def __init__(self, zf, zinfo):
+        if not PRIVATE_API:
+            raise RuntimeError(f"未在Python {sys.version_info[0]}.{sys.version_info[1]} 上核对zipfile的私有接口")
+        self.zf = zf
+        self.zinfo = zinfo
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        zinfo.flag_bits = 0 if zf._seekable else FLAG_DATA_DESCRIPTOR
+        self.released = False
+        self.zip64 = zf._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        if not self.zip64 and zinfo.file_size > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+
+        zf._lock.acquire()
+        try:
+            if zf._writing:
+                raise ValueError("Can't write to the ZIP file while there is another write handle open on it.")
+            if zf._seekable:
+                zf.fp.seek(zf.start_dir)
+            zinfo.header_offset = zf.fp.tell()
+            zf._writecheck(zinfo)
+            zf._didModify = True
+            zf.fp.write(zinfo.FileHeader(self.zip64))
+            zf._writing = True
+        except BaseException:
+            zf._lock.release()
+            raise
+
+    def close(self, crc, file_size, compress_size):
+        """成员数据已全部写入zf.fp，写数据描述符或回填文件头并登记成员"""
+        zf = self.zf
+        zinfo = self.zinfo
+        try:
+            zinfo.CRC = crc
+            zinfo.file_size = file_size
+            zinfo.compress_size = compress_size
+            if not self.zip64 and max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+                raise RuntimeError(f"文件大小超出预期，需要ZIP64: {zinfo.filename}")
+            if zinfo.flag_bits & FLAG_DATA_DESCRIPTOR:
+                fmt = '<LLQQ' if self.zip64 else '<LLLL'
+                zf.fp.write(struct.pack(fmt, DATA_DESCRIPTOR_SIGNATURE, crc, compress_size, file_size))
+                zf.start_dir = zf.fp.tell()
+            else:
+                # 回到文件头位置写入正确的CRC和大小
+                zf.start_dir = zf.fp.tell()
+                zf.fp.seek(zinfo.header_offset)
+                zf.fp.write(zinfo.FileHeader(self.zip64))
+                zf.fp.seek(zf.start_dir)
+            zf.filelist.append(zinfo)
+            zf.NameToInfo[zinfo.filename] = zinfo
+        finally:
+            self.abort()
+
+    def abort(self):
+        """释放zf，未close的成员不登记；已释放时什么也不做"""
+        if self.released:
+            return
+        self.released = True
+        self.zf._writing = False
+        self.zf._lock.release()
@@ -0,0 +1,154 @@
+import os
+import bisect
+
+# 可选的装箱策略
+#   next_fit: 按原顺序装入，放不下就关闭当前压缩包（原来的行为）
+#   ffd: first-fit-decreasing，按大小降序放入第一个放得下的压缩包
+#   bfd: best-fit-decreasing，按大小降序放入剩余空间最小且放得下的压缩包
+STRATEGIES = ('next_fit', 'ffd', 'bfd')
+
+
+def group_size(group):
+    """一组文件(如(json, wav))的总大小"""
+    if isinstance(group, str):
+        return os.path.getsize(group)
+    return sum(os.path.getsize(f) for f in group)
+
+
+class VolumePlan:
+    """
+    压缩包规划结果
+
+    Attributes:
+        volumes: [[group, ...], ...] 每个压缩包内的文件组，组内保持输入顺序
+        sizes: 每个压缩包的原始大小
+        overflow: 超出max_count放不下的文件组，保持输入顺序
+    """
+    def __init__(self, max_size, volumes, sizes, overflow):
+        self.max_size = max_size
+        self.volumes = volumes
+        self.sizes = sizes
+        self.overflow = overflow
+
+    def fill_ratios(self):
+        return [size / self.max_size for size in self.sizes]
+
+    def summary(self):
+        ratios = self.fill_ratios()
+        average = sum(ratios) / len(ratios) if ratios else 0
+        detail = ', '.join(f"{r:.0%}" for r in ratios)
+        return f"{len(self.volumes)} 个压缩包, 平均填充率 {average:.1%} [{detail}], 溢出 {len(self.overflow)} 组"
+
+
+def _next_fit(order, sizes, max_size):
+    bins = []
+    loads = []
+    for i in order:
+        if not bins or (loads[-1] + sizes[i] > max_size and bins[-1]):
+            bins.append([])
+            loads.append(0)
+        bins[-1].append(i)
+        loads[-1] += sizes[i]
+    return bins, loads
+
+
+def _first_fit(order, sizes, max_size):
+    bins = []
+    loads = []
+    for i in order:
+        for b, load in enumerate(loads):
+            if load + sizes[i] <= max_size:
+                bins[b].append(i)
+                loads[b] += sizes[i]
+                break
+        else:
+            bins.append([i])
+            loads.append(sizes[i])
+    return bins, loads
+
+
+def _best_fit(order, sizes, max_size):
+    bins = []
+    loads = []
+    # 按剩余空间升序排列的 (剩余空间, 压缩包序号)
+    remaining = []
+    for i in order:
+        pos = bisect.bisect_left(remaining, (sizes[i], -1))
+        if pos < len(remaining):
+            space, b = remaining.pop(pos)
+            bins[b].append(i)
+            loads[b] += sizes[i]
+            bisect.insort(remaining, (space - sizes[i], b))
+        else:
+            bins.append([i])
+            loads.append(sizes[i])
+            bisect.insort(remaining, (max(0, max_size - sizes[i]), len(bins) - 1))
+    return bins, loads
+
+
+def plan_volumes(groups, max_size, max_count=None, strategy='ffd', size_of=group_size):
+    """
+    把文件组装入若干不超过max_size的压缩包
+
+    设置max_count时按输入顺序接纳文件组直到总量达到 max_count * max_size，
+    因此排在前面的文件组(如上个批次遗留)优先被打包；接纳的文件组再按策略装箱，
+    剩下的文件组尽量填进已有压缩包的空隙，仍放不下的作为overflow返回。
+    单个超过max_size的文件组独占一个压缩包。
+
+    Args:
+        groups: 文件组列表
+        max_size: 单个压缩包的原始大小上限(字节)
+        max_count: 最多的压缩包数，None表示不限
+        strategy: 'next_fit'、'ffd' 或 'bfd'
+        size_of: 计算文件组大小的函数
+
+    Returns:
+        VolumePlan
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"不支持的装箱策略: {strategy}")
+    sizes = [size_of(g) for g in groups]
+
+    admitted = list(range(len(groups)))
+    rest = []
+    if max_count is not None:
+        capacity = max_count * max_size
+        total = 0
+        for n, size in enumerate(sizes):
+            if total + size > capacity:
+                admitted, rest = admitted[:n], admitted[n:]
+                break
+            total += size
+
+    if strategy == 'next_fit':
+        bins, loads = _next_fit(admitted, sizes, max_size)
+    else:
+        order = sorted(admitted, key=lambda i: (-sizes[i], i))
+        pack = _first_fit if strategy == 'ffd' else _best_fit
+        bins, loads = pack(order, sizes, max_size)
+
+    if max_count is not None:
+        # 装箱后仍超出数量的部分放回剩余队列
+        if len(bins) > max_count:
+            extra = sorted(i for b in bins[max_count:] for i in b)
+            bins, loads = bins[:max_count], loads[:max_count]
+            rest = sorted(rest + extra)
+        # 剩余文件组按顺序尝试填进已有压缩包的空隙，再用空出来的压缩包名额
+        overflow = []
+        for i in rest:
+            for b, load in enumerate(loads):
+                if load + sizes[i] <= max_size:
+                    bins[b].append(i)
+                    loads[b] += sizes[i]
+                    break
+            else:
+                if len(bins) < max_count:
+                    bins.append([i])
+                    loads.append(sizes[i])
+                else:
+                    overflow.append(i)
+    else:
+        overflow = []
+
+    volumes = [[groups[i] for i in sorted(b)] for b in bins]
+    return VolumePlan(max_size, volumes, loads, [groups[i] for i in overflow])
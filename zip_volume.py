@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import logging
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# 每个成员在压缩包中的额外开销上限(字节)，按ZIP64计算：
+#   本地文件头30 + ZIP64扩展20，数据描述符24，中央目录项46 + ZIP64扩展28，文件名另计
+LOCAL_HEADER_SIZE = 30
+LOCAL_ZIP64_EXTRA_SIZE = 20
+DATA_DESCRIPTOR_SIZE = 24
+CENTRAL_HEADER_SIZE = 46 + 28
+# 结尾记录：ZIP64结束记录56 + ZIP64定位器20 + 结束记录22
+END_RECORDS_SIZE = 56 + 20 + 22
+
+# 索引文件的扩展名，与压缩包放在一起：{压缩包名}.idx.json；批次索引为 {batch_id}.idx.json
+INDEX_SUFFIX = '.idx.json'
+
+
+def deflate_bound(size):
+    """raw deflate输出的上限(与zlib的deflateBound相同)，不可压缩的数据也不会超过"""
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+
+def max_member_bytes(size, arcname):
+    """一个原始大小为size的成员最多占用的压缩包字节数，包括文件头、数据描述符和中央目录项"""
+    name_len = len(arcname.encode('utf-8'))
+    return (LOCAL_HEADER_SIZE + LOCAL_ZIP64_EXTRA_SIZE + name_len + deflate_bound(size)
+            + DATA_DESCRIPTOR_SIZE + CENTRAL_HEADER_SIZE + name_len)
+
+
+def max_group_bytes(group, size_of=os.path.getsize):
+    """一组文件作为成员(名称为文件名)最多占用的字节数，可作为zip_planner.plan_volumes的size_of"""
+    if isinstance(group, str):
+        group = [group]
+    return sum(max_member_bytes(size_of(f), os.path.basename(f)) for f in group)
+
+
+def volume_budget(max_bytes):
+    """压缩包大小上限为max_bytes时，所有成员可用的字节数"""
+    return max_bytes - END_RECORDS_SIZE
+
+
+def uses_zip64_header(zinfo):
+    """
+    zipfile是否在该成员的本地文件头中写了ZIP64扩展
+    与ZipFile.open(mode='w')和zip_member.MemberWriter的判断相同
+    """
+    return zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+
+
+def member_index(zf, hashes=None):
+    """
+    根据ZipFile中已写入的成员生成索引
+
+    Args:
+        hashes: {压缩包内名称: 内容哈希}，可选
+
+    Returns:
+        [{arcname, header_offset, data_offset, compress_size, file_size, crc, method, sha256}, ...]
+        data_offset为成员数据(压缩后)在压缩包中的起始位置，读取[data_offset, data_offset + compress_size)即可解出该成员
+    """
+    entries = []
+    for zinfo in zf.infolist():
+        # 非ASCII文件名按UTF-8写入，ASCII文件名两种编码长度相同
+        name_len = len(zinfo.filename.encode('utf-8'))
+        extra_len = len(zinfo.extra) + (LOCAL_ZIP64_EXTRA_SIZE if uses_zip64_header(zinfo) else 0)
+        entries.append({
+            'arcname': zinfo.filename,
+            'header_offset': zinfo.header_offset,
+            'data_offset': zinfo.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len,
+            'compress_size': zinfo.compress_size,
+            'file_size': zinfo.file_size,
+            'crc': zinfo.CRC,
+            'method': zinfo.compress_type,
+            'sha256': (hashes or {}).get(zinfo.filename),
+        })
+    return entries
+
+
+def write_index(volume_path, entries, size=None, sha256=None, index_path=None):
+    """
+    把压缩包的成员索引写入旁路索引文件，默认为 {压缩包路径}.idx.json
+
+    Returns:
+        索引文件路径
+    """
+    index_path = index_path or volume_path + INDEX_SUFFIX
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'volume': os.path.basename(volume_path), 'size': size, 'sha256': sha256, 'members': entries},
+                  f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    return index_path
+
+
+def read_index(index_path):
+    """读取旁路索引文件"""
+    with open(index_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def volume_index_paths(output_folder, batch_id):
+    """output_folder中批次的各压缩包 {batch_id}_NN.zip 的旁路索引路径，按压缩包序号排序"""
+    pattern = re.compile(re.escape(batch_id) + r'_(\d+)\.zip' + re.escape(INDEX_SUFFIX) + '$')
+    found = []
+    for name in os.listdir(output_folder):
+        match = pattern.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(output_folder, name)))
+    return [path for _, path in sorted(found)]
+
+
+def index_batch_ids(output_folder):
+    """output_folder中有索引的批次：有批次索引，或只有各压缩包的旁路索引(如监视模式)"""
+    volume_pattern = re.compile(r'(.+)_\d+\.zip' + re.escape(INDEX_SUFFIX) + '$')
+    found = set()
+    for name in os.listdir(output_folder):
+        if not name.endswith(INDEX_SUFFIX):
+            continue
+        match = volume_pattern.match(name)
+        if match:
+            found.add(match.group(1))
+        elif not name.endswith('.zip' + INDEX_SUFFIX):
+            found.add(name[:-len(INDEX_SUFFIX)])
+    return sorted(found)
+
+
+def build_batch_index(output_folder, batch_id):
+    """
+    把批次各压缩包的旁路索引合并为批次索引 {output_folder}/{batch_id}.idx.json
+
+    批次索引的members为 {压缩包内名称: 成员索引}，成员索引中另有volume字段为所在压缩包名；
+    同名成员出现在多个压缩包中时(如重新打包)以序号大的压缩包为准
+
+    Returns:
+        批次索引的dict
+    """
+    volumes = {}
+    members = {}
+    for path in volume_index_paths(output_folder, batch_id):
+        index = read_index(path)
+        volumes[index['volume']] = {'size': index['size'], 'sha256': index['sha256']}
+        for entry in index['members']:
+            members[entry['arcname']] = dict(entry, volume=index['volume'])
+    batch_index = {'batch_id': batch_id, 'volumes': volumes, 'members': members}
+    index_path = os.path.join(output_folder, batch_id + INDEX_SUFFIX)
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(batch_index, f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    logger.info(f"批次索引已更新: {index_path} ({len(volumes)} 个压缩包, {len(members)} 个成员)")
+    return batch_index
+
+
+def load_batch_index(output_folder, batch_id):
+    """
+    读取批次索引，不存在或比某个压缩包的旁路索引旧(如监视模式下批次还在追加压缩包)时重新合并
+    """
+    index_path = os.path.join(output_folder, batch_id + INDEX_SUFFIX)
+    try:
+        built_at = os.path.getmtime(index_path)
+    except FileNotFoundError:
+        return build_batch_index(output_folder, batch_id)
+    if any(os.path.getmtime(p) > built_at for p in volume_index_paths(output_folder, batch_id)):
+        return build_batch_index(output_folder, batch_id)
+    return read_index(index_path)
+